@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (c) 2017, Christoph Metzner
+# Distributed under the (new) BSD License.
+#
+# Contributors: Christoph Metzner (c.metzner@herts.ac.uk)
+# -----------------------------------------------------------------------------
+# An adaptive, event-aware integrator for networks of theta neurons.
+#
+# The network (in the stacked description of kernel.integrate()) is integrated
+# with the embedded Runge-Kutta 3(2) pair of Bogacki and Shampine. The step
+# size is adapted to keep the local error below a tolerance, so that the
+# sharply peaked synaptic activation exp(-eta*(1+cos(theta))) around spikes is
+# resolved with small steps while the quiescent phases between gamma cycles are
+# crossed with large ones. The background noise is evaluated exactly: every
+# noise spike is an event that ends a step (the noise is continuous but not
+# smooth there), and between events the noise of a cell is the difference of
+# two decaying exponentials. The solution is resampled onto the fixed time
+# grid of the Euler scheme (k*dt) with cubic Hermite interpolation and
+# recorded with the conventions of the model classes (the MEG signal at time
+# point k is the one the Euler scheme uses to advance from k-1 to k).
+# -----------------------------------------------------------------------------
+import copy
+
+import numpy as np
+
+
+def _hermite(y0,f0,y1,f1,h,x):
+    '''Evaluates the cubic Hermite interpolant of a step at the relative
+    positions x (0<=x<=1); returns an array of shape (len(y0),len(x)).'''
+    x2 = x*x
+    x3 = x2*x
+    h00 = 2*x3-3*x2+1
+    h10 = x3-2*x2+x
+    h01 = -2*x3+3*x2
+    h11 = x3-x2
+    return (np.outer(y0,h00)+np.outer(h*f0,h10)+np.outer(y1,h01)
+            +np.outer(h*f1,h11))
+
+
+def integrate(network,spike_trains,n_steps,meg=None,callback=None,
+              tolerance=1e-4,max_step=1.0,chunk=1024):
+    '''Integrates one trial of a network with adaptive step sizes.
+    Parameters
+    -----------------
+    network      : dict
+        The stacked description of the network (see kernel.integrate())
+        including the noise parameters 'A' and 'tau_noise' (the decay time
+        of the noise EPSPs); time-dependent currents 'B' are piecewise constant on the grid, the
+        steps are then limited to the grid intervals.
+    spike_trains : list
+        The noise spike trains of all cells (in the order of the network).
+    n_steps      : int
+        The number of time points of the output grid (k*dt).
+    meg          : ndarray
+        1D array the MEG signal is written to (optional).
+    callback     : callable
+        Called as callback(t,theta) with the phases of consecutive blocks of
+        output time points (see kernel.integrate()).
+    tolerance    : float
+        The maximal local error per step of the phases (in rad) and the
+        gating variables.
+    max_step     : float
+        The maximal step size.
+    chunk        : int
+        The number of output time points passed to the callback at once.
+    Returns
+    -----------------
+    ndarray,dict
+        The MEG signal and statistics of the integration: the number of
+        accepted and rejected steps, of evaluations of the right-hand side
+        and of noise events, and the sum of the local error estimates of
+        all accepted steps ('error_estimate', a first-order estimate of the
+        global error).
+    '''
+    dt = network['dt']
+    eta = network['eta']
+    tau_R = network['tau_R']
+    tau_d = network['tau_d']
+    b_drive = network['b_drive']
+    tau_s = np.asarray(network['tau_s'],dtype=float)
+    G = np.asarray(network['G'],dtype=float)
+    g_d = np.asarray(network['g_d'],dtype=float)
+    m = np.asarray(network['m'],dtype=float)
+    B = np.atleast_2d(np.asarray(network['B'],dtype=float))
+    varying = B.shape[0] > 1
+    n = len(tau_s)
+    tau_noise = network['tau_noise']
+    scale = network['A']/(tau_noise-tau_R)
+
+    # the noise spikes in time order
+    counts = [len(train) for train in spike_trains]
+    cells = np.repeat(np.arange(n),counts)
+    times = np.concatenate([np.asarray(train,dtype=float)
+                            for train in spike_trains]) if n else np.zeros(0)
+    order = np.argsort(times,kind='stable')
+    times = times[order]
+    cells = cells[order]
+
+    if meg is None:
+        meg = np.zeros((n_steps,))
+    # the MEG signal of time points 0 and 1 (gating variables at rest)
+    meg[:2] = 0.0
+    buffer = np.zeros((n,chunk))
+    t_end = (n_steps-1)*dt
+
+    # noise states: sums of exp(-(t-tn)/tau) over the spikes tn<=t0
+    x_ex = np.zeros((n,))
+    x_R = np.zeros((n,))
+    stats = {'steps' : 0, 'rejected' : 0, 'evaluations' : 0,
+             'noise_events' : 0, 'error_estimate' : 0.0}
+
+    def derivative(t,y,t0,b):
+        theta = y[:n]
+        s = y[n:2*n]
+        drive,s_d = y[2*n],y[2*n+1]
+        lag = t-t0
+        N = scale*(x_ex*np.exp(-lag/tau_noise)-x_R*np.exp(-lag/tau_R))
+        S = np.dot(s,G)+g_d*s_d
+        cos_theta = np.cos(theta)
+        cos_d = np.cos(drive)
+        f = np.empty_like(y)
+        f[:n] = (1-cos_theta)+(b+S+N)*(1+cos_theta)
+        f[n:2*n] = (-1.0*(s/tau_s)
+                    +np.exp(-1.0*eta*(1+cos_theta))*((1.0-s)/tau_R))
+        f[2*n] = (1-cos_d)+b_drive*(1+cos_d)
+        f[2*n+1] = (-1.0*(s_d/tau_d)
+                    +np.exp(-1.0*eta*(1+cos_d))*((1.0-s_d)/tau_R))
+        stats['evaluations'] = stats['evaluations']+1
+        return f
+
+    def b_at(t0):
+        # the current applied while advancing from time point k-1 to k is
+        # B[k] (as in the Euler scheme)
+        if not varying:
+            return B[0]
+        k = int(np.floor(t0/dt+1e-9))+1
+        return B[min(k,B.shape[0]-1)]
+
+    y = np.zeros((2*n+2,))
+    t0 = 0.0
+    h = dt
+    event = 0
+    k_next = 1              # next output time point
+    b = b_at(t0)
+    f0 = derivative(t0,y,t0,b)
+    while k_next < n_steps:
+        # add the noise spikes at t0
+        while event < len(times) and times[event] <= t0:
+            x_ex[cells[event]] = x_ex[cells[event]]+1.0
+            x_R[cells[event]] = x_R[cells[event]]+1.0
+            event = event+1
+            stats['noise_events'] = stats['noise_events']+1
+
+        # the step ends at the next event
+        stop = t_end
+        if event < len(times):
+            stop = min(stop,times[event])
+        if varying:
+            stop = min(stop,(np.floor(t0/dt+1e-9)+1)*dt)
+        h = min(h,max_step,stop-t0)
+        if stop-t0-h < 1e-12:
+            h = stop-t0
+        # end exactly at the event (t0+h might differ in the last bit)
+        t1 = stop if h == stop-t0 else t0+h
+
+        # Bogacki-Shampine 3(2)
+        k2 = derivative(t0+0.5*h,y+0.5*h*f0,t0,b)
+        k3 = derivative(t0+0.75*h,y+0.75*h*k2,t0,b)
+        y1 = y+h*((2.0/9.0)*f0+(1.0/3.0)*k2+(4.0/9.0)*k3)
+        f1 = derivative(t0+h,y1,t0,b)
+        error = h*((-5.0/72.0)*f0+(1.0/12.0)*k2+(1.0/9.0)*k3-(1.0/8.0)*f1)
+        norm = np.max(np.abs(error))/tolerance
+        if norm > 1.0:
+            stats['rejected'] = stats['rejected']+1
+            h = h*max(0.2,0.9*norm**(-1.0/3.0))
+            continue
+
+        # resample onto the output grid
+        k_last = min(int(np.floor(t1/dt+1e-9)),n_steps-1)
+        if k_last >= k_next:
+            ks = np.arange(k_next,k_last+1)
+            values = _hermite(y,f0,y1,f1,h,(ks*dt-t0)/h)
+            # the MEG signal of time point k is the one of time point k-1
+            meg_ks = ks+1 < n_steps
+            meg[ks[meg_ks]+1] = np.dot(m,values[n:2*n,meg_ks])
+            for j,k in enumerate(ks):
+                buffer[:,(k-1) % chunk] = values[:n,j]
+                if k % chunk == 0 or k == n_steps-1:
+                    start = k-(k-1) % chunk
+                    if callback is not None:
+                        callback(start,buffer[:,:k-start+1])
+            k_next = k_last+1
+
+        stats['steps'] = stats['steps']+1
+        stats['error_estimate'] = stats['error_estimate']+norm*tolerance
+        # the noise states at the end of the step
+        x_ex = x_ex*np.exp(-h/tau_noise)
+        x_R = x_R*np.exp(-h/tau_R)
+        t0 = t1
+        y = y1
+        h = h*min(5.0,0.9*max(norm,1e-10)**(-1.0/3.0))
+        if varying:
+            b = b_at(t0)
+            f0 = derivative(t0,y,t0,b)
+        else:
+            f0 = f1
+    return meg,stats
+
+
+def _align(fine,refinement,n):
+    '''Returns the MEG signal of a run with the time step dt/refinement at
+    the time points of the time step dt (same recording convention).'''
+    aligned = np.zeros((n,))
+    # time point k records the gating variables of time point k-1
+    aligned[1:] = fine[1::refinement][:n-1]
+    return aligned
+
+
+def errorReport(model,time=500.0,refinement=4):
+    '''Compares the adaptive integrator with the Euler reference.
+
+    Besides the difference between the two schemes, the discretisation
+    error of the Euler reference is estimated from a run with the time step
+    dt/refinement, so that the differences can be attributed.
+    Parameters
+    -----------------
+    model      : object
+        A simpleModel or simpleModelFsLts instance (its integrator and
+        tolerance are used for the adaptive run).
+    time       : float
+        The duration of the simulation.
+    refinement : int
+        The refinement of the time step of the second Euler run.
+    Returns
+    -----------------
+    dict
+        For the pairs 'adaptive-euler', 'euler-refined' (the error estimate
+        of the Euler scheme) and 'adaptive-refined' the maximal absolute and
+        the relative (L2) difference of the MEG signals and the relative
+        (L2) difference of their power spectral densities (calculatePSD()),
+        the number of time steps of both schemes ('euler_steps',
+        'adaptive_steps') and the statistics of the adaptive run.
+    '''
+    runs = {}
+    for name,integrator,dt in (('euler','euler',model.dt),
+                               ('refined','euler',model.dt/refinement),
+                               ('adaptive','adaptive',model.dt)):
+        trial = copy.copy(model)
+        trial.integrator = integrator
+        trial.dt = dt
+        runs[name] = trial.run(time,record=('meg',))[0]
+        if integrator == 'adaptive':
+            stats = trial.integration_stats
+            stats = stats[0] if isinstance(stats,list) else stats
+    n = min(len(runs['euler']),len(runs['adaptive']),
+            len(runs['refined'][1::refinement])+1)
+    megs = {'euler' : runs['euler'][:n], 'adaptive' : runs['adaptive'][:n],
+            'refined' : _align(runs['refined'],refinement,n)}
+
+    report = {'euler_steps' : n-1, 'adaptive_steps' : stats['steps'],
+              'stats' : stats}
+    for a,b in (('adaptive','euler'),('euler','refined'),
+                ('adaptive','refined')):
+        pxx_a = model.calculatePSD(megs[a],time)[0]
+        pxx_b = model.calculatePSD(megs[b],time)[0]
+        report[a+'-'+b] = {
+            'max_meg' : np.max(np.abs(megs[a]-megs[b])),
+            'relative_meg' : np.linalg.norm(megs[a]-megs[b])
+                             /np.linalg.norm(megs[b]),
+            'relative_psd' : np.linalg.norm(pxx_a-pxx_b)/np.linalg.norm(pxx_b)}
+    return report
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+# ------------------------------------------------------------------------------
+# Copyright (c) 2020, Christoph Metzner
+# Distributed under the (new) BSD License.
+#
+# Contributors: Christoph Metzner (cmetzner@ni.tu-berlin.de)
+# ------------------------------------------------------------------------------
+# Streaming averages of the trials of an exploration.
+#
+# ------------------------------------------------------------------------------
+import numpy as np
+
+from cache import atomicWrite
+from spectral import analysisTransient, powerSpectrum
+
+
+class _runningMoments(object):
+    '''Running mean and sum of squared deviations (Welford/Chan).'''
+
+    def __init__(self,n):
+        self.count = 0
+        self.mean = np.zeros((n,))
+        self.m2 = np.zeros((n,))
+
+    def add(self,data):
+        '''Adds a (trials,n) batch of samples.'''
+        n = len(data)
+        if n == 0:
+            return
+        mean = np.mean(data,axis=0)
+        m2 = np.sum((data-mean)**2,axis=0)
+        total = self.count+n
+        delta = mean-self.mean
+        self.mean = self.mean+delta*(float(n)/total)
+        self.m2 = self.m2+m2+delta**2*(float(self.count)*n/total)
+        self.count = total
+
+    def variance(self):
+        '''Returns the sample variance (NaN for less than two samples).'''
+        if self.count < 2:
+            return np.full(self.mean.shape,np.nan)
+        return self.m2/(self.count-1)
+
+
+class trialAverager(object):
+    '''Accumulates the MEG signals of the trials of an exploration.
+
+    For every group of trials (condition,g_de,frequency) the running mean
+    and variance of the MEG signals and of their power spectral densities
+    are kept, so that the memory does not depend on the number of seeds.
+    The averages can be emitted at any time, e.g. while a sweep is still
+    running. Every seed is counted once per group, so that trials passed
+    again (e.g. from a cache when a sweep is resumed) are ignored.
+
+    Attributes
+    -----------------
+    dt       : float
+        The time step of the signals.
+    sim_time : float
+        The duration of the simulations.
+    warmup   : float
+        The duration of the warm-up preceding the signals (see
+        simpleModel.runBatch()); signals after a warm-up are analysed
+        without a transient cut (see spectral.analysisTransient()).
+    '''
+
+    def __init__(self,dt,sim_time,warmup=0.0):
+        self.dt = dt
+        self.sim_time = sim_time
+        self.warmup = warmup
+        self.transient = analysisTransient(warmup)
+        self.freqs = None
+        self.groups = {}
+
+    def add(self,key,meg):
+        '''Adds the MEG signal of a trial.
+        Parameters
+        -----------------
+        key : tuple
+            The (condition,g_de,frequency,seed) of the trial.
+        meg : ndarray
+            1D array containing the MEG signal.
+        '''
+        self.addMany([key],[meg])
+
+    def addMany(self,keys,megs):
+        '''Adds the MEG signals of several trials.'''
+        batches = {}
+        for key,meg in zip(keys,megs):
+            condition,g_de,frequency,seed = key
+            group = (condition,float(g_de),float(frequency))
+            batches.setdefault(group,{})[int(seed)] = np.asarray(meg,
+                                                                 dtype=float)
+        for group,trials in batches.items():
+            if group not in self.groups:
+                n_time = len(next(iter(trials.values())))
+                self.groups[group] = {'seeds' : set(),
+                                      'meg' : _runningMoments(n_time),
+                                      'psd' : None}
+            entry = self.groups[group]
+            new = [seed for seed in trials if seed not in entry['seeds']]
+            if not new:
+                continue
+            megs = np.array([trials[seed] for seed in new])
+            psds,self.freqs = powerSpectrum(megs,self.dt,self.sim_time,
+                                            self.transient)
+            if entry['psd'] is None:
+                entry['psd'] = _runningMoments(len(self.freqs))
+            entry['meg'].add(megs)
+            entry['psd'].add(psds)
+            entry['seeds'].update(new)
+
+    def __call__(self,key,result):
+        '''Adds the MEG signal of a trial (usable as a runSweep()
+        callback).'''
+        self.add(key,result[0])
+
+    def keys(self):
+        '''Returns the (condition,g_de,frequency) groups.'''
+        return sorted(self.groups)
+
+    def count(self,condition,g_de,frequency):
+        '''Returns the number of trials of a group.'''
+        return self._group(condition,g_de,frequency)['meg'].count
+
+    def _group(self,condition,g_de,frequency):
+        group = (condition,float(g_de),float(frequency))
+        if group not in self.groups:
+            raise KeyError('no trials of %s' % (group,))
+        return self.groups[group]
+
+    def mean(self,condition,g_de,frequency):
+        '''Returns the average MEG signal of a group.'''
+        return self._group(condition,g_de,frequency)['meg'].mean.copy()
+
+    def variance(self,condition,g_de,frequency):
+        '''Returns the (sample) variance of the MEG signals of a group.'''
+        return self._group(condition,g_de,frequency)['meg'].variance()
+
+    def averagePSD(self,condition,g_de,frequency):
+        '''Returns the PSD of the average MEG signal of a group and the
+        according frequencies (the quantity of average.py).'''
+        return powerSpectrum(self.mean(condition,g_de,frequency),self.dt,
+                             self.sim_time,self.transient)
+
+    def meanPSD(self,condition,g_de,frequency):
+        '''Returns the mean and the (sample) variance of the PSDs of the
+        single trials of a group and the according frequencies.'''
+        psd = self._group(condition,g_de,frequency)['psd']
+        return psd.mean.copy(),psd.variance(),self.freqs
+
+    def save(self,filename):
+        '''Stores the accumulators (atomically) in a .npz file.'''
+        arrays = {'dt' : self.dt, 'sim_time' : self.sim_time,
+                  'warmup' : self.warmup}
+        if self.freqs is not None:
+            arrays['freqs'] = self.freqs
+        for i,(group,entry) in enumerate(sorted(self.groups.items())):
+            prefix = 'group%d_' % i
+            arrays[prefix+'key'] = np.array([str(v) for v in group])
+            arrays[prefix+'seeds'] = np.array(sorted(entry['seeds']))
+            for name in ('meg','psd'):
+                moments = entry[name]
+                arrays[prefix+name+'_count'] = moments.count
+                arrays[prefix+name+'_mean'] = moments.mean
+                arrays[prefix+name+'_m2'] = moments.m2
+        atomicWrite(filename,lambda f: np.savez(f,**arrays))
+
+    @classmethod
+    def load(cls,filename):
+        '''Restores an averager stored with save().'''
+        with np.load(filename) as data:
+            warmup = float(data['warmup']) if 'warmup' in data.files else 0.0
+            averager = cls(float(data['dt']),float(data['sim_time']),warmup)
+            if 'freqs' in data.files:
+                averager.freqs = data['freqs']
+            i = 0
+            while 'group%d_key' % i in data.files:
+                prefix = 'group%d_' % i
+                condition,g_de,frequency = data[prefix+'key']
+                entry = {'seeds' : set(int(s) for s in data[prefix+'seeds'])}
+                for name in ('meg','psd'):
+                    moments = _runningMoments(0)
+                    moments.count = int(data[prefix+name+'_count'])
+                    moments.mean = data[prefix+name+'_mean']
+                    moments.m2 = data[prefix+name+'_m2']
+                    entry[name] = moments
+                averager.groups[(str(condition),float(g_de),
+                                 float(frequency))] = entry
+                i = i+1
+        return averager
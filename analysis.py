@@ -1,33 +1,23 @@
 import numpy as np
 import matplotlib.pyplot as plt
-import matplotlib.mlab as mlab
+
+import spectral
+from spikes import spikeTimes, spikeTrains
 
 
 def getSingleSpikeTimes(neuron,dt):
-	spike_times = []
-	#spike_flag = 0
-	old = 0.0
-	for i,n in enumerate(neuron):
-		
-		# if theta passes (2l-1)*pi, l integer, with dtheta/dt>0 then the neuron spikes (see Boergers and Kopell, 2003)
-		if (n%(2*np.pi))>np.pi and (old%(2*np.pi))<np.pi:
-			#if spike_flag == 0:
-			spike_time = i*dt
-			spike_times.append(spike_time)
-			#	spike_flag = 1
-		#else:
-		#	spike_flag = 0
-		old = n
-
-	return spike_times
+	# if theta passes (2l-1)*pi, l integer, with dtheta/dt>0 then the neuron spikes (see Boergers and Kopell, 2003)
+	return spikeTimes(neuron,dt)[1].tolist()
 
 def getSpikeTimes(data,dt):
-	nx,ny = data.shape
-	spike_times = [None]*nx
-	for i in range(nx):
-		spike_times[i] = getSingleSpikeTimes(data[i,:],dt)
+	# memory-mapped data (see loadTraces) is processed in blocks of cells
+	# instead of being loaded as a whole
+	return spikeTrains(*spikeTimes(data,dt))
+
 
-	return spike_times
+def loadTraces(filename):
+	# opens stored traces memory-mapped (read-only)
+	return np.load(filename,mmap_mode='r')
 
 
 def rasterPlot(spike_times,sim_time):
@@ -58,7 +48,7 @@ def plotMEGTrace(meg,sim_time,dt,save,filename):
  
 	if save:
             filenamepng = filename+'-MEG.png'
-            #print filenamepng
+            #print(filenamepng)
             plt.savefig(filenamepng,dpi=600)
         
 
@@ -73,27 +63,8 @@ def calcAverageFiringRate(spike_times,sim_time):
 	return avg_firing_rates
 
 def calcPowerSpectrum(meg,dt,sim_time):
-	# fourier sample rate
-  	fs = 1. / dt	
-
-	tn = np.linspace(0,sim_time,int(sim_time/dt)+1)
-
-  	npts = len(meg)
- 	startpt = int(0.2*fs)
-
-  	if (npts - startpt)%2!=0:
-      		startpt = startpt + 1
-
-  	meg = meg[startpt:]
-  	tn = tn[startpt:]
-  	nfft = len(tn)
-  	#overlap = nfft//2
-
-
-  	pxx,freqs=mlab.psd(meg,NFFT=nfft,Fs=fs,noverlap=0,window=mlab.window_none)
-  	pxx[0] = 0.0
-	
-	return pxx,freqs
+	# the periodogram after the transient (see spectral.transientCut())
+	return spectral.powerSpectrum(meg,dt,sim_time=sim_time)
 
 
 def plotPowerSpectrum(pxx,freqs,save,filename):
@@ -105,7 +76,7 @@ def plotPowerSpectrum(pxx,freqs,save,filename):
     ax.axis(xmin=0, xmax=50)
     if save:
             filenamepng = filename+'-PSD.png'
-            print filenamepng
+            print(filenamepng)
             plt.savefig(filenamepng,dpi=600)
         
      #plt.show()
@@ -121,11 +92,11 @@ if __name__ == "__main__":
 	plotNeuron(data,5,sim_time,dt)
 
 	spike_times = getSpikeTimes(data,dt)
-	print spike_times[5]
-	print len(spike_times[5])
+	print(spike_times[5])
+	print(len(spike_times[5]))
 	#rasterPlot(spike_times,sim_time)
 	#avg = calcAverageFiringRate(spike_times,sim_time)
-	#print np.mean(avg)
+	#print(np.mean(avg))
 	#pxx,freqs = calcPowerSpectrum(meg,dt)
 	#plotPowerSpectrum(pxx,freqs)
 	
@@ -18,29 +18,9 @@
 
 
 import numpy as np
-import matplotlib.mlab as mlab
 
-
-def calc_power_spectrum(meg, dt, sim_time):
-    # fourier sample rate
-    fs = 1. / dt
-
-    tn = np.linspace(0, sim_time, int(sim_time / dt) + 1)
-
-    npts = len(meg)
-    startpt = int(0.2 * fs)
-
-    if (npts - startpt) % 2 != 0:
-        startpt = startpt + 1
-
-    meg = meg[startpt:]
-    tn = tn[startpt:]
-    nfft = len(tn)
-
-    pxx, freqs = mlab.psd(meg, NFFT=nfft, Fs=fs, noverlap=0, window=mlab.window_none)
-    pxx[0] = 0.0
-
-    return pxx, freqs
+from aggregate import trialAverager
+from store import trialStore
 
 
 s = 2**13
@@ -50,23 +30,24 @@ dt = float(time)/float(s)
 seeds = np.load('Seeds.npy')
 
 g_de = 0.275
+condition = 'g_and_tau_inh'
 filename = 'drive_0275_g_and_tau_inh'  # 'drive_0225_control'
-directory = 'Exploration/Input_Strength_0275/G_and_Tau_Inh/'  # directory where data is stored
 frequencies = [40.0, 30.0, 20.0]
 
-megs = np.zeros((len(seeds), s))
+# the trials of the exploration (trials stored as single files by older
+# versions of run_exploration.py can be imported with
+# store.importExploration('Exploration', store))
+store = trialStore('Exploration/store', dt=dt)
+averager = trialAverager(dt, time)
 
 for f in frequencies:
     print(f)
-    for i, ss in enumerate(seeds):
-        print(i)
-        filename2 = filename + "drive_strength_" + str(g_de) +"_drive_frequency_" + str(f) + "_seed_" + \
-                    str(ss)+'-MEG.npy'
-        megs[i, :] = np.load(directory+filename2)
+    megs = store.read(condition=condition, g_de=g_de, frequency=f, seed=seeds)
+    averager.addMany([(condition, g_de, f, seed) for seed in seeds], megs)
 
-    avg_meg = np.mean(megs, axis=0)
-    avg_psd, freqs = calc_power_spectrum(avg_meg, dt, time)
+    avg_meg = averager.mean(condition, g_de, f)
+    avg_psd, freqs = averager.averagePSD(condition, g_de, f)
 
     np.save('Exploration/Input_Strength_0275/'+filename+'_drive_frequency_' + str(f) +'-MEG.npy', avg_meg)
     np.save('Exploration/Input_Strength_0275/'+filename+'_drive_frequency_' + str(f) +'-PSD.npy', avg_psd)
-    np.save('Exploration/freqs.npy', freqs)
\ No newline at end of file
+    np.save('Exploration/freqs.npy', freqs)
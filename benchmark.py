@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+# ------------------------------------------------------------------------------
+# Copyright (c) 2020, Christoph Metzner
+# Distributed under the (new) BSD License.
+#
+# Contributors: Christoph Metzner (cmetzner@ni.tu-berlin.de)
+# ------------------------------------------------------------------------------
+# A benchmark suite for the simulation throughput and memory of the models.
+#
+# Every case (model, backend, network size, simulation time, time step) runs in
+# a fresh worker process, so that the peak resident set size of a case is not
+# inflated by the cases before it. The results are stored as JSON and can be
+# compared against a baseline to catch regressions. The startup time of a worker
+# (importing the models in a fresh interpreter) is tracked as well.
+#
+# ------------------------------------------------------------------------------
+import importlib.metadata
+import itertools
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time as timer
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+
+import kernel
+from simple_model_class import simpleModel
+from simple_model_fs_lts_class import simpleModelFsLts
+
+
+# the benchmarked models and the population sizes at scale 1
+MODELS = {'simpleModel' : (simpleModel,{'n_ex' : 20, 'n_inh' : 10}),
+          'simpleModelFsLts' : (simpleModelFsLts,{'n_ex' : 20, 'n_fs' : 10,
+                                                  'n_som' : 10})}
+
+# the fields identifying a case (see compare())
+CASE_FIELDS = ('model','backend','scale','time','dt')
+
+
+def _peakRSS():
+    '''Returns the peak resident set size of the process (in MB).'''
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak/1024.0**2 if sys.platform == 'darwin' else peak/1024.0
+
+
+def _runCase(case,repeat,allocations):
+    '''Runs a single case (in a worker process) and returns its measures.'''
+    model_class,sizes = MODELS[case['model']]
+    params = {name : n*case['scale'] for name,n in sizes.items()}
+    model = model_class(drive_frequency=40.0,dt=case['dt'],
+                        backend=case['backend'],**params)
+    # warm up (e.g. compile the kernel or load it from the numba cache)
+    model.run(10*case['dt'],record=('meg',))
+
+    rss_before = _peakRSS()
+    wall_times = []
+    for i in range(repeat):
+        start = timer.perf_counter()
+        meg = model.run(case['time'])[0]
+        wall_times.append(timer.perf_counter()-start)
+    result = dict(case)
+    result['n_cells'] = sum(params.values())
+    result['n_steps'] = len(meg)
+    result['wall_time'] = min(wall_times)
+    result['wall_times'] = wall_times
+    result['steps_per_second'] = result['n_steps']/result['wall_time']
+    result['peak_rss_mb'] = _peakRSS()
+    result['rss_increase_mb'] = result['peak_rss_mb']-rss_before
+
+    if allocations:
+        # an additional (slower) run with allocation tracing
+        blocks = sys.getallocatedblocks()
+        tracemalloc.start()
+        outputs = model.run(case['time'])
+        current,peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del outputs
+        result['traced_peak_mb'] = peak/1024.0**2
+        result['allocated_blocks'] = sys.getallocatedblocks()-blocks
+    return result
+
+
+# the modules imported by a sweep worker
+WORKER_MODULES = ('simple_model_class','simple_model_fs_lts_class')
+
+# modules that should not be loaded by importing the models
+HEAVY_MODULES = ('matplotlib','numba')
+
+_STARTUP = '''
+import sys, time
+start = time.perf_counter()
+import %s
+elapsed = time.perf_counter()-start
+print(elapsed, ','.join(m for m in %r if m in sys.modules))
+'''
+
+
+def startupTime(modules=WORKER_MODULES,repeat=5):
+    '''Measures the time to import modules in a fresh interpreter (the
+    startup of a worker process).
+    Parameters
+    -----------------
+    modules : tuple
+        The imported modules.
+    repeat  : int
+        The number of interpreters started (the fastest one is reported).
+    Returns
+    -----------------
+    dict
+        The import time ('import_time', in s), the wall time of the whole
+        interpreter process ('process_time', in s) and the heavy modules
+        (see HEAVY_MODULES) loaded by the import ('loaded').
+    '''
+    code = _STARTUP % (', '.join(modules),HEAVY_MODULES)
+    directory = os.path.dirname(os.path.abspath(__file__))
+    import_times = []
+    process_times = []
+    for i in range(repeat):
+        start = timer.perf_counter()
+        output = subprocess.check_output([sys.executable,'-c',code],
+                                         cwd=directory)
+        process_times.append(timer.perf_counter()-start)
+        elapsed,loaded = output.decode().strip().partition(' ')[::2]
+        import_times.append(float(elapsed))
+    return {'modules' : list(modules), 'import_time' : min(import_times),
+            'process_time' : min(process_times),
+            'loaded' : [name for name in loaded.split(',') if name]}
+
+
+def environment():
+    '''Returns a description of the machine and the software versions.'''
+    try:
+        commit = subprocess.check_output(
+            ['git','rev-parse','HEAD'],cwd=os.path.dirname(
+                os.path.abspath(__file__)),stderr=subprocess.DEVNULL)
+        commit = commit.decode().strip()
+    except (OSError,subprocess.CalledProcessError):
+        commit = None
+    return {'python' : platform.python_version(), 'numpy' : np.__version__,
+            'numba' : importlib.metadata.version('numba')
+            if kernel.available() else None,
+            'machine' : platform.machine(), 'processor' : platform.processor(),
+            'system' : platform.platform(), 'cpu_count' : os.cpu_count(),
+            'commit' : commit,
+            'date' : timer.strftime('%Y-%m-%d %H:%M:%S')}
+
+
+def benchmarkCases(models=('simpleModel','simpleModelFsLts'),
+                   backends=('numpy',),scales=(1,2,4),times=(100.0,500.0),
+                   dts=(500.0/2**13,)):
+    '''Returns the cases of a benchmark grid.
+    Parameters
+    -----------------
+    models   : tuple
+        The names of the models (see MODELS).
+    backends : tuple
+        The backends ('numpy' and/or 'numba').
+    scales   : tuple
+        The factors multiplying the population sizes of the default network.
+    times    : tuple
+        The simulation times.
+    dts      : tuple
+        The time steps (the default is the one of the exploration,
+        500/2**13).
+    Returns
+    -----------------
+    list
+        A list of dicts describing the cases.
+    '''
+    return [dict(zip(CASE_FIELDS,values)) for values in
+            itertools.product(models,backends,scales,times,dts)]
+
+
+def runBenchmark(cases,repeat=3,allocations=True,verbose=1):
+    '''Runs the cases of a benchmark, each in a fresh worker process.
+    Parameters
+    -----------------
+    cases       : list
+        The cases (see benchmarkCases()).
+    repeat      : int
+        The number of timed runs per case (the fastest one is reported).
+    allocations : bool
+        Whether to trace the memory allocations in an additional run.
+    verbose     : int
+        Whether to print the results of the cases.
+    Returns
+    -----------------
+    dict
+        The environment, the startup time of a worker (see startupTime())
+        and the results of the cases: wall time (in s),
+        time steps per second, peak resident set size of the worker and its
+        increase during the timed runs (in MB) and, with allocations, the
+        peak traced memory (in MB) and the number of memory blocks still
+        allocated after a run.
+    '''
+    startup = startupTime()
+    if verbose:
+        print('worker startup: import %(import_time).3f s, process '
+              '%(process_time).3f s, loaded %(loaded)s' % startup)
+    results = []
+    for case in cases:
+        if case['backend'] == 'numba' and not kernel.available():
+            if verbose:
+                print('skipping %s (numba is not installed)' % case)
+            continue
+        with ProcessPoolExecutor(max_workers=1,
+                                 mp_context=get_context('spawn')) as pool:
+            result = pool.submit(_runCase,case,repeat,allocations).result()
+        results.append(result)
+        if verbose:
+            print('%(model)s %(backend)s scale %(scale)d, %(time).0f ms, '
+                  'dt %(dt).4f: %(wall_time).3f s, '
+                  '%(steps_per_second).0f steps/s, '
+                  'peak RSS %(peak_rss_mb).1f MB' % result)
+    return {'environment' : environment(), 'startup' : startup,
+            'results' : results}
+
+
+def saveResults(results,filename):
+    '''Stores the results of a benchmark as JSON.'''
+    directory = os.path.dirname(filename)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    with open(filename,'w') as f:
+        json.dump(results,f,indent=1)
+
+
+def loadResults(filename):
+    '''Loads the results of a benchmark stored with saveResults().'''
+    with open(filename) as f:
+        return json.load(f)
+
+
+def compare(results,baseline,tolerance=0.2,
+            measures=('wall_time','peak_rss_mb')):
+    '''Compares the results of a benchmark with a baseline.
+    Parameters
+    -----------------
+    results   : dict
+        The results of runBenchmark().
+    baseline  : dict
+        The results of an earlier benchmark (e.g. loaded with
+        loadResults()).
+    tolerance : float
+        The relative increase of a measure regarded as a regression.
+    measures  : tuple
+        The compared measures (larger is worse).
+    Returns
+    -----------------
+    list
+        A list of (case,measure,baseline value,new value) of all
+        regressions (the startup is reported as the case 'startup'); cases
+        missing in the baseline are ignored.
+    '''
+    def key(result):
+        return tuple(result[field] for field in CASE_FIELDS)
+
+    reference = {key(result) : result for result in baseline['results']}
+    regressions = []
+    if 'startup' in results and 'startup' in baseline:
+        old = baseline['startup']['import_time']
+        new = results['startup']['import_time']
+        if new > (1.0+tolerance)*old:
+            regressions.append(('startup','import_time',old,new))
+    for result in results['results']:
+        old = reference.get(key(result))
+        if old is None:
+            continue
+        for measure in measures:
+            if measure in old and measure in result and \
+                    result[measure] > (1.0+tolerance)*old[measure]:
+                regressions.append((dict(zip(CASE_FIELDS,key(result))),
+                                    measure,old[measure],result[measure]))
+    return regressions
+
+
+if __name__ == "__main__":
+
+    # baseline of the current machine (compared against if it exists)
+    baseline = 'Benchmarks/baseline.json'
+
+    cases = benchmarkCases(backends=('numpy','numba'))
+    results = runBenchmark(cases)
+    saveResults(results,'Benchmarks/%s.json'
+                % timer.strftime('%Y%m%d-%H%M%S'))
+
+    if os.path.exists(baseline):
+        for case,measure,old,new in compare(results,loadResults(baseline)):
+            print('regression: %s %s %.3f -> %.3f' % (case,measure,old,new))
+    else:
+        saveResults(results,baseline)
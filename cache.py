@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+# ------------------------------------------------------------------------------
+# Copyright (c) 2020, Christoph Metzner
+# Distributed under the (new) BSD License.
+#
+# Contributors: Christoph Metzner (cmetzner@ni.tu-berlin.de)
+# ------------------------------------------------------------------------------
+# A content-addressed cache for the results of single trials of the models.
+#
+# ------------------------------------------------------------------------------
+import hashlib
+import json
+import numbers
+import os
+import tempfile
+import time as timer
+
+import numpy as np
+
+
+# attributes of the models that do not influence the simulation results
+# (including the ones that are set by a run)
+IGNORED_ATTRIBUTES = ('filename','directory','spike_times','profile_report',
+                      'integration_stats')
+
+
+def atomicWrite(filename,write):
+    '''Writes a file atomically.
+
+    The data is written to a temporary file in the same directory, which
+    then replaces the file, so that readers (and a run killed while
+    writing) only ever see the previous or the complete new file.
+    Parameters
+    -----------------
+    filename : str
+        The name of the file.
+    write    : callable
+        Called as write(f) with the temporary file opened in binary mode.
+    '''
+    directory = os.path.dirname(os.path.abspath(filename))
+    handle,tmp = tempfile.mkstemp(dir=directory,suffix='.tmp')
+    try:
+        with os.fdopen(handle,'wb') as f:
+            write(f)
+        os.replace(tmp,filename)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+def _canonical(value):
+    '''Converts a parameter value into a JSON serialisable, canonical form.'''
+    if isinstance(value,dict):
+        return {str(key) : _canonical(value[key]) for key in sorted(value)}
+    if isinstance(value,(list,tuple)):
+        return [_canonical(v) for v in value]
+    if isinstance(value,np.ndarray):
+        data = np.ascontiguousarray(value)
+        return {'dtype' : str(data.dtype), 'shape' : list(data.shape),
+                'sha256' : hashlib.sha256(data.tobytes()).hexdigest()}
+    if isinstance(value,np.generic):
+        value = value.item()
+    # identical numbers give identical keys (e.g. 40 and 40.0)
+    if (isinstance(value,numbers.Integral) and not isinstance(value,bool)
+            and abs(value) < 2**53):
+        value = float(value)
+    return value
+
+
+def trialKey(model,time,**overrides):
+    '''Calculates the key of a trial.
+
+    The key is the SHA-256 hash of the model class, its full parameter set
+    and the simulation time.
+    Parameters
+    -----------------
+    model     : object
+        A simpleModel or simpleModelFsLts instance.
+    time      : float
+        The duration of the simulation.
+    overrides :
+        Parameters that replace the ones of the model (e.g. the seed or the
+        drive frequency of a trial of a batch).
+    Returns
+    -----------------
+    str
+        The hexadecimal key.
+    '''
+    params = {key : value for key,value in vars(model).items()
+              if key not in IGNORED_ATTRIBUTES}
+    params.update(overrides)
+    description = {'model' : type(model).__name__,
+                   'params' : _canonical(params),
+                   'time' : _canonical(time)}
+    text = json.dumps(description,sort_keys=True)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class trialCache(object):
+    '''A content-addressed on-disk cache for the results of trials.
+
+    Every trial is stored in its own compressed file named after its key
+    (see trialKey()), together with a JSON file describing its parameters.
+    Files are written atomically, so that an interrupted sweep leaves only
+    complete entries and can be resumed. The modification time of an entry
+    is updated whenever it is used, which the eviction relies on. With a
+    limit the entries are not scanned on every put(): the size of the cache
+    is tracked as entries are written and removed, and evict() is only run
+    when a put() exceeds max_bytes, removing entries down to a fraction
+    (low_water) of it so that the scans are amortised over many puts (and
+    every age_interval puts for max_age).
+
+    Attributes
+    -----------------
+    directory : str
+        The directory of the cache.
+    max_bytes : int
+        The maximal size of the cache (None means unlimited).
+    max_age   : float
+        The maximal time (in seconds) an entry is kept without being used
+        (None means unlimited).
+    '''
+
+    # number of puts between the evictions of entries older than max_age
+    age_interval = 100
+    # fraction of max_bytes the cache is reduced to when a put exceeds it
+    low_water = 0.9
+
+    def __init__(self,directory,max_bytes=None,max_age=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        # the size of the entries (tracked with max_bytes, see put())
+        self.size = None
+        self.n_puts = 0
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def _path(self,key,extension='.npz'):
+        return os.path.join(self.directory,key+extension)
+
+    def __contains__(self,key):
+        return os.path.exists(self._path(key))
+
+    def get(self,key,outputs=()):
+        '''Returns the stored outputs of a trial.
+        Parameters
+        -----------------
+        key     : str
+            The key of the trial.
+        outputs : tuple
+            The names of the outputs that are needed.
+        Returns
+        -----------------
+        dict
+            A dict mapping output names to arrays, or None if the trial is
+            not in the cache or lacks one of the needed outputs.
+        '''
+        path = self._path(key)
+        try:
+            with np.load(path) as data:
+                if not all(name in data.files for name in outputs):
+                    return None
+                result = {name : data[name] for name in data.files}
+        except (IOError,OSError,ValueError):
+            return None
+        os.utime(path,None)
+        return result
+
+    def put(self,key,result,params=None):
+        '''Stores the outputs of a trial.
+        Parameters
+        -----------------
+        key    : str
+            The key of the trial.
+        result : dict
+            A dict mapping output names to arrays (None values are skipped).
+        params : dict
+            A description of the trial stored alongside (optional).
+        '''
+        arrays = {name : value for name,value in result.items()
+                  if value is not None}
+        path = self._path(key,'.npz')
+        if self.max_bytes is not None and self.size is None:
+            self.size = sum(entry[1] for entry in self.entries())
+        old = os.path.getsize(path) if os.path.exists(path) else 0
+        atomicWrite(path,lambda f: np.savez_compressed(f,**arrays))
+        if params is not None:
+            text = json.dumps(_canonical(params),sort_keys=True,indent=1)
+            atomicWrite(self._path(key,'.json'),
+                        lambda f: f.write(text.encode('utf-8')))
+        self.n_puts = self.n_puts+1
+        if self.size is not None:
+            self.size = self.size+os.path.getsize(path)-old
+        if self.max_bytes is not None and self.size > self.max_bytes:
+            self.evict(max_bytes=self.low_water*self.max_bytes)
+        elif (self.max_age is not None
+              and self.n_puts % self.age_interval == 0):
+            self.evict()
+
+    def remove(self,key):
+        '''Removes a trial from the cache.'''
+        if self.size is not None and os.path.exists(self._path(key)):
+            self.size = self.size-os.path.getsize(self._path(key))
+        for extension in ('.npz','.json'):
+            if os.path.exists(self._path(key,extension)):
+                os.remove(self._path(key,extension))
+
+    def entries(self):
+        '''Returns (key,size in bytes,time of last use) of all entries.'''
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.npz'):
+                stat = os.stat(os.path.join(self.directory,name))
+                entries.append((name[:-4],stat.st_size,stat.st_mtime))
+        return entries
+
+    def evict(self,max_bytes=None,max_age=None):
+        '''Removes entries that have not been used for longer than max_age
+        and then the least recently used entries until the cache is smaller
+        than max_bytes (defaults to the attributes of the cache). All
+        entries are scanned, which also updates the tracked size of the
+        cache (e.g. after writes of other processes).
+        Returns
+        -----------------
+        list
+            The keys of the removed entries.
+        '''
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        max_age = self.max_age if max_age is None else max_age
+        entries = sorted(self.entries(),key=lambda entry: entry[2])
+        removed = []
+        if max_age is not None:
+            now = timer.time()
+            while entries and now-entries[0][2] > max_age:
+                removed.append(entries.pop(0)[0])
+        if max_bytes is not None:
+            total = sum(entry[1] for entry in entries)
+            while entries and total > max_bytes:
+                key,size,used = entries.pop(0)
+                total = total-size
+                removed.append(key)
+        for key in removed:
+            self.remove(key)
+        if self.size is not None:
+            self.size = sum(entry[1] for entry in entries)
+        return removed
+
+    def run(self,model,time=100.0,record=None):
+        '''Runs a model unless its result is already in the cache.
+        Parameters
+        -----------------
+        model  : object
+            A simpleModel or simpleModelFsLts instance.
+        time   : float
+            The duration of the simulation.
+        record : tuple
+            The outputs to record (default: all outputs of the model).
+        Returns
+        -----------------
+        tuple
+            The outputs of model.run() (None for outputs not recorded).
+        '''
+        if record is None:
+            record = model.outputs
+        key = trialKey(model,time)
+        result = self.get(key,record)
+        if result is None:
+            outputs = model.run(time,record=record)
+            result = dict(zip(model.outputs,outputs))
+            params = {name : value for name,value in vars(model).items()
+                      if name not in IGNORED_ATTRIBUTES}
+            params['model'] = type(model).__name__
+            params['time'] = time
+            self.put(key,result,params)
+        return tuple(result.get(name) if name in record else None
+                     for name in model.outputs)
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+# ------------------------------------------------------------------------------
+# Copyright (c) 2020, Christoph Metzner
+# Distributed under the (new) BSD License.
+#
+# Contributors: Christoph Metzner (cmetzner@ni.tu-berlin.de)
+# ------------------------------------------------------------------------------
+# Checkpoints of long simulations.
+#
+# A checkpoint holds everything needed to continue an integration: the state
+# of the network (see network.networkEngine.integrate()), the outputs recorded
+# so far, the noise spike trains together with the state of their random
+# number generators (see noise.noiseStream) and a description of the run, all
+# in one .npz file that is replaced atomically, so that a run killed while
+# writing a checkpoint leaves the previous one intact.
+#
+# ------------------------------------------------------------------------------
+import json
+
+import numpy as np
+
+from cache import atomicWrite
+from noise import noiseStream
+
+
+STATE = ('step','theta','s','drive','noise_ex','noise_R')
+
+
+def saveCheckpoint(filename,state,outputs,streams,**info):
+    '''Writes a checkpoint (atomically) to a .npz file.
+    Parameters
+    -----------------
+    filename : str
+        The name of the file.
+    state    : dict
+        The state of the integration (see
+        network.networkEngine.integrate()).
+    outputs  : dict
+        The recorded outputs (None entries are skipped).
+    streams  : list
+        The noise.noiseStream of every trial.
+    info     :
+        Arrays or scalars describing the run (e.g. the parameters).
+    '''
+    arrays = {'state_'+name : state[name] for name in STATE}
+    for name,recorder in state.get('spikes',{}).items():
+        for key,values in recorder.items():
+            arrays['spikes_%s_%s' % (name,key)] = values
+    for name,output in outputs.items():
+        if output is not None:
+            arrays['output_'+name] = output
+    arrays['noise'] = np.array([json.dumps(stream.state())
+                                for stream in streams])
+    for name,value in info.items():
+        arrays['info_'+name] = value
+    atomicWrite(filename,lambda f: np.savez(f,**arrays))
+
+
+def loadCheckpoint(filename):
+    '''Reads a checkpoint written by saveCheckpoint().
+    Parameters
+    -----------------
+    filename : str
+        The name of the file.
+    Returns
+    -----------------
+    dict,dict,list,dict
+        The state, the outputs, the noise streams and the description of the
+        run.
+    '''
+    state = {}
+    outputs = {}
+    info = {}
+    with np.load(filename) as data:
+        for key in data.files:
+            if key.startswith('state_'):
+                state[key[len('state_'):]] = data[key]
+            elif key.startswith('spikes_'):
+                name,field = key[len('spikes_'):].rsplit('_',1)
+                state.setdefault('spikes',{}).setdefault(name,{})[field] = \
+                    data[key]
+            elif key.startswith('output_'):
+                outputs[key[len('output_'):]] = data[key]
+            elif key.startswith('info_'):
+                info[key[len('info_'):]] = data[key]
+        streams = [noiseStream.restore(json.loads(str(text)))
+                   for text in data['noise']]
+    return state,outputs,streams,info
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+# ------------------------------------------------------------------------------
+# Copyright (c) 2020, Christoph Metzner
+# Distributed under the (new) BSD License.
+#
+# Contributors: Christoph Metzner (cmetzner@ni.tu-berlin.de)
+# ------------------------------------------------------------------------------
+# Entrainment measures of whole explorations.
+#
+# The measures (band power at the drive frequency, its harmonics and
+# subharmonics and at fixed frequencies, peak frequency and power ratios) are
+# computed on batched power spectral densities (see spectral.powerSpectrum())
+# with array operations only, e.g. for the (condition,g_de,frequency,seed,
+# frequencies) array obtained from a trialStore, and collected in a table with
+# one row per trial.
+#
+# ------------------------------------------------------------------------------
+import numpy as np
+
+import spectral
+
+
+# the frequencies of the spectra are in 1/ms (time steps in ms)
+HZ = 1000.0
+
+
+def bandPower(psd,freqs,low,high):
+    '''Integrates power spectral densities over frequency bands.
+    Parameters
+    -----------------
+    psd   : ndarray
+        Array of spectra (frequencies along the last axis).
+    freqs : ndarray
+        The (equidistant) frequencies of the spectra.
+    low   : float or ndarray
+        The lower band limits (broadcast against psd.shape[:-1]).
+    high  : float or ndarray
+        The upper band limits (inclusive, broadcast as low).
+    Returns
+    -----------------
+    ndarray
+        The power in the bands (shape psd.shape[:-1]).
+    '''
+    psd = np.asarray(psd,dtype=float)
+    shape = psd.shape[:-1]
+    df = freqs[1]-freqs[0]
+    cumulative = np.concatenate([np.zeros(shape+(1,)),
+                                 np.cumsum(psd,axis=-1)],axis=-1)
+    first = np.broadcast_to(np.searchsorted(freqs,low,side='left'),shape)
+    last = np.broadcast_to(np.searchsorted(freqs,high,side='right'),shape)
+    upper = np.take_along_axis(cumulative,last[...,None],axis=-1)[...,0]
+    lower = np.take_along_axis(cumulative,first[...,None],axis=-1)[...,0]
+    return (upper-lower)*df
+
+
+def peakFrequency(psd,freqs,low,high):
+    '''Returns the frequencies of the maximal power within a band (NaN for
+    missing spectra).'''
+    psd = np.asarray(psd,dtype=float)
+    inside = (freqs >= low) & (freqs <= high)
+    masked = np.where(inside & ~np.isnan(psd),psd,-np.inf)
+    peak = np.asarray(freqs[np.argmax(masked,axis=-1)],dtype=float)
+    peak[np.all(np.isnan(psd) | ~inside,axis=-1)] = np.nan
+    return peak
+
+
+def entrainmentMeasures(psd,freqs,drive_frequencies,width=2.0,
+                        multiples=(0.5,2.0),bands=(40.0,30.0,20.0),
+                        fmax=100.0):
+    '''Calculates the entrainment measures of batched spectra.
+    Parameters
+    -----------------
+    psd               : ndarray
+        Array of spectra (frequencies along the last axis, see
+        spectral.powerSpectrum()).
+    freqs             : ndarray
+        The frequencies of the spectra (in 1/ms).
+    drive_frequencies : float or ndarray
+        The drive frequencies (in Hz, broadcast against psd.shape[:-1]).
+    width             : float
+        The width of the bands (in Hz) centred on the frequencies (at least
+        the frequency resolution of the spectra, so that every band holds
+        a frequency bin).
+    multiples         : tuple
+        The multiples of the drive frequency besides the drive frequency
+        itself (e.g. 0.5 for the subharmonic, 2 for the first harmonic).
+    bands             : tuple
+        Fixed frequencies (in Hz) whose power is reported.
+    fmax              : float
+        The upper limit (in Hz) of the total power and the peak search.
+    Returns
+    -----------------
+    dict
+        Arrays (shape psd.shape[:-1]) of 'total_power', 'peak_frequency'
+        (in Hz), 'power_drive', 'power_<multiple>' and 'ratio_<multiple>'
+        (relative to the power at the drive frequency) for every multiple
+        (e.g. 'power_x0.5', 'ratio_x0.5') and 'power_<band>Hz' for every
+        fixed band.
+    '''
+    # band limits in the units of the spectra (the power is the integral
+    # over the frequencies in 1/ms, i.e. the variance of the signal)
+    drive = np.asarray(drive_frequencies,dtype=float)/HZ
+    half = 0.5*max(width/HZ,freqs[1]-freqs[0])
+    fmax = fmax/HZ
+    measures = {'total_power' : bandPower(psd,freqs,freqs[1],fmax),
+                'peak_frequency' : HZ*peakFrequency(psd,freqs,freqs[1],fmax),
+                'power_drive' : bandPower(psd,freqs,drive-half,drive+half)}
+    with np.errstate(divide='ignore',invalid='ignore'):
+        for multiple in multiples:
+            name = 'x%g' % multiple
+            power = bandPower(psd,freqs,multiple*drive-half,
+                              multiple*drive+half)
+            measures['power_'+name] = power
+            measures['ratio_'+name] = power/measures['power_drive']
+    for band in bands:
+        measures['power_%gHz' % band] = bandPower(psd,freqs,(band/HZ)-half,
+                                                  (band/HZ)+half)
+    return measures
+
+
+def entrainmentTable(psd,freqs,conditions,g_des,drive_frequencies,seeds,
+                     **kwargs):
+    '''Collects the entrainment measures of an exploration in a table.
+    Parameters
+    -----------------
+    psd               : ndarray
+        The spectra of shape (conditions,g_des,drive frequencies,seeds,
+        frequencies), e.g. spectral.powerSpectrum() of trialStore.read().
+    freqs             : ndarray
+        The frequencies of the spectra (in 1/ms).
+    conditions        : list
+        The conditions of the first axis.
+    g_des             : list
+        The drive strengths of the second axis.
+    drive_frequencies : list
+        The drive frequencies (in Hz) of the third axis.
+    seeds             : list
+        The seeds of the fourth axis.
+    kwargs            :
+        Passed to entrainmentMeasures().
+    Returns
+    -----------------
+    ndarray
+        A structured array with one row per trial and the fields
+        'condition', 'g_de', 'drive_frequency', 'seed' and the measures.
+    '''
+    psd = np.asarray(psd,dtype=float)
+    shape = psd.shape[:-1]
+    drive = np.asarray(drive_frequencies,dtype=float)[None,None,:,None]
+    measures = entrainmentMeasures(psd,freqs,np.broadcast_to(drive,shape),
+                                   **kwargs)
+
+    index = np.meshgrid(*[np.arange(n) for n in shape],indexing='ij')
+    columns = [('condition',np.asarray(conditions,dtype=str)),
+               ('g_de',np.asarray(g_des,dtype=float)),
+               ('drive_frequency',np.asarray(drive_frequencies,dtype=float)),
+               ('seed',np.asarray(seeds,dtype=int))]
+    dtype = ([(name,values.dtype) for name,values in columns]
+             +[(name,float) for name in measures])
+    table = np.zeros((int(np.prod(shape)),),dtype=dtype)
+    for (name,values),idx in zip(columns,index):
+        table[name] = values[idx.ravel()]
+    for name,values in measures.items():
+        table[name] = values.ravel()
+    return table
+
+
+def saveTable(table,filename):
+    '''Stores a table (see entrainmentTable()) as CSV.'''
+    names = table.dtype.names
+    fmt = ['%s' if table.dtype[name].kind == 'U' else
+           '%d' if table.dtype[name].kind == 'i' else '%.8g'
+           for name in names]
+    np.savetxt(filename,table,fmt=fmt,delimiter=',',header=','.join(names),
+               comments='')
+
+
+def storeTable(store,sim_time,**kwargs):
+    '''Collects the entrainment measures of all trials of a trialStore
+    (missing trials have NaN measures).
+    Parameters
+    -----------------
+    store    : trialStore
+        The store of the MEG signals.
+    sim_time : float
+        The duration of the simulations (see spectral.transientCut(); the
+        transient cut follows the warm-up of the store, see
+        spectral.analysisTransient()).
+    kwargs   :
+        Passed to entrainmentMeasures().
+    Returns
+    -----------------
+    ndarray
+        The table (see entrainmentTable()).
+    '''
+    coords = store.coords
+    tables = []
+    # one condition at a time (bounds the memory of the signals)
+    for condition in coords['condition']:
+        megs = store.read(condition=[condition])
+        psd,freqs = spectral.powerSpectrum(
+            megs,store.dt,sim_time,spectral.analysisTransient(store.warmup))
+        tables.append(entrainmentTable(psd,freqs,[condition],coords['g_de'],
+                                       coords['frequency'],coords['seed'],
+                                       **kwargs))
+    return np.concatenate(tables)
@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (c) 2017, Christoph Metzner
+# Distributed under the (new) BSD License.
+#
+# Contributors: Christoph Metzner (c.metzner@herts.ac.uk)
+# -----------------------------------------------------------------------------
+# A compiled (numba) integration kernel for networks of theta neurons.
+#
+# The kernel integrates a network described by stacked arrays: all cells of
+# all populations are concatenated, every cell has one synaptic gating
+# variable (driven by its own phase, decaying with the time constant of its
+# population) and the synaptic input is the product of the gating variables
+# with a signed weight matrix (see network.py). numba is optional; without it the
+# model classes fall back to their NumPy implementation. numba is only imported
+# (and the kernel compiled) on first use, so that importing the model classes
+# does not pay for it.
+# -----------------------------------------------------------------------------
+import copy
+import importlib.util
+import math
+import time as timer
+
+import numpy as np
+
+# the numba module (imported by _compile())
+numba = None
+_compiled = None
+
+
+def _gatingStep(s,h,tau,tau_R,dt,exponential):
+    '''Advances a gating variable by one time step (forward Euler or
+    exponential update).'''
+    if exponential:
+        rate = 1.0/tau+h/tau_R
+        s_inf = (h/tau_R)/rate
+        return s_inf+(s-s_inf)*math.exp(-dt*rate)
+    return s+dt*(-1.0*(s/tau)+h*((1.0-s)/tau_R))
+
+
+def _segment(t_start,t_stop,dt,eta,tau_R,tau_d,b_drive,exponential,theta,s,
+             drive,noise_ex,noise_R,tau_s,G,g_d,m,B,decay_ex,decay_R,scale,
+             offsets,cells,w_ex,w_R,meg,theta_out):
+    '''Integrates the time steps t_start,...,t_stop-1 (in place).
+
+    The state (theta, s, drive=[phase,gating] of the drive cell and the
+    noise filter states) is updated in place; the MEG signal and the phases
+    of every time step are written to meg and theta_out (indexed relative
+    to t_start). With exponential the gating variables are updated exactly
+    for the phase of the previous time step (see network.networkEngine.gatingStep()).
+    '''
+    n = theta.shape[0]
+    S = np.empty(n)
+    varying = B.shape[0] > 1
+    for t in range(t_start,t_stop):
+        k = t-t_start
+
+        # noise (see noise.noiseFilter)
+        for i in range(n):
+            noise_ex[i] = noise_ex[i]*decay_ex
+            noise_R[i] = noise_R[i]*decay_R
+        for e in range(offsets[t],offsets[t+1]):
+            noise_ex[cells[e]] = noise_ex[cells[e]]+w_ex[e]
+            noise_R[cells[e]] = noise_R[cells[e]]+w_R[e]
+
+        # synaptic input and MEG (from the previous time step)
+        s_d = drive[1]
+        for j in range(n):
+            S[j] = g_d[j]*s_d
+        total = 0.0
+        for i in range(n):
+            s_i = s[i]
+            if s_i != 0.0:
+                for j in range(n):
+                    S[j] = S[j]+G[i,j]*s_i
+                total = total+m[i]*s_i
+        meg[k] = total
+
+        # evolve gating variables
+        for i in range(n):
+            h = math.exp(-1.0*eta*(1+math.cos(theta[i])))
+            s[i] = _gatingStep(s[i],h,tau_s[i],tau_R,dt,exponential)
+        cos_d = math.cos(drive[0])
+        h = math.exp(-1.0*eta*(1+cos_d))
+        drive[1] = _gatingStep(s_d,h,tau_d,tau_R,dt,exponential)
+
+        # evolve drive cell
+        drive[0] = drive[0]+dt*((1-cos_d)+b_drive*(1+cos_d))
+
+        # evolve theta
+        b = t if varying else 0
+        for i in range(n):
+            c = math.cos(theta[i])
+            N = scale*(noise_ex[i]-noise_R[i])
+            theta[i] = theta[i]+dt*((1-c)+(B[b,i]+S[i]+N)*(1+c))
+            theta_out[i,k] = theta[i]
+
+
+def _compile():
+    '''Imports numba and compiles the kernel (or loads it from the numba
+    cache) on first use; returns the compiled _segment().'''
+    global numba,_gatingStep,_compiled
+    if _compiled is None:
+        import numba
+        # _segment() calls the compiled _gatingStep() (a global)
+        _gatingStep = numba.njit(cache=True,inline='always')(_gatingStep)
+        _compiled = numba.njit(cache=True)(_segment)
+    return _compiled
+
+
+def available():
+    '''Returns whether the compiled kernel can be used (numba installed),
+    without importing numba.'''
+    return importlib.util.find_spec('numba') is not None
+
+
+def integrate(network,noise,n_steps,meg=None,callback=None,chunk=1024,
+              state=None):
+    '''Integrates one trial of a network with the compiled kernel.
+
+    The time loop runs in native code in segments of chunk time steps. The
+    phases of all cells are only kept for the current segment, which is
+    passed to the callback (e.g. to record traces or detect spikes).
+    Parameters
+    -----------------
+    network  : dict
+        The stacked description of the network: 'dt', 'eta', 'tau_R',
+        'tau_d' (decay time of the drive synapses), 'b_drive',
+        'exponential' (exponential update of the gating variables), 'tau_s'
+        (decay time of the gating variable of every cell), 'G' ((N,N)
+        signed weights, presynaptic x postsynaptic), 'g_d' (drive weight of
+        every cell), 'm' (MEG weight of the gating variable of every cell)
+        and 'B' ((1,N) or (time points,N) applied currents).
+    noise    : noiseFilter
+        The noise filter of all N cells (in the order of the network).
+    n_steps  : int
+        The number of time points.
+    meg      : ndarray
+        1D array the MEG signal is written to (optional).
+    callback : callable
+        Called as callback(t,theta) after every segment, theta being the
+        (N,segment length) phases at the time steps t,t+1,...
+    chunk    : int
+        The number of time steps per segment.
+    state    : dict
+        The state to continue from (None: the beginning): 'step' (the next
+        time step), 'theta', 's' and 'drive' (phase and gating variable of
+        the drive cell), which are updated in place; the noise filter has
+        to be at the same time step.
+    Returns
+    -----------------
+    ndarray
+        1D array containing the MEG signal.
+    '''
+    n = len(network['tau_s'])
+    if state is None:
+        start = 1
+        theta = np.zeros((n,))
+        s = np.zeros((n,))
+        # phase and gating variable of the drive cell
+        drive = np.zeros((2,))
+    else:
+        start = int(state['step'])
+        theta = state['theta']
+        s = state['s']
+        drive = state['drive']
+    if meg is None:
+        meg = np.zeros((n_steps,))
+    elif state is None:
+        meg[0] = 0.0
+
+    tau_s = np.asarray(network['tau_s'],dtype=float)
+    G = np.ascontiguousarray(network['G'],dtype=float)
+    g_d = np.asarray(network['g_d'],dtype=float)
+    m = np.asarray(network['m'],dtype=float)
+    B = np.ascontiguousarray(np.atleast_2d(network['B']),dtype=float)
+    buffer = np.zeros((n,chunk))
+    segment = _compile()
+    for t in range(start,n_steps,chunk):
+        length = min(chunk,n_steps-t)
+        segment(t,t+length,network['dt'],network['eta'],network['tau_R'],
+                 network['tau_d'],network['b_drive'],
+                 network.get('exponential',False),theta,s,drive,
+                 noise.state_ex,noise.state_R,tau_s,G,g_d,m,B,
+                 noise.decay_ex,noise.decay_R,noise.scale,noise.offsets,
+                 noise.cells,noise.weights_ex,noise.weights_R,
+                 meg[t:t+length],buffer)
+        if callback is not None:
+            callback(t,buffer[:,:length])
+    return meg
+
+
+def speedup(model,time=100.0,repeat=1):
+    '''Measures the speedup of the compiled kernel against the NumPy loop.
+
+    The kernel is compiled (or loaded from the numba cache) before timing.
+    Parameters
+    -----------------
+    model  : object
+        A simpleModel or simpleModelFsLts instance.
+    time   : float
+        The duration of the simulation.
+    repeat : int
+        The number of timed runs per backend (the fastest one is used).
+    Returns
+    -----------------
+    dict
+        The wall times of both backends (in s), the speedup and the maximal
+        absolute difference of the MEG signals.
+    '''
+    if not available():
+        raise ImportError('the compiled kernel requires numba')
+    results = {}
+    megs = {}
+    for backend in ('numpy','numba'):
+        trial = copy.copy(model)
+        trial.backend = backend
+        if backend == 'numba':
+            trial.run(min(time,10*trial.dt),record=('meg',))
+        best = None
+        for i in range(repeat):
+            start = timer.time()
+            megs[backend] = trial.run(time,record=('meg',))[0]
+            elapsed = timer.time()-start
+            best = elapsed if best is None else min(best,elapsed)
+        results[backend] = best
+    results['speedup'] = results['numpy']/results['numba']
+    results['max_meg_difference'] = np.max(np.abs(megs['numpy']
+                                                   -megs['numba']))
+    return results
+
+
+if __name__ == '__main__':
+    from simple_model_class import simpleModel
+    from simple_model_fs_lts_class import simpleModelFsLts
+
+    for model in (simpleModel(drive_frequency=40.0,tau_inh=28.0),
+                  simpleModelFsLts(drive_frequency=40.0)):
+        results = speedup(model,time=500.0)
+        print('%s: numpy %.2f s, numba %.2f s, speedup %.1fx '
+              '(max. MEG difference %.1e)' % (type(model).__name__,
+              results['numpy'],results['numba'],results['speedup'],
+              results['max_meg_difference']))
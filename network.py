@@ -0,0 +1,746 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (c) 2017, Christoph Metzner
+# Distributed under the (new) BSD License.
+#
+# Contributors: Christoph Metzner (c.metzner@herts.ac.uk)
+# -----------------------------------------------------------------------------
+# A generic engine for networks of theta neurons shared by the model classes.
+#
+# A network is described declaratively by its populations (size, synaptic
+# decay time, applied current, drive weight, background noise) and the
+# projections between them (weight, connectivity, contribution to the MEG
+# signal). The engine stacks all cells of all populations: every cell has one
+# synaptic gating variable (driven by its own phase, decaying with the time
+# constant of its population) and the synaptic input of all cells is the
+# product of the gating variables with one signed weight matrix. The state of
+# a time step is thus a few (trials,cells) arrays whatever the number of
+# populations and projections, and the same description is integrated by the
+# NumPy loop, the compiled kernel (kernel.py) and the adaptive integrator
+# (adaptive.py).
+# -----------------------------------------------------------------------------
+import copy
+import warnings
+
+import numpy as np
+
+import adaptive
+from entrainment import entrainmentMeasures
+import kernel
+from noise import noiseFilter
+import spectral
+from spikes import spikeRecorder
+
+
+class population(object):
+    '''A population of theta neurons.
+
+    Attributes
+    -----------------
+    name  : str
+        The name of the population (and of its recorded outputs).
+    size  : int
+        The number of cells.
+    tau   : float
+        The decay time of the synapses of the population.
+    bias  : float or ndarray
+        The applied current: a scalar, one value per cell or a (time
+        points,cells) array of time-dependent currents.
+    drive : float
+        The weight of the synapses from the drive cell (0: not driven).
+    noise : bool
+        Whether the cells receive the background noise.
+    '''
+
+    def __init__(self,name,size,tau,bias,drive=0.0,noise=True):
+        self.name = name
+        self.size = size
+        self.tau = tau
+        self.bias = bias
+        self.drive = drive
+        self.noise = noise
+
+
+class projection(object):
+    '''A projection between two populations.
+
+    Attributes
+    -----------------
+    pre          : str
+        The name of the presynaptic population.
+    post         : str
+        The name of the postsynaptic population.
+    weight       : float
+        The synaptic weight (negative for inhibitory projections).
+    connectivity : ndarray
+        The (n_pre,n_post) connectivity (None: all-to-all).
+    meg          : bool
+        Whether the synaptic currents of the projection contribute to the
+        MEG signal.
+    '''
+
+    def __init__(self,pre,post,weight,connectivity=None,meg=False):
+        self.pre = pre
+        self.post = post
+        self.weight = weight
+        self.connectivity = connectivity
+        self.meg = meg
+
+
+# the simulation options of the model classes and their values
+OPTIONS = {'gating' : ('matrix','vector'),
+           'noise_source' : ('legacy','generator'),
+           'backend' : ('numpy','numba'),
+           'integrator' : ('euler','adaptive'),
+           'gating_solver' : ('euler','exponential'),
+           'dtype' : ('float64','float32')}
+
+
+def checkOptions(**options):
+    '''Validates the simulation options of a model (see OPTIONS).
+
+    The numba backend falls back to 'numpy' with a warning if numba is not
+    installed, and dtypes are given by their names.
+    Parameters
+    -----------------
+    options :
+        The options to check, e.g. gating='matrix' or dtype=np.float32.
+    Returns
+    -----------------
+    dict
+        The checked options.
+    '''
+    checked = {}
+    for name,value in options.items():
+        if name == 'dtype':
+            value = np.dtype(value).name
+        if value not in OPTIONS[name]:
+            raise ValueError('%s has to be %s' % (name,' or '.join(
+                "'%s'" % allowed for allowed in OPTIONS[name])))
+        if name == 'backend' and value == 'numba' and not kernel.available():
+            warnings.warn('numba is not installed, using the NumPy backend')
+            value = 'numpy'
+        checked[name] = value
+    return checked
+
+
+class networkEngine(object):
+    '''Integrates a network of populations and projections.
+
+    Attributes
+    -----------------
+    populations   : list
+        The populations (the cells are stacked in this order).
+    projections   : list
+        The projections.
+    dt            : float
+        time step
+    eta           : float
+        synaptic scaling factor
+    tau_R         : float
+        synaptic rise time
+    tau_drive     : float
+        decay time of the drive synapses
+    A             : float
+        scaling factor for the background noise strength
+    tau_noise     : float
+        decay time of the noise EPSPs
+    gating_solver : str
+        update of the synaptic gating variables: 'euler' or 'exponential'
+        (see gatingStep())
+    '''
+
+    def __init__(self,populations,projections,dt,eta=5.0,tau_R=0.1,
+                 tau_drive=2.0,A=0.5,tau_noise=2.0,gating_solver='euler'):
+        if gating_solver not in ('euler','exponential'):
+            raise ValueError("gating_solver has to be 'euler' or 'exponential'")
+        self.populations = populations
+        self.projections = projections
+        self.dt = dt
+        self.eta = eta
+        self.tau_R = tau_R
+        self.tau_drive = tau_drive
+        self.A = A
+        self.tau_noise = tau_noise
+        self.gating_solver = gating_solver
+
+        # the cells of every population
+        self.cells = {}
+        start = 0
+        for pop in populations:
+            if pop.name in self.cells:
+                raise ValueError('duplicate population %s' % pop.name)
+            self.cells[pop.name] = slice(start,start+pop.size)
+            start = start+pop.size
+        self.n_cells = start
+        sizes = [pop.size for pop in populations]
+        self.tau_s = np.repeat([float(pop.tau) for pop in populations],sizes)
+        self.g_d = np.repeat([float(pop.drive) for pop in populations],sizes)
+        self.noisy = np.repeat([bool(pop.noise) for pop in populations],sizes)
+
+        # signed weights (presynaptic x postsynaptic) and MEG weights
+        self.G = np.zeros((self.n_cells,self.n_cells))
+        self.m = np.zeros((self.n_cells,))
+        for proj in projections:
+            pre = self.cells[proj.pre]
+            post = self.cells[proj.post]
+            shape = (pre.stop-pre.start,post.stop-post.start)
+            if proj.connectivity is None:
+                W = np.ones(shape)
+            else:
+                W = np.asarray(proj.connectivity,dtype=float)
+                if W.shape != shape:
+                    raise ValueError('invalid connectivity for projection '
+                                     '%s-%s' % (proj.pre,proj.post))
+            self.G[pre,post] += proj.weight*W
+            if proj.meg:
+                # the MEG sums the synaptic currents of all cells
+                self.m[pre] += proj.weight*np.sum(W,axis=1)
+
+    def bias(self,n_steps):
+        '''Returns the applied currents of all cells, a (1,cells) array or a
+        (time points,cells) array if any of them is time-dependent.'''
+        biases = [np.asarray(pop.bias,dtype=float) for pop in self.populations]
+        rows = n_steps if max(b.ndim for b in biases) == 2 else 1
+        return np.hstack([np.broadcast_to(b,(rows,pop.size))
+                          for b,pop in zip(biases,self.populations)])
+
+    def stacked(self,n_steps,b_drive=0.0):
+        '''Returns the stacked description of the network used by the
+        compiled kernel and the adaptive integrator (see kernel.integrate()).
+        '''
+        return {'dt' : self.dt, 'eta' : self.eta, 'tau_R' : self.tau_R,
+                'tau_d' : self.tau_drive, 'b_drive' : b_drive, 'A' : self.A,
+                'tau_noise' : self.tau_noise,
+                'exponential' : self.gating_solver == 'exponential',
+                'tau_s' : self.tau_s, 'G' : self.G, 'g_d' : self.g_d,
+                'm' : self.m, 'B' : self.bias(n_steps)}
+
+    def gatingStep(self,s,h,tau):
+        '''Advances synaptic gating variables by one time step.
+
+        For a fixed presynaptic phase the gating variables follow the
+        linear equation ds/dt = -s/tau+h*(1-s)/tau_R, h being the synaptic
+        activation exp(-eta*(1+cos(theta))). Forward Euler requires dt to
+        be small compared with tau_R/h; the exponential update solves the
+        equation exactly over the time step,
+
+            s(t+dt) = s_inf+(s(t)-s_inf)*exp(-dt*(1/tau+h/tau_R)),
+
+        with s_inf = (h/tau_R)/(1/tau+h/tau_R), and is stable for any dt.
+        Parameters
+        -----------------
+        s   : ndarray
+            The gating variables.
+        h   : ndarray
+            The synaptic activation (broadcastable to s).
+        tau : float or ndarray
+            The decay time(s).
+        Returns
+        -----------------
+        ndarray
+            The gating variables at the next time step.
+        '''
+        if self.gating_solver == 'exponential':
+            rate = 1.0/tau+h/self.tau_R
+            s_inf = (h/self.tau_R)/rate
+            return s_inf+(s-s_inf)*np.exp(-self.dt*rate)
+        return s+self.dt*(-1.0*(s/tau)+h*((1.0-s)/self.tau_R))
+
+    def integrate(self,spike_trains,b_drive,n_steps,meg=None,traces=None,
+                  spikes=False,backend='numpy',integrator='euler',
+                  tolerance=1e-4,profiler=None,networks=None,state=None,
+                  checkpoint=None,interval=None,dtype=np.float64):
+        '''Integrates a number of trials of the network.
+
+        The trials can be variants of the network (networks), e.g. the
+        points of a parameter grid, which are then advanced together in the
+        same vectorized loop.
+
+        The integration can be continued from a state, which is the state
+        at the end of an integration or a snapshot passed to the checkpoint
+        callback. A state is a dict of (trials,...) arrays: 'step' (the next
+        time step of every trial), 'theta', 's' (gating variables), 'drive'
+        (phase and gating variable of the drive cell), 'noise_ex' and
+        'noise_R' (the noise filter states, see noise.noiseFilter) and, if
+        spikes are detected, 'spikes' (the states of the spike recorders,
+        see spikes.spikeRecorder.state()). The outputs of the time steps
+        before the state are not written. The number of time points may
+        exceed the one of the integration the state stems from, so that an
+        integration can be continued to a longer time. The adaptive
+        integrator does not support states.
+        Parameters
+        -----------------
+        spike_trains : list
+            For every trial the noise spike trains of all cells (in the
+            order of the populations); the trains of populations without
+            noise are ignored.
+        b_drive      : ndarray
+            The applied current of the drive cell of every trial.
+        n_steps      : int
+            The number of time points.
+        meg          : ndarray
+            (trials,time points) array the MEG signals are written to (or
+            None).
+        traces       : dict
+            Maps population names to (trials,cells,time points) arrays the
+            phases are written to (missing or None: not recorded).
+        spikes       : bool
+            Whether to detect the spikes during the integration.
+        backend      : str
+            'numpy' (all trials advanced together in one vectorized loop)
+            or 'numba' (the compiled kernel, trial by trial).
+        integrator   : str
+            'euler' or 'adaptive' (see adaptive.integrate(), trial by
+            trial).
+        tolerance    : float
+            The tolerance of the adaptive integrator.
+        profiler     : phaseProfiler
+            The profiler the phases are timed with (None disables
+            profiling).
+        networks     : list
+            For every trial a variant of the network whose weights, decay
+            times, drive weights and applied currents are used for the
+            trial (None: this network for all trials). The variants must
+            have the same populations (names and sizes) and the same time
+            step, time constants of the drive and the noise, noise strength
+            and gating solver.
+        state        : dict
+            The state to continue from (None: the beginning).
+        checkpoint   : callable
+            Called as checkpoint(state) with a snapshot of the state every
+            interval time steps (the compiled kernel at the end of the
+            first segment after the interval).
+        interval     : int
+            The number of time steps between the checkpoints.
+        dtype        : dtype
+            The floating point type of the state of the NumPy loop (e.g.
+            np.float32, halving the memory traffic of the synaptic input);
+            the noise filters, the compiled kernel and the adaptive
+            integrator compute in double precision and only store their
+            results in the output arrays.
+        Returns
+        -----------------
+        dict
+            'state' is the state at the end of the integration (Euler
+            integrator), 'spike_times' (if spikes were detected) maps
+            population names to the (offsets,times) format of
+            spikes.spikeTimes() (indexed by trial and cell),
+            'integration_stats' (adaptive integrator) is a list of the
+            statistics of every trial.
+        '''
+        traces = {} if traces is None else traces
+        n_trials = len(spike_trains)
+        if integrator == 'adaptive' and (state is not None or
+                                         checkpoint is not None):
+            raise ValueError('the adaptive integrator does not support '
+                             'checkpoints')
+        if checkpoint is not None and (interval is None or interval < 1):
+            raise ValueError('checkpoints require a positive interval')
+        if state is not None and np.any(np.asarray(state['step']) > n_steps):
+            raise ValueError('the state is beyond the last time step')
+        recorders = None
+        if spikes:
+            recorders = {pop.name : spikeRecorder(n_trials*pop.size)
+                         for pop in self.populations}
+            if state is not None:
+                if 'spikes' not in state:
+                    raise ValueError('the state does not contain the spikes')
+                for name,recorder in recorders.items():
+                    recorder.restore(state['spikes'][name])
+        spike_trains = [[train if noisy else [] for train,noisy in
+                         zip(trains,self.noisy)] for trains in spike_trains]
+        b_drive = np.broadcast_to(np.asarray(b_drive,dtype=float),
+                                  (n_trials,))
+        if networks is None:
+            networks = [self]*n_trials
+        if len(networks) != n_trials:
+            raise ValueError('one network per trial is required')
+        for network in networks:
+            self._checkVariant(network)
+        if profiler:
+            profiler.count('trials',n_trials)
+            profiler.count('steps',n_steps-1)
+
+        results = {}
+        if backend == 'numba' or integrator == 'adaptive':
+            self._integrateTrials(spike_trains,b_drive,n_steps,meg,traces,
+                                  recorders,integrator,tolerance,profiler,
+                                  results,networks,state,checkpoint,interval)
+        else:
+            self._integrateBatch(spike_trains,b_drive,n_steps,meg,traces,
+                                 recorders,profiler,networks,state,
+                                 checkpoint,interval,results,dtype)
+
+        if spikes:
+            results['spike_times'] = {name : recorder.spikeTimes(self.dt)
+                                      for name,recorder in recorders.items()}
+            if profiler:
+                profiler.count('spikes',sum(recorder.n_events for recorder
+                                            in recorders.values()))
+        return results
+
+    def _checkVariant(self,network):
+        '''Raises a ValueError if network is not a variant of this network
+        (see integrate()).'''
+        if network is self:
+            return
+        shared = ('dt','eta','tau_R','tau_drive','A','tau_noise',
+                  'gating_solver','cells')
+        for name in shared:
+            if getattr(network,name) != getattr(self,name):
+                raise ValueError('the networks of a batch have to share %s'
+                                 % name)
+        if not np.array_equal(network.noisy,self.noisy):
+            raise ValueError('the networks of a batch have to share the '
+                             'noise of the populations')
+
+    def restart(self,state,spikes=False):
+        '''Returns a copy of a state (see integrate()) from which driven
+        trials can be started, e.g. the state of the network after a
+        warm-up without drive: the drive cell is reset (the drive starts at
+        the time step of the state) and, with spikes, the spike detection
+        starts anew.
+        Parameters
+        -----------------
+        state  : dict
+            The state.
+        spikes : bool
+            Whether the spikes will be detected.
+        Returns
+        -----------------
+        dict
+            The state.
+        '''
+        state = {name : np.array(state[name]) for name in
+                 ('step','theta','s','drive','noise_ex','noise_R')}
+        state['drive'][:] = 0.0
+        if spikes:
+            empty = np.zeros((0,),dtype=np.intp)
+            phase = np.mod(state['theta'],2*np.pi)
+            state['spikes'] = {name : {'below' : np.ravel(phase[:,cells]
+                                                          < np.pi),
+                                       'traces' : empty, 'steps' : empty}
+                               for name,cells in self.cells.items()}
+        return state
+
+    def _snapshot(self,step,theta,s,drive,noise_ex,noise_R,recorders):
+        '''Returns a copy of the state of an integration (see integrate()).
+        '''
+        n_trials = len(theta)
+        state = {'step' : np.array(np.broadcast_to(step,(n_trials,))),
+                 'theta' : np.array(theta), 's' : np.array(s),
+                 'drive' : np.array(drive),
+                 'noise_ex' : np.reshape(noise_ex,(n_trials,-1)).copy(),
+                 'noise_R' : np.reshape(noise_R,(n_trials,-1)).copy()}
+        if recorders is not None:
+            state['spikes'] = {name : recorder.state()
+                               for name,recorder in recorders.items()}
+        return state
+
+    def _integrateBatch(self,spike_trains,b_drive,n_steps,meg,traces,
+                        recorders,profiler,networks,state,checkpoint,
+                        interval,results,dtype):
+        '''Advances all trials together with forward Euler (see
+        integrate()).'''
+        n_trials = len(spike_trains)
+        n = self.n_cells
+
+        # state at the current time step only
+        if state is None:
+            start = 1
+            theta = np.zeros((n_trials,n),dtype=dtype)
+            s = np.zeros((n_trials,n),dtype=dtype)
+            # phase and gating variable of the drive cell
+            drive_cell = np.zeros((n_trials,),dtype=dtype)
+            s_d = np.zeros((n_trials,),dtype=dtype)
+        else:
+            start = int(state['step'][0])
+            if np.any(np.asarray(state['step']) != start):
+                raise ValueError('the trials of the state are at different '
+                                 'time steps (continue it with the numba '
+                                 'backend)')
+            theta = np.array(state['theta'],dtype=dtype)
+            s = np.array(state['s'],dtype=dtype)
+            drive_cell = np.array(state['drive'][:,0],dtype=dtype)
+            s_d = np.array(state['drive'][:,1],dtype=dtype)
+
+        # the parameters of the trials (with a trial axis for variants)
+        shared = all(network is self for network in networks)
+        if shared:
+            B = self.bias(n_steps)[:,np.newaxis]
+            G = self.G
+            m = self.m
+            g_d = self.g_d
+            tau_s = self.tau_s
+        else:
+            B = [network.bias(n_steps) for network in networks]
+            rows = max(b.shape[0] for b in B)
+            B = np.stack([np.broadcast_to(b,(rows,n)) for b in B],axis=1)
+            G = np.array([network.G for network in networks])
+            m = np.array([network.m for network in networks])
+            g_d = np.array([network.g_d for network in networks])
+            tau_s = np.array([network.tau_s for network in networks])
+        B,G,m,g_d,tau_s,b_drive = [np.asarray(values,dtype=dtype) for values
+                                   in (B,G,m,g_d,tau_s,b_drive)]
+        varying = B.shape[0] > 1
+        recorded = [(self.cells[name],trace) for name,trace in traces.items()
+                    if trace is not None]
+
+        # Noise filter (sums the noise EPSPs recursively)
+        noise = noiseFilter([train for trains in spike_trains
+                             for train in trains],n_steps,self.dt,self.A,
+                            self.tau_noise,self.tau_R)
+        if state is not None:
+            noise.t = start-1
+            noise.state_ex[:] = np.ravel(state['noise_ex'])
+            noise.state_R[:] = np.ravel(state['noise_R'])
+        if profiler:
+            profiler.lap('spike_trains')
+            profiler.count('noise_events',len(noise.cells))
+
+        for t in range(start,n_steps):
+            # calculate noise
+            N = noise.step().reshape((n_trials,n)).astype(dtype,copy=False)
+            if profiler:
+                profiler.lap('noise')
+
+            # total synaptic input (from the previous time step)
+            if shared:
+                S = np.dot(s,G)+g_d*s_d[:,np.newaxis]
+            else:
+                S = (np.matmul(s[:,np.newaxis,:],G)[:,0,:]
+                     +g_d*s_d[:,np.newaxis])
+            if meg is not None:
+                # the MEG signal (from the previous time step)
+                meg[:,t] = np.dot(s,m) if shared else np.sum(s*m,axis=1)
+            if profiler:
+                profiler.lap('synaptic_input')
+
+            # evolve gating variables
+            h = np.exp(-1.0*self.eta*(1+np.cos(theta)))
+            s = self.gatingStep(s,h,tau_s)
+            h = np.exp(-1.0*self.eta*(1+np.cos(drive_cell)))
+            s_d = self.gatingStep(s_d,h,self.tau_drive)
+            if profiler:
+                profiler.lap('gating')
+
+            # evolve drive cell
+            part_a = (1-np.cos(drive_cell))
+            part_b = b_drive*(1+np.cos(drive_cell))
+            drive_cell = drive_cell+self.dt*(part_a+part_b)
+            if profiler:
+                profiler.lap('drive')
+
+            # evolve theta
+            B_t = B[t] if varying else B[0]
+            part_a = (1-np.cos(theta))
+            part_b = (B_t+S+N)*(1+np.cos(theta))
+            theta = theta+self.dt*(part_a+part_b)
+            if profiler:
+                profiler.lap('theta')
+
+            # record the requested outputs
+            for cells,trace in recorded:
+                trace[:,:,t] = theta[:,cells]
+            if recorders is not None:
+                for name,recorder in recorders.items():
+                    recorder.update(t,theta[:,self.cells[name]])
+            if profiler:
+                profiler.lap('record')
+
+            if checkpoint is not None and (t+1) % interval == 0 and \
+                    t+1 < n_steps:
+                checkpoint(self._snapshot(t+1,theta,s,
+                                          np.stack([drive_cell,s_d],axis=1),
+                                          noise.state_ex,noise.state_R,
+                                          recorders))
+                if profiler:
+                    profiler.lap('checkpoint')
+
+        results['state'] = self._snapshot(n_steps,theta,s,
+                                          np.stack([drive_cell,s_d],axis=1),
+                                          noise.state_ex,noise.state_R,
+                                          recorders)
+
+    def _integrateTrials(self,spike_trains,b_drive,n_steps,meg,traces,
+                         recorders,integrator,tolerance,profiler,results,
+                         networks,state,checkpoint,interval):
+        '''Integrates the trials one after the other with the compiled
+        kernel or the adaptive integrator (see integrate()).
+
+        The phases of a time step cannot be timed separately, the profile
+        distinguishes the integration and the recording only.
+        '''
+        stacked = {}
+        phase = 'adaptive' if integrator == 'adaptive' else 'kernel'
+        # the kernels compute (and write the MEG signal) in double precision
+        converted = meg is not None and meg.dtype != np.float64
+        if integrator == 'adaptive':
+            results['integration_stats'] = []
+        else:
+            # the state of all trials (the kernel updates the rows in place)
+            n_trials = len(spike_trains)
+            if state is None:
+                state = {'step' : np.ones((n_trials,),dtype=int),
+                         'theta' : np.zeros((n_trials,self.n_cells)),
+                         's' : np.zeros((n_trials,self.n_cells)),
+                         'drive' : np.zeros((n_trials,2)),
+                         'noise_ex' : np.zeros((n_trials,self.n_cells)),
+                         'noise_R' : np.zeros((n_trials,self.n_cells))}
+            else:
+                state = {name : np.array(state[name],
+                                         dtype=int if name == 'step'
+                                         else float)
+                         for name in ('step','theta','s','drive','noise_ex',
+                                      'noise_R')}
+
+        for i,trains in enumerate(spike_trains):
+            if integrator == 'euler':
+                noise = noiseFilter(trains,n_steps,self.dt,self.A,
+                                    self.tau_noise,self.tau_R)
+                noise.state_ex = state['noise_ex'][i]
+                noise.state_R = state['noise_R'][i]
+                trial = {name : state[name][i] for name in
+                         ('theta','s','drive')}
+                trial['step'] = state['step'][i]
+            if profiler:
+                profiler.lap('spike_trains')
+                profiler.count('noise_events',
+                               sum(len(train) for train in trains))
+
+            def segment(t,theta):
+                if profiler:
+                    profiler.lap(phase)
+                for name,cells in self.cells.items():
+                    trace = traces.get(name)
+                    if trace is not None:
+                        trace[i,:,t:t+theta.shape[1]] = theta[cells]
+                    if recorders is not None:
+                        size = cells.stop-cells.start
+                        recorders[name].updateBlock(t,theta[cells],i*size)
+                if profiler:
+                    profiler.lap('record')
+                if integrator == 'euler':
+                    stop = t+theta.shape[1]
+                    state['step'][i] = stop
+                    if checkpoint is not None and stop < n_steps and \
+                            stop//interval > t//interval:
+                        checkpoint(self._snapshot(state['step'],
+                                                  state['theta'],state['s'],
+                                                  state['drive'],
+                                                  state['noise_ex'],
+                                                  state['noise_R'],recorders))
+                        if profiler:
+                            profiler.lap('checkpoint')
+
+            if id(networks[i]) not in stacked:
+                stacked[id(networks[i])] = networks[i].stacked(n_steps)
+            network = stacked[id(networks[i])]
+            network['b_drive'] = b_drive[i]
+            trial_meg = None if meg is None else meg[i]
+            if converted:
+                trial_meg = np.array(trial_meg,dtype=np.float64)
+            if integrator == 'adaptive':
+                stats = adaptive.integrate(network,trains,n_steps,trial_meg,
+                                           segment,tolerance)[1]
+                results['integration_stats'].append(stats)
+            else:
+                kernel.integrate(network,noise,n_steps,trial_meg,segment,
+                                 state=trial)
+                state['step'][i] = n_steps
+            if converted:
+                meg[i] = trial_meg
+            if profiler:
+                profiler.lap(phase)
+
+        if integrator == 'euler':
+            results['state'] = self._snapshot(state['step'],state['theta'],
+                                              state['s'],state['drive'],
+                                              state['noise_ex'],
+                                              state['noise_R'],recorders)
+
+
+def gatingToleranceReport(model,conditions=None,
+                          drive_frequencies=(40.0,30.0,20.0),
+                          seeds=tuple(range(1,11)),time=500.0,coarse=2**10,
+                          fine=2**16):
+    '''Measures the accuracy of the exponential gating update at a coarse
+    time step.
+
+    Every trial is run with the exponential update (see
+    networkEngine.gatingStep()) with the time step time/coarse and, as the
+    reference, with forward Euler with the time step time/fine. The power
+    at the drive frequency (see entrainment.entrainmentMeasures()) of the
+    two runs is compared for the single trials and for the average over
+    the seeds.
+    Parameters
+    -----------------
+    model             : object
+        A simpleModel or simpleModelFsLts instance (e.g. with the numba
+        backend).
+    conditions        : dict
+        Maps condition names to model parameters (e.g. sweep.CONDITIONS;
+        default: the parameters of the model).
+    drive_frequencies : tuple
+        The drive frequencies (in Hz).
+    seeds             : tuple
+        The seeds of the trials.
+    time              : float
+        The duration of the simulations.
+    coarse            : int
+        The number of time steps of the runs with the exponential update.
+    fine              : int
+        The number of time steps of the reference runs.
+    Returns
+    -----------------
+    dict
+        Maps (condition,drive frequency) to a dict of the relative
+        differences of the drive power of the single trials ('trials', one
+        per seed) and of the drive power averaged over the seeds
+        ('average').
+    '''
+    conditions = {'default' : {}} if conditions is None else conditions
+    report = {}
+    for condition,params in conditions.items():
+        for f in drive_frequencies:
+            power = {}
+            for name,solver,n_steps in (('coarse','exponential',coarse),
+                                        ('fine','euler',fine)):
+                power[name] = []
+                for seed in seeds:
+                    trial = copy.copy(model)
+                    for key,value in params.items():
+                        setattr(trial,key,value)
+                    trial.seed = seed
+                    trial.drive_frequency = f
+                    trial.dt = float(time)/n_steps
+                    trial.gating_solver = solver
+                    meg = trial.run(time,record=('meg',))[0]
+                    psd,freqs = spectral.powerSpectrum(meg,trial.dt,time)
+                    power[name].append(
+                        entrainmentMeasures(psd,freqs,f)['power_drive'])
+            coarse_power = np.array(power['coarse'])
+            fine_power = np.array(power['fine'])
+            report[(condition,f)] = {
+                'trials' : np.abs(coarse_power-fine_power)/fine_power,
+                'average' : (abs(np.mean(coarse_power)-np.mean(fine_power))
+                             /np.mean(fine_power))}
+    return report
+
+
+if __name__ == '__main__':
+    from simple_model_class import simpleModel
+    from simple_model_fs_lts_class import simpleModelFsLts
+    from sweep import CONDITIONS
+
+    print('model             condition      f  single trials (min-max)  '
+          'average')
+    for model,conditions in ((simpleModel(backend='numba'),CONDITIONS),
+                             (simpleModelFsLts(backend='numba'),None)):
+        report = gatingToleranceReport(model,conditions)
+        for (condition,f),result in report.items():
+            print('%-17s %-13s %3g  %10.1f%% - %5.1f%%  %7.1f%%'
+                  % (type(model).__name__,condition,f,
+                     100*np.min(result['trials']),
+                     100*np.max(result['trials']),100*result['average']))
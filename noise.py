@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (c) 2017, Christoph Metzner
+# Distributed under the (new) BSD License.
+#
+# Contributors: Christoph Metzner (c.metzner@herts.ac.uk)
+# -----------------------------------------------------------------------------
+# References:
+#
+# * Vierling-Claassen, D., Siekmeier, P., Stufflebeam, S., & Kopell, N. (2008).
+#   Modeling GABA alterations in schizophrenia: a link between impaired
+#   inhibition and altered gamma and beta range auditory entrainment.
+#   Journal of neurophysiology, 99(5), 2656-2671.
+# -----------------------------------------------------------------------------
+# The Poissonian background noise shared by the model classes.
+#
+# -----------------------------------------------------------------------------
+import random
+
+import numpy as np
+
+
+class noiseFilter(object):
+    '''Recursive evaluation of the background noise of a population.
+
+    The noise a cell receives at time t is the sum of double exponential EPSPs
+
+        A*(exp(-(t-tn)/tau_ex)-exp(-(t-tn)/tau_R))/(tau_ex-tau_R)
+
+    over all noise spikes tn<t of its spike train. Instead of re-evaluating
+    this sum over the whole spike train at every time step, two exponentially
+    decaying state variables are kept per cell (one for each time constant).
+    The noise spikes are binned onto the time grid once, and every time step
+    only decays the states and adds the spikes of the current bin, i.e. the
+    work per time step is constant in the length of the spike trains.
+
+    Attributes
+    -----------------
+    spike_trains : list
+        A list containing lists of noise spike times (one per cell).
+    n_steps      : int
+        number of time steps of the simulation
+    dt           : float
+        time step
+    A            : float
+        scaling factor for the background noise strength
+    tau_ex       : float
+        exc. synaptic decay time
+    tau_R        : float
+        synaptic rise time
+    '''
+
+    def __init__(self,spike_trains,n_steps,dt,A,tau_ex,tau_R):
+        self.n_cells = len(spike_trains)
+        self.n_steps = n_steps
+        self.dt = dt
+        self.scale = A/(tau_ex-tau_R)
+        self.decay_ex = np.exp(-dt/tau_ex)
+        self.decay_R = np.exp(-dt/tau_R)
+
+        # flatten the spike trains
+        counts = [len(train) for train in spike_trains]
+        cells = np.repeat(np.arange(self.n_cells),counts)
+        if len(cells):
+            times = np.concatenate([np.asarray(train,dtype=float)
+                                    for train in spike_trains])
+        else:
+            times = np.zeros((0,))
+
+        # a noise spike contributes from the first time step t with t*dt>tn
+        # onwards (the same comparison as in the direct evaluation)
+        steps = np.floor(times/dt).astype(int)+1
+        steps = np.where((steps-1)*dt-times>0,steps-1,steps)
+        steps = np.where(steps*dt-times>0,steps,steps+1)
+        keep = steps<n_steps
+        steps = steps[keep]
+        cells = cells[keep]
+        times = times[keep]
+
+        # sort the spikes by time bin
+        order = np.argsort(steps,kind='stable')
+        self.steps = steps[order]
+        self.cells = cells[order]
+        # contribution of each spike at the end of its time bin
+        lag = self.steps*dt-times[order]
+        self.weights_ex = np.exp(-lag/tau_ex)
+        self.weights_R = np.exp(-lag/tau_R)
+        self.offsets = np.searchsorted(self.steps,np.arange(n_steps+1))
+
+        self.reset()
+
+    def reset(self):
+        '''Resets the filter to the beginning of the simulation.'''
+        self.t = 0
+        self.state_ex = np.zeros((self.n_cells,))
+        self.state_R = np.zeros((self.n_cells,))
+
+    def step(self):
+        '''Advances the filter by one time step.
+        Returns
+        -----------------
+        ndarray
+            1D array containing the noise of every cell at the new time step.
+        '''
+        self.t = self.t+1
+        self.state_ex *= self.decay_ex
+        self.state_R *= self.decay_R
+
+        start = self.offsets[self.t]
+        stop = self.offsets[self.t+1]
+        if stop>start:
+            cells = self.cells[start:stop]
+            np.add.at(self.state_ex,cells,self.weights_ex[start:stop])
+            np.add.at(self.state_R,cells,self.weights_R[start:stop])
+
+        return self.scale*(self.state_ex-self.state_R)
+
+
+def noiseSpikeTrains(sizes,rate,time,seed,source='legacy'):
+    '''Generates the Poissonian noise spike trains of one trial.
+    Parameters
+    -----------------
+    sizes  : list
+        The number of cells of every population.
+    rate   : float
+        The rate of the spike trains (in 1/ms).
+    time   : float
+        The duration of the simulation.
+    seed   : int
+        The seed of the trial.
+    source : str
+        'legacy' reproduces the spike trains of the random module,
+        'generator' uses numpy.random.Generator streams (see
+        poissonSpikeTrains()).
+    Returns
+    -----------------
+    list
+        A list containing, for every population, a list of the spike
+        trains of its cells.
+    '''
+    if source == 'legacy':
+        return legacySpikeTrains(sizes,rate,time,seed)
+    if source == 'generator':
+        return poissonSpikeTrains(sizes,rate,time,seed)
+    raise ValueError("source has to be 'legacy' or 'generator'")
+
+
+def legacySpikeTrains(sizes,rate,time,seed):
+    '''Generates the noise spike trains exactly as the original
+    implementation did, i.e. by summing exponentially distributed intervals
+    drawn with random.expovariate() from a generator seeded with seed, cell
+    by cell and population by population. A private random.Random instance
+    is used, so the result does not depend on (nor change) the state of the
+    global random module.
+    '''
+    return noiseStream(sizes,rate,seed,'legacy').advance(time)
+
+
+def poissonSpikeTrains(sizes,rate,time,seed):
+    '''Generates the noise spike trains with numpy.random.Generator streams.
+
+    The seed of the trial initialises a numpy.random.SeedSequence which
+    spawns an independent stream for every population. The spike counts of
+    all cells of a population are drawn in one call (Poisson distributed
+    with mean rate*time), followed by one call for the (uniformly
+    distributed) spike times. Trials are therefore reproducible and
+    independent of any global random state.
+    '''
+    return noiseStream(sizes,rate,seed,'generator').advance(time)
+
+
+class noiseStream(object):
+    '''The noise spike trains of one trial, generated up to a time that can
+    be extended later on (e.g. to continue a simulation from a checkpoint).
+
+    The first call of advance() generates the spike trains of
+    legacySpikeTrains() or poissonSpikeTrains(). Further calls continue them
+    from the state of the random number generators: 'legacy' continues every
+    cell from its next spike (drawn before, but beyond the previous time),
+    'generator' draws the spikes of the additional interval from the
+    continued streams. The spike trains stay Poissonian over the whole time
+    but differ from the ones generated at once for the longer time, as the
+    original implementation draws the intervals cell by cell.
+
+    Attributes
+    -----------------
+    sizes  : list
+        The number of cells of every population.
+    rate   : float
+        The rate of the spike trains (in 1/ms).
+    seed   : int
+        The seed of the trial.
+    source : str
+        'legacy' or 'generator' (see noiseSpikeTrains()).
+    time   : float
+        The time up to which the spike trains have been generated.
+    trains : list
+        For every population a list of the spike trains of its cells.
+    '''
+
+    def __init__(self,sizes,rate,seed,source='legacy'):
+        if source not in ('legacy','generator'):
+            raise ValueError("source has to be 'legacy' or 'generator'")
+        self.sizes = [int(n) for n in sizes]
+        self.rate = rate
+        self.seed = int(seed)
+        self.source = source
+        self.time = 0.0
+        if source == 'legacy':
+            self.generator = random.Random(self.seed)
+            # the first spike of every cell beyond the generated time
+            self.pending = [None]*sum(self.sizes)
+            self.trains = [[[] for i in range(n)] for n in self.sizes]
+        else:
+            streams = np.random.SeedSequence(self.seed).spawn(len(sizes))
+            self.generators = [np.random.default_rng(stream)
+                               for stream in streams]
+            self.trains = [[np.zeros((0,)) for i in range(n)]
+                           for n in self.sizes]
+
+    def advance(self,time):
+        '''Generates the spikes up to time.
+        Parameters
+        -----------------
+        time : float
+            The new end of the spike trains (not before the current one).
+        Returns
+        -----------------
+        list
+            The spike trains (see the attribute trains).
+        '''
+        if time < self.time:
+            raise ValueError('the spike trains are generated up to %g ms '
+                             'already' % self.time)
+        if self.source == 'legacy':
+            k = 0
+            for population in self.trains:
+                for template_spike_array in population:
+                    # Produce Poissonian spike train
+                    total_time = self.pending[k]
+                    if total_time is None:
+                        total_time = 0.0
+                    elif total_time < time:
+                        template_spike_array.append(total_time)
+                    while total_time < time:
+                        next_time = self.generator.expovariate(self.rate)
+                        total_time = total_time + next_time
+                        if total_time < time:
+                            template_spike_array.append(total_time)
+                    self.pending[k] = total_time
+                    k = k+1
+        else:
+            for p,(n,generator) in enumerate(zip(self.sizes,self.generators)):
+                counts = generator.poisson(self.rate*(time-self.time),size=n)
+                times = generator.uniform(self.time,time,size=counts.sum())
+                new = np.split(times,np.cumsum(counts)[:-1])
+                self.trains[p] = [np.concatenate([train,np.sort(spikes)])
+                                  for train,spikes in zip(self.trains[p],new)]
+        self.time = float(time)
+        return self.trains
+
+    def state(self):
+        '''Returns the state of the stream (including the spike trains) as a
+        JSON serialisable dict.'''
+        state = {'sizes' : self.sizes, 'rate' : self.rate, 'seed' : self.seed,
+                 'source' : self.source, 'time' : self.time,
+                 'trains' : [[[float(spike) for spike in train]
+                              for train in population]
+                             for population in self.trains]}
+        if self.source == 'legacy':
+            version,internal,gauss = self.generator.getstate()
+            state['generator'] = [version,list(internal),gauss]
+            state['pending'] = self.pending
+        else:
+            state['generators'] = [generator.bit_generator.state
+                                   for generator in self.generators]
+        return state
+
+    @classmethod
+    def restore(cls,state):
+        '''Continues a stream from a state returned by state().'''
+        stream = cls(state['sizes'],state['rate'],state['seed'],
+                     state['source'])
+        stream.time = state['time']
+        if stream.source == 'legacy':
+            version,internal,gauss = state['generator']
+            stream.generator.setstate((version,tuple(internal),gauss))
+            stream.pending = list(state['pending'])
+            stream.trains = [[list(train) for train in population]
+                             for population in state['trains']]
+        else:
+            for generator,bit_state in zip(stream.generators,
+                                           state['generators']):
+                generator.bit_generator.state = bit_state
+            stream.trains = [[np.asarray(train,dtype=float)
+                              for train in population]
+                             for population in state['trains']]
+        return stream
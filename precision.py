@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+# ------------------------------------------------------------------------------
+# Copyright (c) 2020, Christoph Metzner
+# Distributed under the (new) BSD License.
+#
+# Contributors: Christoph Metzner (cmetzner@ni.tu-berlin.de)
+# ------------------------------------------------------------------------------
+# Accuracy of the single precision simulation mode (dtype='float32').
+#
+# The trials of the standard conditions (see sweep.CONDITIONS) are simulated
+# with the seeds and the time step of the exploration (see sweep.py) in
+# single and double precision and compared in the quantities the analyses
+# rely on: the MEG signals, the spike times and the power spectral densities
+# of the single trials and of the trial average (their peak frequency and
+# their power at the drive frequency, see entrainment.py). As the network is
+# chaotic, single spikes of the two runs eventually separate; the report
+# therefore distinguishes the signals (which diverge) from the statistics
+# the analyses use (which should not).
+#
+# ------------------------------------------------------------------------------
+import os
+
+import numpy as np
+
+from entrainment import entrainmentMeasures
+from simple_model_class import simpleModel
+import spectral
+from sweep import CONDITIONS
+
+
+def spikeAgreement(reference,spikes,window):
+    '''Compares two sets of spike times.
+    Parameters
+    -----------------
+    reference : tuple
+        The (offsets,times) of the reference spikes (see
+        spikes.spikeTimes()).
+    spikes    : tuple
+        The (offsets,times) of the compared spikes (same traces).
+    window    : float
+        The maximal shift of a matched spike.
+    Returns
+    -----------------
+    dict
+        The numbers of spikes ('reference_spikes', 'spikes'), the fraction
+        of the spikes of both sets that are matched within the window
+        ('matched') and the mean absolute shift of the matched spikes
+        ('mean_shift').
+    '''
+    offsets_a,times_a = reference
+    offsets_b,times_b = spikes
+    matched = 0
+    shifts = []
+    for i in range(len(offsets_a)-1):
+        a = times_a[offsets_a[i]:offsets_a[i+1]]
+        b = times_b[offsets_b[i]:offsets_b[i+1]]
+        if len(a) == 0 or len(b) == 0:
+            continue
+        # the nearest spike of b for every spike of a
+        index = np.clip(np.searchsorted(b,a),1,len(b)-1)
+        if len(b) > 1:
+            nearer = np.abs(b[index-1]-a) < np.abs(b[index]-a)
+            index = np.where(nearer,index-1,index)
+        else:
+            index = np.zeros(len(a),dtype=int)
+        shift = np.abs(b[index]-a)
+        hit = shift <= window
+        # every spike of b is matched at most once
+        matched = matched+len(np.unique(index[hit]))
+        shifts.append(shift[hit])
+    shifts = np.concatenate(shifts) if shifts else np.zeros((0,))
+    total = max(len(times_a),len(times_b))
+    return {'reference_spikes' : len(times_a), 'spikes' : len(times_b),
+            'matched' : matched/float(total) if total else 1.0,
+            'mean_shift' : np.mean(shifts) if len(shifts) else 0.0}
+
+
+def precisionReport(conditions=None,drive_frequencies=(40.0,30.0,20.0),
+                    seeds=None,time=500.0,window=1.0,**params):
+    '''Compares single with double precision simulations of the simple model.
+    Parameters
+    -----------------
+    conditions        : dict
+        Maps condition names to model parameters (default:
+        sweep.CONDITIONS).
+    drive_frequencies : tuple
+        The drive frequencies (in Hz).
+    seeds             : list
+        The seeds of the trials of every condition and drive frequency
+        (default: the seeds of the exploration, Seeds.npy).
+    time              : float
+        The duration of the simulations.
+    window            : float
+        The maximal shift (in ms) of matched spikes.
+    params            :
+        Further model parameters shared by all trials (e.g. backend; the
+        default time step is that of the exploration, time/2**13, see
+        sweep.py).
+    Returns
+    -----------------
+    dict
+        Maps (condition,drive frequency) to a dict of the maximal absolute
+        and relative (L2) differences of the MEG signals ('max_meg',
+        'relative_meg', maxima over the trials), the spike agreement of the
+        exc. and inh. cells ('spikes_ex', 'spikes_inh', see
+        spikeAgreement()), the peak frequency (in Hz) and the power at the
+        drive frequency of the average of the single-trial spectra and of
+        the spectrum of the average signal in both precisions ('psd' and
+        'evoked': 'peak_float64', 'peak_float32', 'power_float64',
+        'power_float32' and 'relative_power') and the relative (L2)
+        difference of the spectra ('relative_psd', 'relative_evoked').
+    '''
+    conditions = CONDITIONS if conditions is None else conditions
+    if seeds is None:
+        seeds = np.load(os.path.join(os.path.dirname(os.path.abspath(
+            __file__)),'Seeds.npy'))
+    seeds = [int(seed) for seed in seeds]
+    params.setdefault('dt',float(time)/2**13)
+    report = {}
+    for condition,values in conditions.items():
+        runs = {}
+        for dtype in ('float64','float32'):
+            settings = dict(params)
+            settings.update(values)
+            model = simpleModel(dtype=dtype,**settings)
+            megs = model.runBatch(seeds,list(drive_frequencies),time,
+                                  record=('meg','spikes'))[0]
+            runs[dtype] = (megs.astype(float),model.spike_times,model.dt,
+                           model.n_ex,model.n_inh)
+        reference,single = runs['float64'],runs['float32']
+        dt = reference[2]
+
+        for i,f in enumerate(drive_frequencies):
+            trials = slice(i*len(seeds),(i+1)*len(seeds))
+            a = reference[0][trials]
+            b = single[0][trials]
+            difference = b-a
+            result = {'max_meg' : np.max(np.abs(difference)),
+                      'relative_meg' : np.max(np.linalg.norm(difference,axis=1)
+                                              /np.linalg.norm(a,axis=1))}
+            for name,n_cells in (('ex',reference[3]),('inh',reference[4])):
+                cells = slice(trials.start*n_cells,trials.stop*n_cells+1)
+                result['spikes_'+name] = spikeAgreement(
+                    _select(reference[1][name],cells),
+                    _select(single[1][name],cells),window)
+
+            spectra = {dtype : spectral.trialSpectra(megs,dt,time)
+                       for dtype,megs in (('float64',a),('float32',b))}
+            for kind,name in (('mean','psd'),('evoked','evoked')):
+                entry = {}
+                for dtype in ('float64','float32'):
+                    measures = entrainmentMeasures(spectra[dtype][kind],
+                                                   spectra[dtype]['freqs'],f)
+                    entry['peak_'+dtype] = float(measures['peak_frequency'])
+                    entry['power_'+dtype] = float(measures['power_drive'])
+                entry['relative_power'] = (abs(entry['power_float32']
+                                               -entry['power_float64'])
+                                           /entry['power_float64'])
+                result[name] = entry
+                psd_a = spectra['float64'][kind]
+                psd_b = spectra['float32'][kind]
+                result['relative_'+name] = (np.linalg.norm(psd_b-psd_a)
+                                            /np.linalg.norm(psd_a))
+            report[(condition,f)] = result
+    return report
+
+
+def _select(spikes,traces):
+    '''Returns the (offsets,times) of a range of traces.'''
+    offsets,times = spikes
+    offsets = offsets[traces]
+    return offsets-offsets[0],times[offsets[0]:offsets[-1]]
+
+
+if __name__ == '__main__':
+    report = precisionReport()
+    print('condition      f  max MEG  rel. MEG  matched spikes (ex/inh)  '
+          'peak 64/32 (Hz)  rel. power  rel. PSD  rel. power (avg.)')
+    for (condition,f),result in report.items():
+        print('%-13s %3g  %7.1e  %8.1e  %11.3f / %5.3f  %7.2f / %5.2f  '
+              '%10.1e  %8.1e  %17.1e' % (condition,f,result['max_meg'],
+              result['relative_meg'],result['spikes_ex']['matched'],
+              result['spikes_inh']['matched'],result['psd']['peak_float64'],
+              result['psd']['peak_float32'],result['psd']['relative_power'],
+              result['relative_psd'],result['evoked']['relative_power']))
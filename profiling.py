@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (c) 2017, Christoph Metzner
+# Distributed under the (new) BSD License.
+#
+# Contributors: Christoph Metzner (c.metzner@herts.ac.uk)
+# -----------------------------------------------------------------------------
+# Lightweight instrumentation of the phases of a simulation.
+#
+# -----------------------------------------------------------------------------
+import time as timer
+
+
+class phaseProfiler(object):
+    '''Accumulates the wall time spent in the phases of a simulation.
+
+    The time between two calls of lap() is attributed to the phase named in
+    the second call, i.e. the phases of a time step are timed by calling
+    lap() at the end of each of them. The integration loops only call the
+    profiler if profiling was requested, so disabled profiling costs one
+    comparison per phase.
+    '''
+
+    def __init__(self):
+        self.times = {}
+        self.calls = {}
+        self.counters = {}
+        self.start = timer.perf_counter()
+        self.last = self.start
+
+    def reset(self):
+        '''Starts timing the next phase (discarding the time since the
+        last lap).'''
+        self.last = timer.perf_counter()
+
+    def lap(self,phase):
+        '''Attributes the time since the last lap to phase.'''
+        now = timer.perf_counter()
+        self.times[phase] = self.times.get(phase,0.0)+(now-self.last)
+        self.calls[phase] = self.calls.get(phase,0)+1
+        self.last = now
+
+    def count(self,name,n=1):
+        '''Increments the counter name by n.'''
+        self.counters[name] = self.counters.get(name,0)+n
+
+    def report(self):
+        '''Returns the profile as a dict.
+        Returns
+        -----------------
+        dict
+            'total' (the wall time since the creation of the profiler, in
+            s), 'phases' (mapping every phase to its accumulated time, the
+            fraction of the total time and the number of laps) and
+            'counters'.
+        '''
+        total = timer.perf_counter()-self.start
+        phases = {phase : {'time' : time,
+                           'fraction' : time/total if total > 0 else 0.0,
+                           'calls' : self.calls[phase]}
+                  for phase,time in self.times.items()}
+        return {'total' : total, 'phases' : phases,
+                'counters' : dict(self.counters)}
+
+
+def formatReport(report):
+    '''Formats a profile report (see phaseProfiler.report()) as a table.'''
+    lines = ['%-16s %10s %7s' % ('phase','time [s]','share')]
+    for phase,entry in sorted(report['phases'].items(),
+                              key=lambda item: -item[1]['time']):
+        lines.append('%-16s %10.4f %6.1f%%' % (phase,entry['time'],
+                                               100*entry['fraction']))
+    lines.append('%-16s %10.4f' % ('total',report['total']))
+    for name,value in sorted(report['counters'].items()):
+        lines.append('%-16s %10d' % (name,value))
+    return '\n'.join(lines)
@@ -17,6 +17,7 @@
 # ------------------------------------------------------------------------------
 import numpy as np
 from simple_model_class import simpleModel
+from store import trialStore
 
 
 
@@ -62,8 +63,8 @@ seeds = np.load('Seeds.npy')
 
 g_de = 0.275  # default 0.3
 
-filename = 'drive_0275_g_and_tau_inh'  # 'drive_05_g_and_tau_inh'    # filename, in case data is recorded
-directory = 'Exploration/Input_Strength_0275/G_and_Tau_Inh/'  # directory where data will be stored
+condition = 'g_and_tau_inh'  # 'control', 'tau_inh', 'g_inh' or 'g_and_tau_inh'
+store = trialStore('Exploration/store', dt=dt)  # store where data will be recorded
 
 
 
@@ -73,17 +74,10 @@ directory = 'Exploration/Input_Strength_0275/G_and_Tau_Inh/'  # directory where
 
 
 
-for f in drive_frequencies:
-	print(f)
-	for i in seeds:
-		print(i)
-		model = simpleModel(drive_frequency=f, background_rate=background_rate,
-							A=A, dt=dt, tau_inh=tau_inh, g_de=g_de, g_ie=g_ie,
-							g_ii=g_ii, b_inh=b_inh, seed=i, filename=filename + "drive_strength_"+str(g_de)+
-							"_drive_frequency_"+str(f)+"_seed_" + str(i), directory=directory)
-		meg, ex, inh = model.run(time, 1, 0, 0)
-
-
-
-
+# all seeds and drive frequencies are simulated in one vectorized pass
+model = simpleModel(background_rate=background_rate, A=A, dt=dt, tau_inh=tau_inh,
+					g_de=g_de, g_ie=g_ie, g_ii=g_ii, b_inh=b_inh)
+megs, ex, inh = model.runBatch(seeds, drive_frequencies, time, record=('meg',))
 
+keys = [(condition, g_de, f, i) for f in drive_frequencies for i in seeds]
+store.writeMany(keys, megs)
@@ -15,10 +15,18 @@
 # The main class implementing the model of the replication study.
 #
 # -----------------------------------------------------------------------------
-import random
+import copy
+import os
+
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.mlab as mlab
+
+from cache import trialKey
+from checkpoint import loadCheckpoint, saveCheckpoint
+from network import checkOptions, networkEngine, population, projection
+from noise import noiseSpikeTrains, noiseStream
+from profiling import phaseProfiler
+import spectral
+from spikes import spikeTimes, spikeTrains
 
 
 
@@ -66,13 +74,82 @@ class simpleModel(object):
     A        : float
         scaling factor for the background noise strength
     seed        : int
-        seed for the random number generator
+        seed for the random number generator (an array gives every point 
+        of the parameter axis its own seed, see below)
+    gating      : str
+        connectivity of the synaptic gating variables: 'matrix' reproduces 
+        the original model (one gating variable per pair of cells, see 
+        _connectivity()), 'vector' applies the connectivity attribute; both
+        are integrated with one gating variable per presynaptic cell (see 
+        network.py)
+    connectivity : dict
+        weight matrices of shape (n_pre,n_post) for the projections 'ee', 
+        'ei', 'ie' and 'ii' (only used with gating='vector'); missing 
+        projections default to the connectivity of the matrix representation
+        (see _connectivity())
+    noise_source : str
+        generator of the noise spike trains: 'legacy' reproduces the spike 
+        trains of earlier versions (random module), 'generator' draws them 
+        with numpy.random.Generator streams (see noise.noiseSpikeTrains())
+    backend     : str
+        implementation of the time loop: 'numpy' or 'numba' (a compiled 
+        kernel, see kernel.py; falls back to 'numpy' with a warning if numba
+        is not installed)
+    integrator  : str
+        integration scheme: 'euler' (forward Euler with the time step dt) or
+        'adaptive' (an adaptive Runge-Kutta 3(2) scheme whose solution is 
+        resampled onto the time grid of dt, see adaptive.py; it always uses
+        NumPy)
+    tolerance   : float
+        maximal local error per step of the adaptive integrator
+    gating_solver : str
+        update of the synaptic gating variables: 'euler' (forward Euler) or
+        'exponential' (exact for the phase of the previous time step, see 
+        network.networkEngine.gatingStep()); the adaptive integrator 
+        ignores it. With 8 times the time step of the exploration 
+        (dt=500/2**10) forward Euler diverges, whereas the exponential 
+        update keeps the power at the drive frequency close to forward 
+        Euler with dt=500/2**16. Over the conditions of sweep.CONDITIONS 
+        and 10 seeds (network.gatingToleranceReport()) the power of single
+        trials differs by up to 15% (40 Hz drive), 20% (30 Hz) and 53% 
+        (20 Hz), and the power averaged over the seeds by up to 13%, 8% 
+        and 23%, as spike timing jitter decorrelates the trials; other 
+        parameters can deviate further
+    dtype       : str
+        floating point type of the integration state and the outputs 
+        (also of the stored files): 'float64' or 'float32' (halves the 
+        memory traffic of the synaptic input; the compiled kernel and the 
+        adaptive integrator compute in double precision and only store 
+        their outputs in single precision; see precision.py for the 
+        accuracy)
+
+    Parameter axis: the weights, tau_inh and the applied currents (see 
+    grid_parameters) can be arrays of the values at P points of a parameter
+    grid (e.g. conditions x drive strengths, flattened). The weights and 
+    tau_inh are then 1D arrays of length P; b_ex and b_inh, which may 
+    already be per-cell (cells,) or time-dependent (time points,cells) 
+    arrays, get the parameter axis as an additional leading axis, e.g. 
+    (P,1) for one current per point or (P,cells). Arrays of length 1 and 
+    scalars are shared by all points. All points are integrated together in
+    one vectorized time loop and the outputs of run() and runBatch() get a 
+    leading parameter axis; every point reproduces the run of a model with 
+    the according scalar parameters and seed.
     '''
 
+    # names of the outputs of run()
+    outputs = ('meg','ex','inh')
+
+    # parameters that can be arrays along the parameter axis
+    grid_parameters = ('g_ee','g_ei','g_ie','g_ii','g_de','g_di','tau_inh',
+                       'b_ex','b_inh')
+
     def __init__(self,n_ex=20,n_inh=10,eta=5.0,tau_R=0.1,tau_ex=2.0,tau_inh=8.0,
         g_ee=0.015,g_ei=0.025,g_ie=0.015,g_ii=0.02,g_de=0.3,g_di=0.08,dt=0.05,
         b_ex=-0.01,b_inh=-0.01,drive_frequency=0.0,background_rate=33.3,A=0.5,
-        seed=12345,filename='default',directory='/'):
+        seed=12345,filename='default',directory='/',gating='matrix',
+        connectivity=None,noise_source='legacy',backend='numpy',
+        integrator='euler',tolerance=1e-4,gating_solver='euler',
+        dtype='float64'):
         self.n_ex = n_ex
         self.n_inh = n_inh
         self.eta = eta
@@ -94,9 +171,24 @@ class simpleModel(object):
         self.seed = seed
         self.filename = filename
         self.directory = directory
+        self.connectivity = connectivity
+        self.tolerance = tolerance
+        options = checkOptions(gating=gating,noise_source=noise_source,
+                               backend=backend,integrator=integrator,
+                               gating_solver=gating_solver,dtype=dtype)
+        for name,value in options.items():
+            setattr(self,name,value)
         
-    def run(self,time=100.0,saveMEG=0,saveEX=0,saveINH=0):
+    def run(self,time=100.0,saveMEG=0,saveEX=0,saveINH=0,
+            record=('meg','ex','inh'),profile=False,checkpoint=None,
+            interval=None):
         '''Runs the model and returns (and stores) the results
+
+        Only the current state of the network is kept during the 
+        integration; full time series are only allocated for the outputs
+        that are recorded (or stored). Passing e.g. record=('meg',) therefore 
+        runs the model in a streaming fashion whose memory does not depend 
+        on the simulation time apart from the MEG signal itself.
             
         Parameters
         -----------------
@@ -110,204 +202,597 @@ class simpleModel(object):
         saveINH : int
             A flag that signalises whether the inh.population activity 
             should be stored
+        record  : tuple
+            The outputs to record, any of 'meg', 'ex' and 'inh'. Outputs 
+            that should be stored are always recorded. With 'spikes' the 
+            spike times of all cells are detected during the integration 
+            and stored in the attribute spike_times, a dict mapping 'ex' 
+            and 'inh' to the (offsets,times) format of spikes.spikeTimes();
+            record=('spikes',) thus yields rasters and rates without any
+            theta traces.
+        profile : bool
+            A flag that signalises whether the time spent in the phases of
+            the simulation (noise, synaptic input, gating, drive cell, 
+            theta, recording, saving) and counters (time steps, noise 
+            events, spikes) should be collected; the report (see 
+            profiling.phaseProfiler.report()) is stored in the attribute 
+            profile_report.
+        checkpoint : str
+            The name of a checkpoint file. The state of the run (phases, 
+            gating variables, drive cell, noise filters, random number 
+            generators, time step and the outputs so far) is written to it 
+            every interval and at the end (see checkpoint.py). If the file 
+            exists, the run is continued from it: an interrupted run is 
+            completed, a finished one returns its results or, for a longer 
+            time, is continued to it (the noise spike trains of the added 
+            time are drawn from the saved generator states). The model, the 
+            recorded outputs and the seed have to be the same; not supported
+            by the adaptive integrator.
+        interval   : float
+            The simulated time (in ms) between the checkpoints (None: only 
+            at the end).
+        Returns
+        -----------------
+        ndarray,ndarray,ndarray
+            The MEG signal and the traces of the exc. and inh. cells (None 
+            for outputs that were not recorded), with a leading parameter 
+            axis if the model has array parameters (also in the stored 
+            files).
         '''
-        # number of time steps 
-        time_points = np.linspace(0,time,int(time/self.dt)) 
-        
-        # Initialisations
+        profiler = phaseProfiler() if profile else None
+        record = set(record)
+        if saveMEG:
+            record.add('meg')
+        if saveEX:
+            record.add('ex')
+        if saveINH:
+            record.add('inh')
 
-        # the pacemaking drive cell
-        drive_cell  =   np.zeros((len(time_points),))    
-        
-        # exc. neurons
-        theta_ex = np.zeros((self.n_ex,len(time_points)))        
-        # inh. neurons
-        theta_inh = np.zeros((self.n_inh,len(time_points)))        
-        
-        # E-E snyaptic gating variables
-        s_ee = np.zeros((self.n_ex,self.n_ex,len(time_points))) 
-        # E-I snyaptic gating variables    
-        s_ei = np.zeros((self.n_ex,self.n_inh,len(time_points)))    
-        # I-E snyaptic gating variables
-        s_ie = np.zeros((self.n_inh,self.n_ex,len(time_points)))
-        # I-I snyaptic gating variables    
-        s_ii = np.zeros((self.n_inh,self.n_inh,len(time_points)))    
-        # Drive-E snyaptic gating variables
-        s_de = np.zeros((self.n_ex,len(time_points)))  
-        # Drive-I snyaptic gating variables          
-        s_di = np.zeros((self.n_inh,len(time_points)))
-        
-        # Noise to exc. cells
-        N_ex = np.zeros((self.n_ex,len(time_points)))  
-        # Noise to inh. cells          
-        N_inh = np.zeros((self.n_inh,len(time_points)))            
-        
-        # Synaptic inputs for exc. cells
-        S_ex = np.zeros((self.n_ex,len(time_points)))
-        # Synaptic inputs for inh. cells            
-        S_inh = np.zeros((self.n_inh,len(time_points)))            
-        
-        # MEG component for each cell (only E-E EPSCs)
-        meg = np.zeros((self.n_ex,len(time_points)))            
-        
-        # applied currents
-        if  np.isscalar(self.b_ex):  # if b is a scalar convert it to a vector
-            B_ex    = self.b_ex * np.ones((len(time_points),self.n_ex))				# applied current for exc. cells
+        # the traces to be stored are written directly into preallocated,
+        # memory-mapped files during the integration
+        n_steps = self._numberOfSteps(time)
+        points = self._parameterPoints(n_steps)
+        axis = () if points is None else (len(points),)
+        out = {}
+        if saveEX:
+            filenameEX = self.directory  + self.filename + '-Ex.npy'
+            out['ex'] = np.lib.format.open_memmap(filenameEX,mode='w+',
+                                                  dtype=self.dtype,
+                                                  shape=axis+(self.n_ex,
+                                                              n_steps))
+        if saveINH:
+            filenameINH = self.directory  + self.filename + '-Inh.npy'
+            out['inh'] = np.lib.format.open_memmap(filenameINH,mode='w+',
+                                                   dtype=self.dtype,
+                                                   shape=axis+(self.n_inh,
+                                                               n_steps))
+        if profiler:
+            profiler.lap('save')
+
+        if points is None:
+            MEG,theta_ex,theta_inh = self._integrate(time,[self.seed],
+                                                     [self.drive_frequency],
+                                                     record,out,profiler,
+                                                     checkpoint=checkpoint,
+                                                     interval=interval)
+            # remove the trial axis
+            MEG = MEG[0] if MEG is not None else None
+            theta_ex = theta_ex[0] if theta_ex is not None else None
+            theta_inh = theta_inh[0] if theta_inh is not None else None
+        else:
+            # one trial per point of the parameter axis
+            MEG,theta_ex,theta_inh = self._integrate(
+                time,[point.seed for point in points],
+                [self.drive_frequency]*len(points),record,out,profiler,
+                points,checkpoint,interval)
+
+        if saveMEG:
+            filenameMEG = self.directory  + self.filename + '-MEG.npy'
+            np.save(filenameMEG,MEG)
+
+        for trace in out.values():
+            trace.flush()
+        if profiler:
+            profiler.lap('save')
+            self.profile_report = profiler.report()
+          
+        return MEG,theta_ex,theta_inh
+
+    def runBatch(self,seeds,drive_frequencies=None,time=100.0,
+                 record=('meg',),profile=False,checkpoint=None,
+                 interval=None,warmup=0.0,warmup_cache=None):
+        '''Runs several trials of the model in one vectorized pass.
+
+        All trials are advanced together in a single time loop, every state
+        variable carrying an additional (leading) trial axis. Each trial 
+        reproduces the result of run() with the according seed and drive 
+        frequency up to the summation order of the matrix products 
+        (~1e-12).
+
+        With a warm-up the initial transient of the network is simulated 
+        without drive (g_de=g_di=0) once per seed and network, and all 
+        trials of the seed and network (drive frequencies and drive 
+        strengths, e.g. a g_de parameter axis) are started from the settled
+        state, the drive starting at the end of the warm-up. The outputs 
+        only cover the time after the warm-up, so that the spectra do not 
+        need a transient cut (see spectral.analysisTransient()).
+            
+        Parameters
+        -----------------
+        seeds             : list
+            The seeds of the trials. With a parameter axis (see simpleModel)
+            every point is run with these seeds, or with the row of its 
+            point if a (points,seeds) array is given.
+        drive_frequencies : list
+            The drive frequencies; every seed is run with every drive 
+            frequency. If None, the drive frequency of the model is used.
+        time              : float
+            The duration of the simulation.
+        record            : tuple
+            The outputs to record, any of 'meg', 'ex', 'inh' and 'spikes'
+            (see run(); the spike times are indexed by trial and cell).
+        profile           : bool
+            Whether to collect a profile of the phases (see run()).
+        checkpoint        : str
+            The name of a checkpoint file (see run()).
+        interval          : float
+            The simulated time between the checkpoints (see run()).
+        warmup            : float
+            The duration of the warm-up (in ms, 0: none); not supported by
+            the adaptive integrator and with checkpoints.
+        warmup_cache      : str
+            A directory the settled states are stored in (one file per seed
+            and network parameters), so that they are reused by later 
+            calls, e.g. by the workers of a sweep.
+        Returns
+        -----------------
+        ndarray,ndarray,ndarray
+            The MEG signals (trials,time points) and the traces of the exc.
+            and inh. cells (trials,cells,time points); None for outputs that 
+            were not recorded. Trials are ordered by drive frequency first 
+            and seed second, i.e. trial i*len(seeds)+j has drive frequency 
+            i and seed j. With a parameter axis the outputs have the shape 
+            (points,trials,...) and the spike times are indexed by point 
+            first (trial p*n_trials+i). Spike times are relative to the 
+            end of the warm-up.
+        '''
+        if drive_frequencies is None:
+            drive_frequencies = [self.drive_frequency]
+        points = self._parameterPoints(self._numberOfSteps(time))
+        if points is None:
+            point_seeds = [seeds]
         else:
-            B_ex = self.b_ex
-        if  np.isscalar(self.b_inh):  # if b is a scalar convert it to a vector
-            B_inh    = self.b_inh * np.ones((len(time_points),self.n_inh))				# applied current for bask. cells
+            seeds = np.asarray(seeds)
+            if seeds.ndim == 2 and len(seeds) != len(points):
+                raise ValueError('one row of seeds per point is required')
+            point_seeds = [seeds[p] if seeds.ndim == 2 else seeds
+                           for p in range(len(points))]
+        trial_seeds = [seed for point in point_seeds
+                       for f in drive_frequencies for seed in point]
+        trial_frequencies = [f for point in point_seeds
+                             for f in drive_frequencies for seed in point]
+        trial_points = None
+        if points is not None:
+            trial_points = [points[p] for p,point in enumerate(point_seeds)
+                            for f in drive_frequencies for seed in point]
+
+        profiler = phaseProfiler() if profile else None
+        outputs = self._integrate(time,trial_seeds,trial_frequencies,
+                                  set(record),profiler=profiler,
+                                  points=trial_points,checkpoint=checkpoint,
+                                  interval=interval,warmup=warmup,
+                                  warmup_cache=warmup_cache)
+        if profiler:
+            self.profile_report = profiler.report()
+        if points is None:
+            return outputs
+        return tuple(None if output is None else
+                     output.reshape((len(points),-1)+output.shape[1:])
+                     for output in outputs)
+
+    def _integrate(self,time,seeds,drive_frequencies,record,out=None,
+                   profiler=None,points=None,checkpoint=None,interval=None,
+                   warmup=0.0,warmup_cache=None):
+        '''Integrates the model for a number of trials at once (see 
+        network.networkEngine.integrate()).
+        Parameters
+        -----------------
+        time              : float
+            The duration of the simulation.
+        seeds             : list
+            The seed of every trial.
+        drive_frequencies : list
+            The drive frequency of every trial.
+        record            : set
+            The outputs to record, any of 'meg', 'ex', 'inh' and 'spikes'.
+        out               : dict
+            Preallocated arrays (e.g. memory-mapped files) the outputs are 
+            written to; a (cells,time points) array can be given for a 
+            single trial.
+        profiler          : phaseProfiler
+            The profiler the phases are timed with (None disables 
+            profiling).
+        points            : list
+            The model with scalar parameters of every trial (see 
+            _parameterPoints(); None: this model for all trials).
+        checkpoint        : str
+            The name of the checkpoint file (see run()).
+        interval          : float
+            The simulated time between the checkpoints.
+        warmup            : float
+            The duration of the warm-up (see runBatch()).
+        warmup_cache      : str
+            The directory of the settled states (see runBatch()).
+        Returns
+        -----------------
+        ndarray,ndarray,ndarray
+            The recorded MEG signals and the traces of the exc. and inh. 
+            cells, each with a leading trial axis (or None).
+        '''
+        n_trials = len(seeds)
+
+        # number of time steps 
+        n_steps = self._numberOfSteps(time)
+        if points is None:
+            network = self._network()
+            networks = None
         else:
-            B_inh = self.b_inh          
+            # one network per point, shared by the trials of the point
+            engines = {}
+            for point in points:
+                if id(point) not in engines:
+                    engines[id(point)] = point._network()
+            networks = [engines[id(point)] for point in points]
+            network = networks[0]
+
+        # Recorded outputs (including the time points of the warm-up, see
+        # _integrateWarmedUp())
+        n_warmup = self._numberOfSteps(warmup) if warmup else 0
+        MEG,theta_ex_rec,theta_inh_rec = self._recordings(record,out,
+                                                          n_trials,
+                                                          n_warmup+n_steps)
 
         # Frequency = 1000/period(in ms) and b= pi**2 / period**2 
         # (because period = pi* sqrt(1/b); see Boergers and Kopell 2003) 
-        period  = 1000.0/self.drive_frequency
+        period  = 1000.0/np.asarray(drive_frequencies,dtype=float)
         # applied current for drive cell
         b_drive = np.pi**2/period**2             
         
-        # Seed the random generator
-        random.seed( self.seed )
-        
-        # Noise spike trains
-        ST_ex = [None]*self.n_ex
-        ST_inh = [None]*self.n_inh
-        
+        if profiler:
+            profiler.lap('setup')
+
+        if warmup:
+            if checkpoint is not None:
+                raise ValueError('warm-ups do not support checkpoints')
+            return self._integrateWarmedUp(time,seeds,record,profiler,
+                                           network,networks,points,b_drive,
+                                           n_steps,(MEG,theta_ex_rec,
+                                                    theta_inh_rec),
+                                           warmup,warmup_cache)
+        if checkpoint is not None:
+            return self._integrateCheckpointed(time,seeds,drive_frequencies,
+                                               record,profiler,network,
+                                               networks,b_drive,n_steps,
+                                               (MEG,theta_ex_rec,
+                                                theta_inh_rec),
+                                               checkpoint,interval)
+
+        # Noise spike trains of all trials
+        # (the spike trains only depend on the seed)
+        trains = {}
+        spike_trains = []
+        for seed in seeds:
+            if seed not in trains:
+                trains_ex,trains_inh = self._spikeTrains(time,seed)
+                trains[seed] = trains_ex+trains_inh
+            spike_trains.append(trains[seed])
+
+        results = network.integrate(spike_trains,b_drive,n_steps,MEG,
+                                    {'ex' : theta_ex_rec,
+                                     'inh' : theta_inh_rec},
+                                    'spikes' in record,self.backend,
+                                    self.integrator,self.tolerance,profiler,
+                                    networks,dtype=self.dtype)
+        if 'spikes' in record:
+            self.spike_times = results['spike_times']
+        if self.integrator == 'adaptive':
+            self.integration_stats = results['integration_stats']
+
+        return MEG,theta_ex_rec,theta_inh_rec
+
+    def _integrateCheckpointed(self,time,seeds,drive_frequencies,record,
+                               profiler,network,networks,b_drive,n_steps,
+                               outputs,checkpoint,interval):
+        '''Integrates the trials of _integrate() from and with checkpoints 
+        (see run()).'''
+        if self.integrator == 'adaptive':
+            raise ValueError('the adaptive integrator does not support '
+                             'checkpoints')
+        info = {'parameters' : trialKey(self,None),
+                'seeds' : np.asarray(seeds),
+                'drive_frequencies' : np.asarray(drive_frequencies,
+                                                 dtype=float),
+                'record' : np.array(sorted(record)),'time' : float(time)}
+        state = None
+        if os.path.exists(checkpoint):
+            state,saved,streams,saved_info = loadCheckpoint(checkpoint)
+            if str(saved_info['parameters']) != info['parameters']:
+                raise ValueError('the checkpoint %s belongs to a different '
+                                 'model' % checkpoint)
+            for name in ('seeds','drive_frequencies','record'):
+                if not np.array_equal(saved_info[name],info[name]):
+                    raise ValueError('the checkpoint %s has different %s'
+                                     % (checkpoint,name.replace('_',' ')))
+            if float(saved_info['time']) > time:
+                raise ValueError('the checkpoint %s is beyond %g ms'
+                                 % (checkpoint,time))
+            for name,output in zip(self.outputs,outputs):
+                if output is not None:
+                    output[...,:saved[name].shape[-1]] = saved[name]
+        else:
+            # the noise streams only depend on the seed
+            unique = {}
+            for seed in seeds:
+                if seed not in unique:
+                    unique[seed] = noiseStream([self.n_ex,self.n_inh],
+                                               self.background_rate/1000.0,
+                                               seed,self.noise_source)
+            streams = [unique[seed] for seed in seeds]
+        spike_trains = []
+        for stream in streams:
+            if stream.time < time:
+                stream.advance(time)
+            trains_ex,trains_inh = stream.trains
+            spike_trains.append(trains_ex+trains_inh)
+
+        def write(state):
+            stop = int(np.max(state['step']))
+            saveCheckpoint(checkpoint,state,
+                           {name : output[...,:stop] for name,output in 
+                            zip(self.outputs,outputs) if output is not None},
+                           streams,**info)
+
+        steps = None
+        if interval is not None:
+            steps = max(1,int(round(interval/self.dt)))
+        results = network.integrate(spike_trains,b_drive,n_steps,outputs[0],
+                                    {'ex' : outputs[1],'inh' : outputs[2]},
+                                    'spikes' in record,self.backend,
+                                    self.integrator,self.tolerance,profiler,
+                                    networks,state,
+                                    write if steps is not None else None,
+                                    steps,self.dtype)
+        write(results['state'])
+        if profiler:
+            profiler.lap('checkpoint')
+        if 'spikes' in record:
+            self.spike_times = results['spike_times']
+        return outputs
+
+    def _integrateWarmedUp(self,time,seeds,record,profiler,network,networks,
+                           points,b_drive,n_steps,outputs,warmup,
+                           warmup_cache):
+        '''Integrates the trials of _integrate() from the settled states of
+        a warm-up (see runBatch()).'''
+        if self.integrator == 'adaptive':
+            raise ValueError('the adaptive integrator does not support '
+                             'warm-ups')
+        n_warmup = self._numberOfSteps(warmup)
+        keys,settled = self._settledStates(warmup,seeds,points,warmup_cache)
+        state = {name : np.concatenate([settled[key][0][name] 
+                                        for key in keys])
+                 for name in ('step','theta','s','drive','noise_ex',
+                              'noise_R')}
+        state = network.restart(state,'spikes' in record)
+        if profiler:
+            profiler.lap('warmup')
+
+        # the noise of the trials continues the one of the warm-up (trials 
+        # with the same warm-up share its noise stream)
+        spike_trains = []
+        for key in keys:
+            stream = settled[key][1]
+            if stream.time < warmup+time:
+                stream.advance(warmup+time)
+            trains_ex,trains_inh = stream.trains
+            spike_trains.append(trains_ex+trains_inh)
+
+        results = network.integrate(spike_trains,b_drive,n_warmup+n_steps,
+                                    outputs[0],
+                                    {'ex' : outputs[1],'inh' : outputs[2]},
+                                    'spikes' in record,self.backend,
+                                    self.integrator,self.tolerance,profiler,
+                                    networks,state,dtype=self.dtype)
+        if 'spikes' in record:
+            self.spike_times = {name : (offsets,times-n_warmup*self.dt)
+                                for name,(offsets,times) in 
+                                results['spike_times'].items()}
+        return tuple(None if output is None else output[...,n_warmup:]
+                     for output in outputs)
+
+    def _settledStates(self,warmup,seeds,points,warmup_cache):
+        '''Simulates (or loads) the warm-ups of the trials.
+
+        The warm-up of a trial is the network without drive, so that it 
+        only depends on the seed and the parameters besides the drive; 
+        trials that share them share the warm-up, and the missing ones are
+        integrated together.
+        Parameters
+        -----------------
+        warmup       : float
+            The duration of the warm-up.
+        seeds        : list
+            The seed of every trial.
+        points       : list
+            The model of every trial (see _integrate()).
+        warmup_cache : str
+            The directory of the settled states (or None).
+        Returns
+        -----------------
+        list,dict
+            The key of the warm-up of every trial (see cache.trialKey()) 
+            and a dict mapping the keys to the states (see 
+            network.networkEngine.integrate()) and noise streams.
+        '''
+        settled = {}
+        missing = {}
+        keys = []
+        for i,seed in enumerate(seeds):
+            free = copy.copy(self if points is None else points[i])
+            free.g_de = 0.0
+            free.g_di = 0.0
+            free.drive_frequency = 0.0
+            free.seed = seed
+            key = trialKey(free,warmup)
+            keys.append(key)
+            if key in settled or key in missing:
+                continue
+            filename = None
+            if warmup_cache is not None:
+                filename = os.path.join(warmup_cache,key+'.npz')
+            if filename is not None and os.path.exists(filename):
+                state,outputs,streams,info = loadCheckpoint(filename)
+                settled[key] = (state,streams[0])
+            else:
+                missing[key] = (free,filename)
+
+        if missing:
+            # all missing warm-ups in one vectorized pass
+            models = [free for free,filename in missing.values()]
+            streams = [noiseStream([free.n_ex,free.n_inh],
+                                   free.background_rate/1000.0,free.seed,
+                                   free.noise_source) for free in models]
+            spike_trains = []
+            for stream in streams:
+                trains_ex,trains_inh = stream.advance(warmup)
+                spike_trains.append(trains_ex+trains_inh)
+            networks = [free._network() for free in models]
+            results = networks[0].integrate(spike_trains,0.0,
+                                            self._numberOfSteps(warmup),
+                                            backend=self.backend,
+                                            networks=networks,
+                                            dtype=self.dtype)
+            for j,(key,(free,filename)) in enumerate(missing.items()):
+                state = {name : values[j:j+1] for name,values in
+                         results['state'].items()}
+                settled[key] = (state,streams[j])
+                if filename is not None:
+                    if not os.path.isdir(warmup_cache):
+                        os.makedirs(warmup_cache)
+                    saveCheckpoint(filename,state,{},[streams[j]],key=key,
+                                   time=warmup)
+        return keys,settled
+
+    def _recordings(self,record,out,n_trials,n_steps):
+        '''Allocates the arrays of the recorded outputs (see _integrate()).'''
+        out = {} if out is None else out
+        if 'meg' in record:
+            MEG = np.zeros((n_trials,n_steps),dtype=self.dtype)
+        else:
+            MEG = None
+        if 'ex' in out:
+            theta_ex_rec = out['ex'].reshape((n_trials,self.n_ex,n_steps))
+            theta_ex_rec[:,:,0] = 0.0
+        elif 'ex' in record:
+            theta_ex_rec = np.zeros((n_trials,self.n_ex,n_steps),
+                                    dtype=self.dtype)
+        else:
+            theta_ex_rec = None
+        if 'inh' in out:
+            theta_inh_rec = out['inh'].reshape((n_trials,self.n_inh,n_steps))
+            theta_inh_rec[:,:,0] = 0.0
+        elif 'inh' in record:
+            theta_inh_rec = np.zeros((n_trials,self.n_inh,n_steps),
+                                     dtype=self.dtype)
+        else:
+            theta_inh_rec = None
+        return MEG,theta_ex_rec,theta_inh_rec
+
+    def _network(self):
+        '''Returns the description of the network integrated by the model
+        (see network.py): the exc. and inh. populations (the MEG signal 
+        being the sum of the E-E EPSCs) and the projections between them.
+        '''
+        W = self._connectivity(self.gating == 'vector')
+        populations = [population('ex',self.n_ex,self.tau_ex,self.b_ex,
+                                  self.g_de),
+                       population('inh',self.n_inh,self.tau_inh,self.b_inh,
+                                  self.g_di)]
+        projections = [projection('ex','ex',self.g_ee,W['ee'],meg=True),
+                       projection('ex','inh',self.g_ei,W['ei']),
+                       projection('inh','ex',-1.0*self.g_ie,W['ie']),
+                       projection('inh','inh',-1.0*self.g_ii,W['ii'])]
+        return networkEngine(populations,projections,self.dt,self.eta,
+                             self.tau_R,self.tau_ex,self.A,self.tau_ex,
+                             self.gating_solver)
+
+    def _parameterPoints(self,n_steps):
+        '''Returns a copy of the model with the scalar parameters of every 
+        point of the parameter axis (see simpleModel), None if there is no 
+        parameter axis.
+        Parameters
+        -----------------
+        n_steps : int
+            The number of time points (to recognise time-dependent applied
+            currents).
+        Returns
+        -----------------
+        list
+            The models of the points.
+        '''
+        values = {}
+        for name in self.grid_parameters+('seed',):
+            value = np.asarray(getattr(self,name))
+            if name in ('b_ex','b_inh'):
+                # per-cell (1D) and time-dependent (2D) currents
+                if value.ndim < 2 or (value.ndim == 2 and
+                                      value.shape[0] == n_steps):
+                    continue
+            elif value.ndim == 0:
+                continue
+            elif value.ndim > 1:
+                raise ValueError('%s has to be a scalar or a 1D array' % name)
+            values[name] = value
+        if not values:
+            return None
+
+        lengths = set(len(value) for value in values.values())-set([1])
+        if len(lengths) > 1:
+            raise ValueError('the parameter arrays have different lengths')
+        n_points = lengths.pop() if lengths else 1
+        points = []
+        for p in range(n_points):
+            point = copy.copy(self)
+            for name,value in values.items():
+                value = value[p if len(value) > 1 else 0]
+                setattr(point,name,value.item() if value.ndim == 0 else value)
+            points.append(point)
+        return points
+
+    def _numberOfSteps(self,time):
+        '''Returns the number of time points of a simulation of length time.'''
+        return len(np.linspace(0,time,int(time/self.dt)))
+
+    def _spikeTrains(self,time,seed):
+        '''Generates the Poissonian noise spike trains of one trial.
+        Parameters
+        -----------------
+        time : float
+            The duration of the simulation.
+        seed : int
+            The seed for the random number generator.
+        Returns
+        -----------------
+        list,list
+            Two lists containing lists of noise spike times for the exc. and
+            the inh. cells.
+        '''
         # adjust rate to ms time scale
         rate_parameter = self.background_rate/1000.0 
-        for i in range(self.n_ex):
-            template_spike_array = []
-            # Produce Poissonian spike train
-            total_time = 0.0
-            while total_time < time:
-                 next_time = random.expovariate(rate_parameter)
-                 total_time = total_time + next_time 
-                 if total_time < time:
-                    template_spike_array.append(total_time)
-                    
-            ST_ex[i] = template_spike_array
-                
-        
-        for i in range(self.n_inh):
-            template_spike_array = []
-            # Produce Poissonian spike train
-            total_time = 0.0
-            while total_time < time:
-                next_time = random.expovariate(rate_parameter)
-                total_time = total_time + next_time 
-                if total_time < time:
-                    template_spike_array.append(total_time)
-                    
-            ST_inh[i] = template_spike_array
-                
-        a = np.zeros((self.n_ex,1))    
-        b = np.zeros((self.n_inh,1)) 
-        # Simulation
-        for t in range(1,len(time_points)):
-            # calculate noise (not done in a very efficient way!)
-            for i in range(self.n_ex):
-                for tn in ST_ex[i]:
-                    N_ex[i,t] = N_ex[i,t] + self._noise(t,tn) 
-        
-            # calculate noise (not done in a very efficient way!)
-            for i in range(self.n_inh):
-                for tn in ST_inh[i]:
-                    N_inh[i,t] = N_inh[i,t] + self._noise(t,tn) 
-
-            # evolve gating variable
-       
-            # E-E connections
-            # exponential decay
-            ee_decay            = s_ee[:,:,t-1]/self.tau_ex 
-            # synaptic input from other cells
-            ee_synaptic_input   = np.exp(-1.0*self.eta*(1+np.cos(theta_ex[:,t-1])))*((1.0-s_ee[:,:,t-1])/self.tau_R) 
-            s_ee[:,:,t] = s_ee[:,:,t-1]+self.dt*(-1.0*ee_decay+ee_synaptic_input)
-             
-            # E-I connections          
-            for k in range(self.n_ex):
-                a[k,0]=theta_ex[k,t-1]
-            # exponential decay
-            ei_decay            = s_ei[:,:,t-1]/self.tau_ex 
-            # synaptic input from other cells
-            ei_synaptic_input   = np.exp(-1.0*self.eta*(1+np.cos(a)))*((1.0-s_ei[:,:,t-1])/self.tau_R) 
-            s_ei[:,:,t] = s_ei[:,:,t-1]+self.dt*(-1.0*ei_decay+ei_synaptic_input)
-                      
-            # I-E connections 
-            for l in range(self.n_inh):
-                b[l,0]=theta_inh[l,t-1]
-            # exponential decay
-            ie_decay            = s_ie[:,:,t-1]/self.tau_inh 
-            # synaptic input from other cells
-            ie_synaptic_input   = np.exp(-1.0*self.eta*(1+np.cos(b)))*((1.0-s_ie[:,:,t-1])/self.tau_R) 
-            s_ie[:,:,t] = s_ie[:,:,t-1]+self.dt*(-1.0*ie_decay+ie_synaptic_input)
-
-            # I-I connections
-            # exponential decay
-            ii_decay            = s_ii[:,:,t-1]/self.tau_inh 
-            # synaptic input from other cells
-            ii_synaptic_input   = np.exp(-1.0*self.eta*(1+np.cos(theta_inh[:,t-1])))*((1.0-s_ii[:,:,t-1])/self.tau_R) 
-            s_ii[:,:,t] = s_ii[:,:,t-1]+self.dt*(-1.0*ii_decay+ii_synaptic_input)
-
-            # D-E connections
-            # exponential decay
-            de_decay            = s_de[:,t-1]/self.tau_ex 
-            # synaptic input from drive cell
-            de_synaptic_input   = np.exp(-1.0*self.eta*(1+np.cos(drive_cell[t-1])))*((1.0-s_de[:,t-1])/self.tau_R) 
-            s_de[:,t] = s_de[:,t-1]+self.dt*(-1.0*de_decay+de_synaptic_input)
-
-            # D-I connections
-            # exponential decay
-            di_decay            = s_di[:,t-1]/self.tau_ex 
-            # synaptic input from drive cell
-            di_synaptic_input   = np.exp(-1.0*self.eta*(1+np.cos(drive_cell[t-1])))*((1.0-s_di[:,t-1])/self.tau_R) 
-            s_di[:,t] = s_di[:,t-1]+self.dt*(-1.0*di_decay+di_synaptic_input)
-             
-            # calculate total synaptic input
-            excitation = self.g_ee*np.sum(s_ee[:,:,t-1],axis=0)
-            inhibition = self.g_ie*np.sum(s_ie[:,:,t-1],axis=0)
-            drive = self.g_de*s_de[:,t-1]
-            S_ex[:,t] = excitation-inhibition+drive
-
-            excitation = self.g_ei*np.sum(s_ei[:,:,t-1],axis=0)
-            inhibition = self.g_ii*np.sum(s_ii[:,:,t-1],axis=0)
-            drive = self.g_di*s_di[:,t-1]
-            S_inh[:,t] = excitation-inhibition+drive
-             
-            meg[:,t]    = self.g_ee*np.sum(s_ee[:,:,t-1],axis=0)  
-
- 
-            # evolve drive cell
-            part_a = (1-np.cos(drive_cell[t-1]))
-            part_b = b_drive*(1 + np.cos(drive_cell[t-1])) 
-            drive_cell[t] = drive_cell[t-1]+self.dt*(part_a+part_b)
-             
-            # evolve theta
-            part_a = (1 - np.cos(theta_ex[:,t-1]))
-            part_b = (B_ex[t] + S_ex[:,t] + N_ex[:,t])*(1 + np.cos(theta_ex[:,t-1]))
-            theta_ex[:,t]= theta_ex[:,t-1]  + self.dt*(part_a+part_b)
-
-            part_a = (1 - np.cos(theta_inh[:,t-1]))
-            part_b = (B_inh[t] + S_inh[:,t] + N_inh[:,t])*(1 + np.cos(theta_inh[:,t-1]))
-            theta_inh[:,t] = theta_inh[:,t-1] + self.dt*(part_a+part_b)
-        
-        
-        
-        # Sum EPSCs of excitatory cells
-        MEG = np.sum(meg,axis=0)
-
-        if saveMEG:
-            filenameMEG = self.directory  + self.filename + '-MEG.npy'
-            np.save(filenameMEG,MEG)
- 
-        if saveEX:
-            filenameEX = self.directory  + self.filename + '-Ex.npy'
-            np.save(filenameEX,theta_ex)  
+        ST_ex,ST_inh = noiseSpikeTrains([self.n_ex,self.n_inh],rate_parameter,
+                                        time,seed,self.noise_source)
 
-        if saveINH:
-            filenameINH = self.directory  + self.filename + '-Inh.npy'
-            np.save(filenameINH,theta_inh)
-          
-        return MEG,theta_ex,theta_inh
+        return ST_ex,ST_inh
         
     
     def plotTrace(self,trace,sim_time,save):
@@ -323,6 +808,7 @@ class simpleModel(object):
         save     : int
             A flag whether to save the plot or not.
         '''
+        import matplotlib.pyplot as plt
         fig = plt.figure()
         ax = fig.add_subplot(111)
         time = np.linspace(0,sim_time,int(sim_time/self.dt))
@@ -343,6 +829,7 @@ class simpleModel(object):
         save     : int
             A flag whether to save the plot or not.
         '''
+        import matplotlib.pyplot as plt
         fig = plt.figure()
         ax = fig.add_subplot(111)
         time = np.linspace(0,sim_time,int(sim_time/self.dt))
@@ -365,6 +852,7 @@ class simpleModel(object):
             The duration of the simulation.
         '''
         spiketrains = self._getSpikeTimes(data)
+        import matplotlib.pyplot as plt
         fig = plt.figure()
         ax = fig.add_subplot(111)
         for i,times in enumerate(spiketrains):
@@ -379,7 +867,8 @@ class simpleModel(object):
 
     def calculatePSD(self,meg,sim_time):
         '''Calculates the power spectral density of a simulated MEG 
-        signal (using mlab.psd(), which uses Welch's method).
+        signal (the periodogram of the whole signal, see
+        spectral.powerSpectrum()).
         Parameters
         -----------------
         meg      : ndarray
@@ -392,15 +881,7 @@ class simpleModel(object):
             Two 1D arrays containing the power spectral density of 
             the signal and the according frequencies.
         '''
-        # fourier sample rate
-        fs = 1. / self.dt    
-               
-        npts = len(meg)   
-        
-        pxx,freqs=mlab.psd(meg,NFFT=npts,Fs=fs,noverlap=0,window=mlab.window_none)
-        pxx[0] = 0.0
-            
-        return pxx,freqs
+        return spectral.powerSpectrum(meg,self.dt,transient=0.0)
     
            
            
@@ -417,6 +898,7 @@ class simpleModel(object):
         save    : int
             Flag whether to save the plot or not.
         '''
+        import matplotlib.pyplot as plt
         fig = plt.figure()
         ax = fig.add_subplot(111)   
       
@@ -442,22 +924,8 @@ class simpleModel(object):
         list
             A list containing the spike times.
         '''
-        spike_times = []
-        old = 0.0
-        for i,n in enumerate(neuron):
-
-            # if theta passes (2l-1)*pi, l integer, with dtheta/dt>0 then 
-            # the neuron spikes (see Boergers and Kopell, 2003)
-            # therefore we loop through the time series of the single neuron 
-            # and look for these events the spike time is then simply the product
-            # of the index times the time step 
-            if (n%(2*np.pi))>np.pi and (old%(2*np.pi))<np.pi:
-                spike_time = i*self.dt
-                spike_times.append(spike_time)
-            old = n
-        
-        return spike_times
-        
+        return spikeTimes(neuron,self.dt)[1].tolist()
+
     def _getSpikeTimes(self,data):
         '''Calculates the spike times from an array of theta neuron traces.
          Parameters
@@ -471,34 +939,54 @@ class simpleModel(object):
         list
             A list containing lists of spike times.
         '''
-        nx,ny = data.shape
-        spike_times_array = [None]*nx
-        for i in range(nx):
-            spike_times_array[i] = self._getSingleSpikeTimes(data[i,:])
-        
-        return spike_times_array
-    
-    def _noise(self,t,tn):
-        '''Calculates the noise EPSP according to the formula from the model 
-        description of the article.
-         Parameters
+        return spikeTrains(*spikeTimes(data,self.dt))
+
+    def loadTraces(self,name):
+        '''Opens stored traces memory-mapped (read-only), so that they can
+        be processed without loading them into memory as a whole.
+        Parameters
         -----------------
-        t   : int
-            Current time.
-        tn  : int 
-            The time of the noise spike.
+        name : str
+            The name of the traces, 'Ex' or 'Inh' (or 'MEG').
         Returns
         -----------------
-        list
-            A list containing lists of spike times.
+        ndarray
+            The memory-mapped array.
         '''
-        t  = t * self.dt
-        if t-tn>0:
-            exp1 = np.exp(-(t-tn)/self.tau_ex)
-            exp2 = np.exp(-(t-tn)/self.tau_R)
-            value = (self.A*(exp1-exp2))/(self.tau_ex-self.tau_R)
-        else:
-            value = 0
-    
-        return value
+        filename = self.directory + self.filename + '-' + name + '.npy'
+        return np.load(filename,mmap_mode='r')
 
+    def _connectivity(self,custom=True):
+        '''Returns the weight matrices of the projections.
+
+        In the matrix representation of the original model the E-I and I-E gating variables are 
+        driven by the phase of the presynaptic cell and summed over all 
+        presynaptic cells, i.e. all-to-all connectivity. The E-E and I-I 
+        gating matrices, however, are driven by the phase of the 
+        postsynaptic cell (the phase vector is broadcast along the last 
+        axis), so that every cell receives n_pre times its own gating 
+        variable. The defaults reproduce both cases; they can be replaced 
+        per projection via the connectivity attribute.
+        Parameters
+        -----------------
+        custom : bool
+            Whether to apply the connectivity attribute (False returns the
+            connectivity of the matrix representation).
+        Returns
+        -----------------
+        dict
+            A dict containing the (n_pre,n_post) weight matrices of the 
+            projections 'ee', 'ei', 'ie' and 'ii'.
+        '''
+        W = {'ee' : self.n_ex*np.eye(self.n_ex),
+             'ei' : np.ones((self.n_ex,self.n_inh)),
+             'ie' : np.ones((self.n_inh,self.n_ex)),
+             'ii' : self.n_inh*np.eye(self.n_inh)}
+        if custom and self.connectivity is not None:
+            for key,weights in self.connectivity.items():
+                weights = np.asarray(weights,dtype=float)
+                if key not in W or weights.shape != W[key].shape:
+                    raise ValueError('invalid connectivity for projection %s'
+                                     % key)
+                W[key] = weights
+        return W
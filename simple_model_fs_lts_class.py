@@ -9,10 +9,12 @@
 ####################################################################
 
 
-import random
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.mlab as mlab
+
+from network import checkOptions, networkEngine, population, projection
+from noise import noiseSpikeTrains
+import spectral
+from spikes import spikeTimes, spikeTrains
 
 
 
@@ -59,12 +61,38 @@ class simpleModelFsLts(object):
         A		: scaling factor for the background noise strength
 
         seed		: seed for the random generator
+
+        gating      : connectivity of the synaptic gating variables ('matrix': the original model with one per pair of
+                      cells, see _connectivity(); 'vector': the connectivity attribute is applied); both are integrated
+                      with one gating variable per presynaptic cell (see network.py)
+        connectivity: dict of (n_pre,n_post) weight matrices for the projections 'ee', 'eb', 'ec', 'be', 'bb',
+                      'bc', 'ce' and 'cb' (only used with gating='vector', see _connectivity())
+        noise_source: generator of the noise spike trains ('legacy': spike trains of earlier versions (random
+                      module), 'generator': numpy.random.Generator streams, see noise.noiseSpikeTrains())
+        backend     : implementation of the time loop ('numpy' or 'numba': a compiled kernel, see kernel.py; falls
+                      back to 'numpy' with a warning if numba is not installed)
+        integrator  : integration scheme ('euler': forward Euler with the time step dt, 'adaptive': an adaptive
+                      Runge-Kutta 3(2) scheme resampled onto the time grid of dt, see adaptive.py)
+        tolerance   : maximal local error per step of the adaptive integrator
+        gating_solver: update of the synaptic gating variables ('euler': forward Euler, 'exponential': exact for the
+                      phase of the previous time step, see network.networkEngine.gatingStep(); ignored by the adaptive
+                      integrator). With 8 times the time step of the exploration (dt=500/2**10) the power at the
+                      drive frequency of single trials differs from forward Euler with dt=500/2**16 by up to 22%
+                      (40 Hz drive), 29% (30 Hz) and 49% (20 Hz), and the power averaged over 10 seeds by up to
+                      1%, 1% and 3% (see network.gatingToleranceReport())
+        dtype       : floating point type of the integration state and the outputs ('float64' or 'float32', see
+                      simple_model_class.simpleModel and precision.py)
     '''
 
+    # names of the outputs of run()
+    outputs = ('meg','ex','fs','som')
+
     def __init__(self,n_ex=20,n_fs=10,n_som=10,eta=5.0,tau_R=0.1,tau_ex=2.0,tau_fs=8.0,tau_som=50.0,g_ee=0.015,
                  g_eb=0.025, g_ec=0.025,g_be=0.015,g_ce=0.015,g_bb=0.02,g_cb=0.02,g_bc=0.02,g_de=0.3,g_db=0.08,
                  dt=0.05,b_ex=-0.01,b_fs=-0.01,b_som=-0.05,drive_frequency=0.0,background_rate=33.3,
-                 A=0.65,seed=12345,filename='default',directory='/'):
+                 A=0.65,seed=12345,filename='default',directory='/',gating='matrix',connectivity=None,
+                 noise_source='legacy',backend='numpy',integrator='euler',tolerance=1e-4,
+                 gating_solver='euler',dtype='float64'):
         self.n_ex = n_ex
         self.n_fs = n_fs
         self.n_som = n_som
@@ -93,10 +121,19 @@ class simpleModelFsLts(object):
         self.seed = seed
         self.filename = filename
         self.directory = directory
+        self.connectivity = connectivity
+        self.tolerance = tolerance
+        options = checkOptions(gating=gating,noise_source=noise_source,backend=backend,integrator=integrator,
+                               gating_solver=gating_solver,dtype=dtype)
+        for name,value in options.items():
+            setattr(self,name,value)
     
-    def run(self,time=100.0,saveMEG=0,saveEX=0,saveFS=0,saveSOM=0):
+    def run(self,time=100.0,saveMEG=0,saveEX=0,saveFS=0,saveSOM=0,record=('meg','ex','fs','som')):
         '''
         Runs the model and returns (and stores) the results
+
+        Only the current state of the network is kept during the integration, full time series are only
+        allocated for the recorded (or stored) outputs.
                
         Parameters:
         time : the length of the simulation (in ms)
@@ -104,186 +141,107 @@ class simpleModelFsLts(object):
         saveEX: flag that signalises whether the exc. population activity should be stored
         saveFS: flag that signalises whether the FS cell population activity should be stored
         saveSOM: flag that signalises whether the SOM cell population activity should be stored
+        record: the outputs to record, any of 'meg', 'ex', 'fs' and 'som' (stored outputs are always recorded);
+                with 'spikes' the spike times are detected during the integration and stored in the attribute
+                spike_times, a dict mapping 'ex', 'fs' and 'som' to the (offsets,times) format of spikes.spikeTimes()
+
+        Returns the MEG signal and the traces of the exc., FS and SOM cells (None if not recorded)
         '''
+        record = set(record)
+        if saveMEG:
+            record.add('meg')
+        if saveEX:
+            record.add('ex')
+        if saveFS:
+            record.add('fs')
+        if saveSOM:
+            record.add('som')
             
         time_points = np.linspace(0,time,int(time/self.dt)+1) # number of time steps (in ms) 
-    
-        # Initialisations
-        drive_cell  =   np.zeros((len(time_points),))	# the pacemaking drive cell
-    
-    
-        theta_ex = np.zeros((self.n_ex,len(time_points)))		# exc. neurons
-        theta_fs = np.zeros((self.n_fs,len(time_points)))		# FS cells
-        theta_som = np.zeros((self.n_som,len(time_points)))		# SOM cells
-    
-        s_ee = np.zeros((self.n_ex,self.n_ex,len(time_points))) 	# E-E snyaptic gating variables
-        s_eb = np.zeros((self.n_ex,self.n_fs,len(time_points)))	# E-B snyaptic gating variables
-        s_ec = np.zeros((self.n_ex,self.n_som,len(time_points)))	# E-C snyaptic gating variables
-        s_be = np.zeros((self.n_fs,self.n_ex,len(time_points)))	# B-E snyaptic gating variables
-        s_ce = np.zeros((self.n_som,self.n_ex,len(time_points)))	# C-E snyaptic gating variables
-        s_bb = np.zeros((self.n_fs,self.n_fs,len(time_points)))	# B-B snyaptic gating variables
-        s_cb = np.zeros((self.n_som,self.n_fs,len(time_points)))	# C-B snyaptic gating variables
-        s_bc = np.zeros((self.n_fs,self.n_som,len(time_points)))	# B-C snyaptic gating variables
-        s_de = np.zeros((self.n_ex,len(time_points)))			# Drive-E snyaptic gating variables
-        s_db = np.zeros((self.n_fs,len(time_points)))			# Drive-B snyaptic gating variables
-        #s_dc = np.zeros((self.n_som,len(time_points)))			# Drive-C snyaptic gating variables; no drive for SOM cells
-        
-        N_ex = np.zeros((self.n_ex,len(time_points)))			# Noise to exc. cells
-        N_fs = np.zeros((self.n_fs,len(time_points)))			# Noise to fs cells
-        N_som = np.zeros((self.n_som,len(time_points)))			# Noise to som cells
+        n_steps = len(time_points)
         
-        S_ex = np.zeros((self.n_ex,len(time_points)))			# Synaptic inputs for exc. cells
-        S_fs = np.zeros((self.n_fs,len(time_points)))		# Synaptic inputs for FS cells
-        S_som = np.zeros((self.n_som,len(time_points)))	# Synaptic inputs for som cells
-        
-        meg = np.zeros((self.n_ex,len(time_points)))			# MEG component for each cell (only E-E EPSCs)
-        
-        # applied currents
-        B_ex    = self.b_ex * np.ones((self.n_ex,))				# applied current for exc. cells
-        B_fs   = self.b_fs * np.ones((self.n_fs,))			# applied current for FS cells
-        B_som   = self.b_som * np.ones((self.n_som,))			# applied current for SOM cells
+        # Recorded outputs (traces to be stored are written directly into preallocated, memory-mapped files)
+        MEG = np.zeros((n_steps,),dtype=self.dtype) if 'meg' in record else None				# MEG signal (only E-E EPSCs)
+        theta_ex_rec = self._recording('ex',record,saveEX,'-Ex.npy',self.n_ex,n_steps)		# exc. neurons
+        theta_fs_rec = self._recording('fs',record,saveFS,'-Bask.npy',self.n_fs,n_steps)		# FS cells
+        theta_som_rec = self._recording('som',record,saveSOM,'-Chand.npy',self.n_som,n_steps)	# SOM cells
         
         # Frequency = 1000/period(in ms) and b= pi**2 / period**2 (because period = pi* sqrt(1/b); see Boergers and Kopell 2003) 
         period  = 1000.0/self.drive_frequency
         b_drive = np.pi**2/period**2			# applied current for drive cell 
         
-        # Seed the random generator
-        random.seed( self.seed )
-        
         # Noise spike trains
-        ST_ex = [None]*self.n_ex
-        ST_fs = [None]*self.n_fs
-        ST_som = [None]*self.n_som
-        
         rate_parameter = 1000*(1.0/self.background_rate)
         rate_parameter = 1.0/rate_parameter
-        for i in range(self.n_ex):
-            template_spike_array = []
-            # Produce Poissonian spike train
-            total_time = 0.0
-            while total_time < time:
-                next_time = random.expovariate(rate_parameter)
-                total_time = total_time + next_time 
-                if total_time < time:
-                    template_spike_array.append(total_time)
-                    
-            ST_ex[i] = template_spike_array
-                
-        
-        for i in range(self.n_fs):
-            template_spike_array = []
-            # Produce Poissonian spike train
-            total_time = 0.0
-            while total_time < time:
-                next_time = random.expovariate(rate_parameter)
-                total_time = total_time + next_time 
-                if total_time < time:
-                    template_spike_array.append(total_time)
-                    
-            ST_fs[i] = template_spike_array
-
-        for i in range(self.n_som):
-            template_spike_array = []
-            # Produce Poissonian spike train
-            total_time = 0.0
-            while total_time < time:
-                next_time = random.expovariate(rate_parameter)
-                total_time = total_time + next_time 
-                if total_time < time:
-                    template_spike_array.append(total_time)
-                    
-            ST_som[i] = template_spike_array
-         
-
-               
-        a = np.zeros((self.n_ex,1))    
-        b = np.zeros((self.n_fs,1))
-        c = np.zeros((self.n_som,1))
-        # Simulation
-        for t in range(1,len(time_points)):
-            # calculate noise (not done in a very efficient way!)
-            for i in range(self.n_ex):
-                for tn in ST_ex[i]:
-                    N_ex[i,t] = N_ex[i,t] + self._noise(t,tn) 
-        
-            # calculate noise (not done in a very efficient way!)
-            for i in range(self.n_fs):
-                for tn in ST_fs[i]:
-                    N_fs[i,t] = N_fs[i,t] + self._noise(t,tn)
-            
-            # calculate noise (not done in a very efficient way!)
-            for i in range(self.n_som):
-                for tn in ST_som[i]:
-                    N_som[i,t] = N_som[i,t] + self._noise(t,tn)
-                    
-            # evolve gating variables
-            s_ee[:,:,t] 	= s_ee[:,:,t-1] + self.dt*(-1.0*(s_ee[:,:,t-1]/self.tau_ex) + np.exp(-1.0*self.eta*(1+np.cos(theta_ex[:,t-1])))*((1.0-s_ee[:,:,t-1])/self.tau_R))
-            # this seems awfully complicated            
-            for k in range(self.n_ex):
-                a[k,0]=theta_ex[k,t-1]
-            s_eb[:,:,t] 	= s_eb[:,:,t-1] + self.dt*(-1.0*(s_eb[:,:,t-1]/self.tau_ex) + np.exp(-1.0*self.eta*(1+np.cos(a)))*((1.0-s_eb[:,:,t-1])/self.tau_R))
-            s_ec[:,:,t] 	= s_ec[:,:,t-1] + self.dt*(-1.0*(s_ec[:,:,t-1]/self.tau_ex) + np.exp(-1.0*self.eta*(1+np.cos(a)))*((1.0-s_ec[:,:,t-1])/self.tau_R))
-            # this seems awfully complicated            
-            for l in range(self.n_fs):
-                b[l,0]=theta_fs[l,t-1]
-            s_be[:,:,t] 	= s_be[:,:,t-1] + self.dt*(-1.0*(s_be[:,:,t-1]/self.tau_fs) + np.exp(-1.0*self.eta*(1+np.cos(b)))*((1.0-s_be[:,:,t-1])/self.tau_R))
-            s_bb[:,:,t] 	= s_bb[:,:,t-1] + self.dt*(-1.0*(s_bb[:,:,t-1]/self.tau_fs) + np.exp(-1.0*self.eta*(1+np.cos(theta_fs[:,t-1])))*((1.0-s_bb[:,:,t-1])/self.tau_R))
-            s_bc[:,:,t] 	= s_bc[:,:,t-1] + self.dt*(-1.0*(s_bc[:,:,t-1]/self.tau_fs) + np.exp(-1.0*self.eta*(1+np.cos(b)))*((1.0-s_bc[:,:,t-1])/self.tau_R))
-            for m in range(self.n_som):
-                c[m,0]=theta_som[m,t-1]
-            s_ce[:,:,t] 	= s_ce[:,:,t-1] + self.dt*(-1.0*(s_ce[:,:,t-1]/self.tau_som) + np.exp(-1.0*self.eta*(1+np.cos(c)))*((1.0-s_ce[:,:,t-1])/self.tau_R))
-            s_cb[:,:,t] 	= s_cb[:,:,t-1] + self.dt*(-1.0*(s_cb[:,:,t-1]/self.tau_som) + np.exp(-1.0*self.eta*(1+np.cos(c)))*((1.0-s_cb[:,:,t-1])/self.tau_R))
-
-
-            s_de[:,t]    	= s_de[:,t-1]   + self.dt*(-1.0*(s_de[:,t-1]/self.tau_ex) + np.exp(-1.0*self.eta*(1+np.cos(drive_cell[t-1])))*((1.0-s_de[:,t-1])/self.tau_R))
-            s_db[:,t]   	= s_db[:,t-1]   + self.dt*(-1.0*(s_db[:,t-1]/self.tau_ex) + np.exp(-1.0*self.eta*(1+np.cos(drive_cell[t-1])))*((1.0-s_db[:,t-1])/self.tau_R))
-            #s_dc[:,t]   	= s_dc[:,t-1]   + self.dt*(-1.0*(s_dc[:,t-1]/self.tau_ex) + np.exp(-1.0*self.eta*(1+np.cos(drive_cell[t-1])))*((1.0-s_dc[:,t-1])/self.tau_R))
-             
-            # calculate total synaptic input
-            S_ex[:,t]	= self.g_ee*np.sum(s_ee[:,:,t-1],axis=0) - self.g_be*np.sum(s_be[:,:,t-1],axis=0) - self.g_ce*np.sum(s_ce[:,:,t-1],axis=0) + self.g_de*s_de[:,t-1]
-            S_fs[:,t] = self.g_eb*np.sum(s_eb[:,:,t-1],axis=0) - self.g_bb*np.sum(s_bb[:,:,t-1],axis=0) - self.g_cb*np.sum(s_cb[:,:,t-1],axis=0) + self.g_db*s_db[:,t-1]
-            S_som[:,t] = self.g_ec*np.sum(s_ec[:,:,t-1],axis=0)  - self.g_bc*np.sum(s_bc[:,:,t-1],axis=0) #+ self.g_dc*s_dc[:,t-1]
-            
-            meg[:,t]	= self.g_ee*np.sum(s_ee[:,:,t-1],axis=0)  #+ self.g_de*s_de[:,t-1]
-
-            
-            # evolve drive cell
-            drive_cell[t]  	= drive_cell[t-1]  + self.dt*((1 - np.cos(drive_cell[t-1])) + b_drive*(1 + np.cos(drive_cell[t-1])))
-             
-            # evolve theta
-            theta_ex[:,t]  	= theta_ex[:,t-1]  + self.dt*( (1 - np.cos(theta_ex[:,t-1])) + (B_ex + S_ex[:,t] + N_ex[:,t])*(1 + np.cos(theta_ex[:,t-1])))
-            theta_fs[:,t] 	= theta_fs[:,t-1] + self.dt*( (1 - np.cos(theta_fs[:,t-1])) + (B_fs + S_fs[:,t] + N_fs[:,t])*(1 + np.cos(theta_fs[:,t-1])))
-            theta_som[:,t] 	= theta_som[:,t-1] + self.dt*( (1 - np.cos(theta_som[:,t-1])) + (B_som + S_som[:,t] + N_som[:,t])*(1 + np.cos(theta_som[:,t-1])))
-    
-    
-    
-        # Sum EPSCs of excitatory cells
-        MEG = np.sum(meg,axis=0)
-
-     
+        ST_ex,ST_fs,ST_som = noiseSpikeTrains([self.n_ex,self.n_fs,self.n_som],rate_parameter,time,self.seed,
+                                              self.noise_source)
+
+        # Simulation (see network.py; the outputs of the engine carry a leading trial axis)
+        traces = {'ex' : theta_ex_rec, 'fs' : theta_fs_rec, 'som' : theta_som_rec}
+        traces = {name : trace[np.newaxis] for name,trace in traces.items() if trace is not None}
+        results = self._network().integrate([ST_ex+ST_fs+ST_som],b_drive,n_steps,
+                                            None if MEG is None else MEG[np.newaxis],traces,'spikes' in record,
+                                            self.backend,self.integrator,self.tolerance,dtype=self.dtype)
+        if 'spikes' in record:
+            self.spike_times = results['spike_times']
+        if self.integrator == 'adaptive':
+            self.integration_stats = results['integration_stats'][0]
            
+
         if saveMEG:
             filenameMEG = self.directory  + self.filename + '-MEG.npy'
             np.save(filenameMEG,MEG)
 
           
           
-        if saveEX:
-            filenameEX = self.directory  + self.filename + '-Ex.npy'
-            np.save(filenameEX,theta_ex)
-          
-          
-        if saveFS:
-           filenameFS = self.directory  + self.filename + '-Bask.npy'
-           np.save(filenameFS,theta_fs)
-           
-        if saveSOM:
-           filenameSOM = self.directory  + self.filename + '-Chand.npy'
-           np.save(filenameSOM,theta_som)
+        for trace,save in ((theta_ex_rec,saveEX),(theta_fs_rec,saveFS),(theta_som_rec,saveSOM)):
+            if save:
+                trace.flush()
               
-        return MEG,theta_ex,theta_fs,theta_som
+        return MEG,theta_ex_rec,theta_fs_rec,theta_som_rec
     
     
+    def _network(self):
+        '''
+           Returns the description of the network integrated by the model (see network.py): the exc., FS and SOM
+           populations (the SOM cells are not driven, the MEG signal is the sum of the E-E EPSCs) and the
+           projections between them
+        '''
+        W = self._connectivity(self.gating == 'vector')
+        populations = [population('ex',self.n_ex,self.tau_ex,self.b_ex,self.g_de),
+                       population('fs',self.n_fs,self.tau_fs,self.b_fs,self.g_db),
+                       population('som',self.n_som,self.tau_som,self.b_som)]
+        projections = [projection('ex','ex',self.g_ee,W['ee'],meg=True),
+                       projection('ex','fs',self.g_eb,W['eb']),
+                       projection('ex','som',self.g_ec,W['ec']),
+                       projection('fs','ex',-1.0*self.g_be,W['be']),
+                       projection('fs','fs',-1.0*self.g_bb,W['bb']),
+                       projection('fs','som',-1.0*self.g_bc,W['bc']),
+                       projection('som','ex',-1.0*self.g_ce,W['ce']),
+                       projection('som','fs',-1.0*self.g_cb,W['cb'])]
+        return networkEngine(populations,projections,self.dt,self.eta,self.tau_R,self.tau_ex,self.A,self.tau_ex,
+                             self.gating_solver)
+
+    def _recording(self,name,record,save,suffix,n_cells,n_steps):
+        '''
+           Allocates the (n_cells,n_steps) array an output is recorded to (a memory-mapped file if it is stored)
+        '''
+        if save:
+            return np.lib.format.open_memmap(self.directory + self.filename + suffix,mode='w+',dtype=self.dtype,
+                                             shape=(n_cells,n_steps))
+        if name in record:
+            return np.zeros((n_cells,n_steps),dtype=self.dtype)
+        return None
+
+    def loadTraces(self,name):
+        '''
+           Opens stored traces memory-mapped (read-only), so that they can be processed without loading them as a whole
+           Parameters:
+           name: the name of the traces ('Ex', 'Bask', 'Chand' or 'MEG')
+        '''
+        filename = self.directory + self.filename + '-' + name + '.npy'
+        return np.load(filename,mmap_mode='r')
+
     def plotTrace(self,trace,sim_time,save):
         '''
            Plots a trace signal versus time
@@ -291,6 +249,7 @@ class simpleModelFsLts(object):
            trace: the trace signal to plot
            sim_time: the duration of the simulation
         '''
+        import matplotlib.pyplot as plt
         fig = plt.figure()
         ax = fig.add_subplot(111)
         time = np.linspace(0,sim_time,int(sim_time/self.dt)+1)
@@ -305,6 +264,7 @@ class simpleModelFsLts(object):
            MEG: the simulated MEG signal to plot
            sim_time: the duration of the simulation
         '''
+        import matplotlib.pyplot as plt
         fig = plt.figure()
         ax = fig.add_subplot(111)
         time = np.linspace(0,sim_time,int(sim_time/self.dt)+1)
@@ -326,6 +286,7 @@ class simpleModelFsLts(object):
            sim_time: duration of the simulation
         '''
         spiketrains = self._getSpikeTimes(data)
+        import matplotlib.pyplot as plt
         fig = plt.figure()
         ax = fig.add_subplot(111)
         for i,times in enumerate(spiketrains):
@@ -346,25 +307,8 @@ class simpleModelFsLts(object):
            meg: the simulated MEG signal
            sim_time: the duration of the simulation
         '''
-        # fourier sample rate
-        fs = 1. / self.dt	
-        
-        tn = np.linspace(0,sim_time,int(sim_time/self.dt)+1)
-        
-        npts = len(meg)
-        startpt = int(0.2*fs)
-        
-        if (npts - startpt)%2!=0:
-            startpt = startpt + 1
-        
-        meg = meg[startpt:]
-        tn = tn[startpt:]
-        nfft = len(tn)    
-        
-        pxx,freqs=mlab.psd(meg,NFFT=nfft,Fs=fs,noverlap=0,window=mlab.window_none)
-        pxx[0] = 0.0
-
-        return pxx,freqs
+        # the first 0.2 ms are discarded (see spectral.transientCut())
+        return spectral.powerSpectrum(meg,self.dt,sim_time=sim_time)
     
            
            
@@ -376,6 +320,7 @@ class simpleModelFsLts(object):
             psd: power spectral density vector
             fmax: maximum frequency to display
         '''
+        import matplotlib.pyplot as plt
         fig = plt.figure()
         ax = fig.add_subplot(111)
     
@@ -398,45 +343,38 @@ class simpleModelFsLts(object):
            Parameters:
            neuron: the single neuron trace
         '''
-        spike_times = []
-        old = 0.0
-        for i,n in enumerate(neuron):
+        return spikeTimes(neuron,self.dt)[1].tolist()
 
-          # if theta passes (2l-1)*pi, l integer, with dtheta/dt>0 then the neuron spikes (see Boergers and Kopell, 2003)
-          if (n%(2*np.pi))>np.pi and (old%(2*np.pi))<np.pi:
-              spike_time = i*self.dt
-              spike_times.append(spike_time)
-          old = n
-        
-        return spike_times
-        
     def _getSpikeTimes(self,data):
         '''
            Calculates the spike times from an array of theta neuron traces
            Parameters:
            data: the traces array
         '''
-        nx,ny = data.shape
-        spike_times_array = [None]*nx
-        for i in range(nx):
-            spike_times_array[i] = self._getSingleSpikeTimes(data[i,:])
-        
-        return spike_times_array
-    
-    def _noise(self,t,tn):
-        t  = t * self.dt
-        if t-tn>0:
-            value = (self.A*(np.exp(-(t-tn)/self.tau_ex)-np.exp(-(t-tn)/self.tau_R)))/(self.tau_ex-self.tau_R)
-        else:
-            value = 0
-    
-        return value
-
-
-
-
-
-
-
-
+        return spikeTrains(*spikeTimes(data,self.dt))
 
+    def _connectivity(self,custom=True):
+        '''
+           Returns the (n_pre,n_post) weight matrices of the projections
+           
+           In the matrix representation all gating variables are driven by the presynaptic phase and summed over
+           the presynaptic cells (all-to-all connectivity), except for the E-E and B-B gating matrices which are
+           driven by the phase of the postsynaptic cell, so that every cell receives n_pre times its own gating
+           variable. The defaults reproduce both cases and can be replaced per projection via the connectivity
+           attribute (unless custom is False).
+        '''
+        W = {'ee' : self.n_ex*np.eye(self.n_ex),
+             'eb' : np.ones((self.n_ex,self.n_fs)),
+             'ec' : np.ones((self.n_ex,self.n_som)),
+             'be' : np.ones((self.n_fs,self.n_ex)),
+             'bb' : self.n_fs*np.eye(self.n_fs),
+             'bc' : np.ones((self.n_fs,self.n_som)),
+             'ce' : np.ones((self.n_som,self.n_ex)),
+             'cb' : np.ones((self.n_som,self.n_fs))}
+        if custom and self.connectivity is not None:
+            for key,weights in self.connectivity.items():
+                weights = np.asarray(weights,dtype=float)
+                if key not in W or weights.shape != W[key].shape:
+                    raise ValueError('invalid connectivity for projection %s' % key)
+                W[key] = weights
+        return W
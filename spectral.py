@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+# ------------------------------------------------------------------------------
+# Copyright (c) 2020, Christoph Metzner
+# Distributed under the (new) BSD License.
+#
+# Contributors: Christoph Metzner (cmetzner@ni.tu-berlin.de)
+# ------------------------------------------------------------------------------
+# Batched power spectral densities of MEG signals.
+#
+# The spectra of all traces of an array (trials, conditions x trials, ...) are
+# computed in one real FFT pass along the last axis. The default method
+# reproduces mlab.psd(meg,NFFT=nfft,Fs=fs,noverlap=0,window=mlab.window_none)
+# as used by the analysis scripts (a single rectangular-windowed periodogram,
+# one-sided, scaled by frequency), including their transient cut and the
+# zeroed DC component, without importing matplotlib.
+#
+# ------------------------------------------------------------------------------
+import functools
+
+import numpy as np
+
+
+@functools.lru_cache(maxsize=None)
+def frequencies(nfft,dt):
+    '''Returns the (read-only, cached) frequencies of a one-sided spectrum.
+    Parameters
+    -----------------
+    nfft : int
+        The length of the transformed segments.
+    dt   : float
+        The time step (the frequencies are in units of 1/dt).
+    Returns
+    -----------------
+    ndarray
+        1D array containing the nfft//2+1 frequencies.
+    '''
+    freqs = np.fft.rfftfreq(nfft,dt)
+    freqs.flags.writeable = False
+    return freqs
+
+
+def transientCut(n_time,dt,sim_time=None,transient=0.2):
+    '''Returns the first sample and the FFT length of the analysed part of a
+    signal, following the analysis scripts (average.py, analysis.py).
+
+    The first int(transient/dt) samples are discarded (the scripts call this
+    a 200 ms cut, with dt in ms it is 0.2 ms; the default is kept for
+    reproducibility), plus one more if the remainder has an odd length. If
+    sim_time is given the FFT length is the one of the time grid
+    linspace(0,sim_time,int(sim_time/dt)+1) after the cut, i.e. signals one
+    sample shorter than the grid are zero-padded by one sample.
+    Parameters
+    -----------------
+    n_time    : int
+        The number of samples of the signal.
+    dt        : float
+        The time step.
+    sim_time  : float
+        The duration of the simulation (optional).
+    transient : float
+        The discarded initial time.
+    Returns
+    -----------------
+    int,int
+        The first sample and the FFT length.
+    '''
+    start = int(transient*(1./dt))
+    if (n_time-start) % 2 != 0:
+        start = start+1
+    n_grid = int(sim_time/dt)+1 if sim_time is not None else n_time
+    return start,n_grid-start
+
+
+def analysisTransient(warmup=0.0,transient=0.2):
+    '''Returns the initial time to discard from signals (see transientCut()):
+    the cut of the analysis scripts, or none for signals that start after a
+    warm-up of the network (see simpleModel.runBatch()).
+    Parameters
+    -----------------
+    warmup    : float
+        The duration of the warm-up preceding the signals (0: none).
+    transient : float
+        The cut of signals without a warm-up.
+    Returns
+    -----------------
+    float
+        The discarded initial time.
+    '''
+    return 0.0 if warmup else transient
+
+
+def _onesided(power,nfft):
+    '''Doubles the power of the frequencies with negative counterparts.'''
+    last = nfft//2 if nfft % 2 == 0 else nfft//2+1
+    power[...,1:last] *= 2.0
+    return power
+
+
+def _windows(method,nfft,segment,tapers):
+    '''Returns the (windows,nfft) data windows and the segment length.'''
+    if method == 'periodogram':
+        return np.ones((1,nfft)),nfft
+    if method == 'welch':
+        segment = nfft//8 if segment is None else min(int(segment),nfft)
+        return np.hanning(segment)[None,:],segment
+    if method == 'multitaper':
+        # sine tapers (Riedel & Sidorenko, 1995), orthonormal
+        n = np.arange(1,nfft+1)
+        k = np.arange(1,tapers+1)[:,None]
+        return np.sqrt(2.0/(nfft+1))*np.sin(np.pi*k*n/(nfft+1)),nfft
+    raise ValueError("method must be 'periodogram', 'welch' or 'multitaper'")
+
+
+def _coefficients(data,dt,sim_time,transient,method,segment,overlap,tapers):
+    '''Returns the windowed Fourier coefficients of the analysed part of the
+    signals (shape (...,windows*segments,frequencies)), the scaling of their
+    squared magnitudes and the FFT length.'''
+    data = np.asarray(data,dtype=float)
+    start,nfft = transientCut(data.shape[-1],dt,sim_time,transient)
+    x = data[...,start:start+nfft]
+    if x.shape[-1] < nfft:
+        pad = [(0,0)]*(x.ndim-1)+[(0,nfft-x.shape[-1])]
+        x = np.pad(x,pad)
+    windows,length = _windows(method,nfft,segment,tapers)
+    if method == 'welch':
+        step = max(1,int(round(length*(1.0-overlap))))
+        x = np.lib.stride_tricks.sliding_window_view(x,length,axis=-1)
+        x = x[...,::step,:]
+    else:
+        x = x[...,None,:]
+    coefficients = np.fft.rfft(x*windows,axis=-1)
+    scale = 1.0/((1./dt)*np.sum(windows[0]**2))
+    return coefficients,scale,length
+
+
+def powerSpectrum(data,dt,sim_time=None,transient=0.2,method='periodogram',
+                  segment=None,overlap=0.5,tapers=5,zero_dc=True):
+    '''Calculates the power spectral densities of a batch of signals.
+    Parameters
+    -----------------
+    data      : ndarray
+        Array of signals (time along the last axis, e.g. (trials,T) or
+        (conditions,trials,T)).
+    dt        : float
+        The time step.
+    sim_time  : float
+        The duration of the simulation (see transientCut()).
+    transient : float
+        The discarded initial time (see transientCut(); 0 analyses the
+        whole signal).
+    method    : str
+        'periodogram' (the rectangular-windowed periodogram of the analysis
+        scripts), 'welch' (averaged Hann-windowed segments) or 'multitaper'
+        (sine tapers).
+    segment   : int
+        The segment length of Welch's method (default: an eighth of the
+        signal).
+    overlap   : float
+        The overlap of the segments of Welch's method (as a fraction).
+    tapers    : int
+        The number of tapers of the multitaper method.
+    zero_dc   : bool
+        Whether to set the power at frequency 0 to 0 (as the scripts do).
+    Returns
+    -----------------
+    ndarray,ndarray
+        The power spectral densities (shape (...,frequencies)) and the
+        according frequencies.
+    '''
+    coefficients,scale,nfft = _coefficients(data,dt,sim_time,transient,method,
+                                            segment,overlap,tapers)
+    power = np.mean(np.abs(coefficients)**2,axis=-2)*scale
+    power = _onesided(power,nfft)
+    if zero_dc:
+        power[...,0] = 0.0
+    return power,frequencies(nfft,dt)
+
+
+def trialSpectra(data,dt,sim_time=None,transient=0.2,method='periodogram',
+                 segment=None,overlap=0.5,tapers=5,zero_dc=True):
+    '''Calculates the single-trial and trial-averaged spectra of a batch of
+    trials in one FFT pass (parameters as in powerSpectrum()).
+
+    Besides the mean of the single-trial spectra (the total power), the
+    spectrum of the average signal (the evoked power, i.e. the quantity of
+    average.py) is returned; as the Fourier transform is linear it is
+    obtained from the average of the Fourier coefficients.
+    Parameters
+    -----------------
+    data : ndarray
+        Array of signals of shape (...,trials,T).
+    Returns
+    -----------------
+    dict
+        'single' (shape (...,trials,frequencies)), 'mean' and 'evoked'
+        (shape (...,frequencies)) and 'freqs'.
+    '''
+    coefficients,scale,nfft = _coefficients(data,dt,sim_time,transient,method,
+                                            segment,overlap,tapers)
+    single = np.mean(np.abs(coefficients)**2,axis=-2)*scale
+    evoked = np.mean(np.abs(np.mean(coefficients,axis=-3))**2,axis=-2)*scale
+    spectra = {'single' : _onesided(single,nfft),
+               'evoked' : _onesided(evoked,nfft)}
+    if zero_dc:
+        spectra['single'][...,0] = 0.0
+        spectra['evoked'][...,0] = 0.0
+    spectra['mean'] = np.mean(spectra['single'],axis=-2)
+    spectra['freqs'] = frequencies(nfft,dt)
+    return spectra
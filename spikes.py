@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (c) 2017, Christoph Metzner
+# Distributed under the (new) BSD License.
+#
+# Contributors: Christoph Metzner (c.metzner@herts.ac.uk)
+# -----------------------------------------------------------------------------
+# Vectorized spike detection for theta neuron traces.
+#
+# A theta neuron spikes when theta passes (2l-1)*pi, l integer, with
+# dtheta/dt>0 (see Boergers and Kopell, 2003). Spikes are detected as the
+# time points i where theta mod 2pi is larger than pi while it was smaller than
+# pi at time point i-1 (the trace is assumed to start from 0 before i=0). The
+# spike time is then simply the product of the index and the time step.
+# -----------------------------------------------------------------------------
+import numpy as np
+
+
+def spikeTimes(data,dt,block=None):
+    '''Calculates the spike times of an array of theta neuron traces.
+
+    The spike times are returned in a compressed (CSR-like) format: the
+    spike times of trace i are times[offsets[i]:offsets[i+1]], the traces
+    being numbered in C order over all but the last (time) axis.
+    Parameters
+    -----------------
+    data  : ndarray
+        nD array containing the traces, time being the last axis, e.g.
+        (cells,time points) or (trials,cells,time points). Memory-mapped
+        arrays are processed in blocks of traces.
+    dt    : float
+        The time step.
+    block : int
+        The number of traces processed at once (default: all traces of an
+        in-memory array, 64 for memory-mapped arrays).
+    Returns
+    -----------------
+    ndarray,ndarray
+        The offsets (number of traces + 1) and the spike times.
+    '''
+    n_time = data.shape[-1]
+    traces = data.reshape((-1,n_time))
+    n_traces = traces.shape[0]
+    if block is None:
+        block = 64 if isinstance(data,np.memmap) else max(n_traces,1)
+
+    counts = np.zeros((n_traces,),dtype=np.intp)
+    times = []
+    for start in range(0,n_traces,block):
+        phase = np.mod(np.asarray(traces[start:start+block]),2*np.pi)
+        above = phase > np.pi
+        # phase of the previous time point (0 before the first one)
+        below = np.empty_like(above)
+        below[:,0] = True
+        below[:,1:] = phase[:,:-1] < np.pi
+        rows,indices = np.nonzero(above & below)
+        counts[start:start+block] = np.bincount(rows,minlength=len(phase))
+        times.append(indices*dt)
+
+    offsets = np.zeros((n_traces+1,),dtype=np.intp)
+    np.cumsum(counts,out=offsets[1:])
+    times = np.concatenate(times) if times else np.zeros((0,))
+    return offsets,times
+
+
+def spikeTrains(offsets,times):
+    '''Converts compressed spike times into a list of lists of spike times.
+    Parameters
+    -----------------
+    offsets : ndarray
+        The offsets of the spike times of every trace.
+    times   : ndarray
+        The spike times.
+    Returns
+    -----------------
+    list
+        A list containing lists of spike times.
+    '''
+    return [times[offsets[i]:offsets[i+1]].tolist()
+            for i in range(len(offsets)-1)]
+
+
+class spikeRecorder(object):
+    '''Detects spikes online while a network is integrated.
+
+    After every time step the new phases are passed to update(); the
+    threshold crossings (with respect to the phases of the previous time
+    step) are appended to a growable event buffer, so that the spike times
+    are available without keeping the theta traces. The result is identical
+    to spikeTimes() applied to the recorded traces.
+
+    Attributes
+    -----------------
+    n_traces : int
+        The number of traces (e.g. cells, or trials times cells).
+    capacity : int
+        The initial capacity of the event buffer.
+    '''
+
+    def __init__(self,n_traces,capacity=1024):
+        self.n_traces = n_traces
+        self.n_events = 0
+        self.traces = np.empty((capacity,),dtype=np.intp)
+        self.steps = np.empty((capacity,),dtype=np.intp)
+        # the phase before the first time point is 0
+        self.below = np.ones((n_traces,),dtype=bool)
+
+    def update(self,t,theta):
+        '''Records the spikes of time step t.
+        Parameters
+        -----------------
+        t     : int
+            The index of the time step.
+        theta : ndarray
+            The phases at time step t (n_traces values in C order).
+        '''
+        phase = np.mod(theta,2*np.pi).reshape((-1,))
+        spiking = np.nonzero((phase > np.pi) & self.below)[0]
+        self.below = phase < np.pi
+        self._append(spiking,t)
+
+    def updateBlock(self,t,theta,first=0):
+        '''Records the spikes of several consecutive time steps of a subset of
+        the traces.
+
+        The traces of a subset have to be passed in time order, but subsets
+        can be processed one after the other (e.g. trial by trial).
+        Parameters
+        -----------------
+        t     : int
+            The index of the first time step.
+        theta : ndarray
+            2D array containing the phases of the traces first,first+1,...
+            (rows) at the time steps t,t+1,... (columns).
+        first : int
+            The index of the first trace.
+        '''
+        n_traces = theta.shape[0]
+        phase = np.mod(theta,2*np.pi)
+        above = phase > np.pi
+        below = np.empty_like(above)
+        below[:,0] = self.below[first:first+n_traces]
+        below[:,1:] = phase[:,:-1] < np.pi
+        self.below[first:first+n_traces] = phase[:,-1] < np.pi
+        rows,steps = np.nonzero(above & below)
+        self._append(rows+first,steps+t)
+
+    def state(self):
+        '''Returns a copy of the state of the recorder (e.g. for a
+        checkpoint).'''
+        return {'below' : self.below.copy(),
+                'traces' : self.traces[:self.n_events].copy(),
+                'steps' : self.steps[:self.n_events].copy()}
+
+    def restore(self,state):
+        '''Continues the recording from a state returned by state().'''
+        if len(state['below']) != self.n_traces:
+            raise ValueError('the state has %d traces instead of %d'
+                             % (len(state['below']),self.n_traces))
+        self.below = np.array(state['below'],dtype=bool)
+        self.n_events = 0
+        self._append(np.asarray(state['traces'],dtype=np.intp),
+                     np.asarray(state['steps'],dtype=np.intp))
+
+    def _append(self,traces,steps):
+        '''Appends events to the buffer (growing it if required).'''
+        n = len(traces)
+        if n == 0:
+            return
+        if self.n_events+n > len(self.traces):
+            capacity = max(2*len(self.traces),self.n_events+n)
+            self.traces = np.resize(self.traces,(capacity,))
+            self.steps = np.resize(self.steps,(capacity,))
+        self.traces[self.n_events:self.n_events+n] = traces
+        self.steps[self.n_events:self.n_events+n] = steps
+        self.n_events = self.n_events+n
+
+    def spikeTimes(self,dt):
+        '''Returns the recorded spikes in the format of spikeTimes().
+        Parameters
+        -----------------
+        dt : float
+            The time step.
+        Returns
+        -----------------
+        ndarray,ndarray
+            The offsets (number of traces + 1) and the spike times.
+        '''
+        traces = self.traces[:self.n_events]
+        # the events of every trace are recorded in time order, a stable
+        # sort keeps it
+        order = np.argsort(traces,kind='stable')
+        times = self.steps[:self.n_events][order]*dt
+        offsets = np.zeros((self.n_traces+1,),dtype=np.intp)
+        np.cumsum(np.bincount(traces,minlength=self.n_traces),
+                  out=offsets[1:])
+        return offsets,times
@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+# ------------------------------------------------------------------------------
+# Copyright (c) 2020, Christoph Metzner
+# Distributed under the (new) BSD License.
+#
+# Contributors: Christoph Metzner (cmetzner@ni.tu-berlin.de)
+# ------------------------------------------------------------------------------
+# A single on-disk store for the trials of an exploration, replacing one .npy
+# file per trial. The store is a directory holding a JSON file with the
+# labelled dimensions (condition, g_de, frequency, seed, time) and one
+# compressed chunk per (condition, g_de, frequency) containing the signals of
+# all seeds.
+#
+# ------------------------------------------------------------------------------
+import json
+import os
+import re
+
+import numpy as np
+
+from cache import atomicWrite
+
+
+class trialStore(object):
+    '''A chunked, compressed store of the trials of an exploration.
+
+    The coordinates of the dimensions condition, g_de, frequency and seed
+    grow as trials are written; reading only decompresses the chunks of the
+    selected (condition,g_de,frequency) combinations.
+
+    Attributes
+    -----------------
+    path     : str
+        The directory of the store.
+    dt       : float
+        The time step of the stored signals.
+    variable : str
+        The name of the stored signal (e.g. 'meg').
+    warmup   : float
+        The duration of the warm-up preceding the stored signals (see
+        simpleModel.runBatch(); 0: none), i.e. whether their spectra need
+        a transient cut (see spectral.analysisTransient()).
+
+    An existing store is opened with its own dt and warmup; passing a
+    different dt or warmup raises a ValueError, so that trials of different
+    time steps or warm-ups are not mixed in one store.
+    '''
+
+    dims = ('condition','g_de','frequency','seed','time')
+
+    def __init__(self,path,dt=None,variable='meg',warmup=None):
+        self.path = path
+        self.variable = variable
+        metadata = os.path.join(path,'store.json')
+        if os.path.exists(metadata):
+            with open(metadata) as f:
+                meta = json.load(f)
+            self.dt = meta['dt']
+            self.variable = meta['variable']
+            self.n_time = meta['n_time']
+            self.coords = meta['coords']
+            self.warmup = meta.get('warmup',0.0)
+            for name,value in (('dt',dt),('warmup',warmup)):
+                if value is not None and float(value) != getattr(self,name):
+                    raise ValueError('the store %s has %s=%g, not %g'
+                                     % (path,name,getattr(self,name),value))
+        else:
+            if not os.path.isdir(os.path.join(path,'chunks')):
+                os.makedirs(os.path.join(path,'chunks'))
+            self.dt = dt
+            self.warmup = 0.0 if warmup is None else warmup
+            self.n_time = None
+            self.coords = {'condition' : [], 'g_de' : [], 'frequency' : [],
+                           'seed' : []}
+            self._writeMetadata()
+
+    def _writeMetadata(self):
+        meta = {'dims' : list(self.dims), 'dt' : self.dt,
+                'variable' : self.variable, 'n_time' : self.n_time,
+                'warmup' : self.warmup,
+                'coords' : self.coords}
+        atomicWrite(os.path.join(self.path,'store.json'),
+                    lambda f: f.write(json.dumps(meta,indent=1).encode()))
+
+    def _index(self,dim,value,add=False):
+        '''Returns the index of a coordinate value (adding it if required).'''
+        if dim != 'condition':
+            value = int(value) if dim == 'seed' else float(value)
+        coords = self.coords[dim]
+        if value in coords:
+            return coords.index(value)
+        if not add:
+            raise KeyError('%s %s is not in the store' % (dim,value))
+        coords.append(value)
+        return len(coords)-1
+
+    def _add(self,keys):
+        '''Adds the coordinates of trials (in the given order) and returns
+        the (ci,gi,fi,si) indices of the trials.'''
+        n_coords = sum(len(values) for values in self.coords.values())
+        indices = [tuple(self._index(dim,value,True) for dim,value
+                         in zip(self.dims,key)) for key in keys]
+        if sum(len(values) for values in self.coords.values()) > n_coords:
+            self._writeMetadata()
+        return indices
+
+    def reserve(self,keys):
+        '''Adds the coordinates of trials to be written later, e.g. the keys
+        of a sweep in grid order, so that the layout of the store does not
+        depend on the order in which the trials are written.
+        Parameters
+        -----------------
+        keys : list
+            The (condition,g_de,frequency,seed) of the trials.
+        '''
+        self._add(keys)
+
+    def _chunkFile(self,ci,gi,fi):
+        return os.path.join(self.path,'chunks','%d.%d.%d.npz' % (ci,gi,fi))
+
+    def _readChunk(self,ci,gi,fi):
+        '''Returns the (seed,time) data and the filled mask of a chunk.'''
+        n_seeds = len(self.coords['seed'])
+        data = np.full((n_seeds,self.n_time),np.nan)
+        filled = np.zeros((n_seeds,),dtype=bool)
+        filename = self._chunkFile(ci,gi,fi)
+        if os.path.exists(filename):
+            with np.load(filename) as chunk:
+                n = len(chunk['filled'])
+                data[:n] = chunk['data']
+                filled[:n] = chunk['filled']
+        return data,filled
+
+    def write(self,key,data):
+        '''Writes (or overwrites) the signal of a trial.
+        Parameters
+        -----------------
+        key  : tuple
+            The (condition,g_de,frequency,seed) of the trial.
+        data : ndarray
+            1D array containing the signal.
+        '''
+        self.writeMany([key],[data])
+
+    def writeMany(self,keys,data):
+        '''Writes the signals of several trials (each chunk only once).'''
+        data = [np.asarray(d,dtype=float) for d in data]
+        if self.n_time is None:
+            self.n_time = len(data[0])
+            self._writeMetadata()
+        for d in data:
+            if len(d) != self.n_time:
+                raise ValueError('the store holds signals of length %d'
+                                 % self.n_time)
+        chunks = {}
+        for (ci,gi,fi,si),d in zip(self._add(keys),data):
+            chunks.setdefault((ci,gi,fi),[]).append((si,d))
+        for (ci,gi,fi),trials in chunks.items():
+            chunk,filled = self._readChunk(ci,gi,fi)
+            for si,d in trials:
+                chunk[si] = d
+                filled[si] = True
+            atomicWrite(self._chunkFile(ci,gi,fi),
+                        lambda f: np.savez_compressed(f,data=chunk,
+                                                      filled=filled))
+
+    def __call__(self,key,result):
+        '''Writes the first output of a trial (usable as a runSweep()
+        callback).'''
+        self.write(key,result[0])
+
+    def read(self,condition=None,g_de=None,frequency=None,seed=None,
+             time=None):
+        '''Reads a selection of the store.
+
+        Every selection is either None (all coordinates), a single value
+        (the dimension is dropped) or a list of values. Missing trials are
+        NaN.
+        Parameters
+        -----------------
+        condition : str or list
+        g_de      : float or list
+        frequency : float or list
+        seed      : int or list
+        time      : slice
+            A slice of time points.
+        Returns
+        -----------------
+        ndarray
+            An array whose axes are the non-scalar selections in the order
+            condition, g_de, frequency, seed, time.
+        '''
+        selection = []
+        scalar = []
+        for dim,values in (('condition',condition),('g_de',g_de),
+                           ('frequency',frequency),('seed',seed)):
+            if values is None:
+                selection.append(list(range(len(self.coords[dim]))))
+                scalar.append(False)
+            elif np.ndim(values) == 0:
+                selection.append([self._index(dim,values)])
+                scalar.append(True)
+            else:
+                selection.append([self._index(dim,v) for v in values])
+                scalar.append(False)
+        time = slice(None) if time is None else time
+        n_time = len(range(*time.indices(self.n_time or 0)))
+
+        ci,gi,fi,si = selection
+        out = np.full((len(ci),len(gi),len(fi),len(si),n_time),np.nan)
+        for i,c in enumerate(ci):
+            for j,g in enumerate(gi):
+                for k,f in enumerate(fi):
+                    if not os.path.exists(self._chunkFile(c,g,f)):
+                        continue
+                    chunk,filled = self._readChunk(c,g,f)
+                    out[i,j,k] = chunk[si][:,time]
+
+        index = tuple(0 if s else slice(None) for s in scalar)
+        return out[index]
+
+    def filled(self):
+        '''Returns a (condition,g_de,frequency,seed) mask of stored trials.'''
+        shape = tuple(len(self.coords[dim]) for dim in self.dims[:4])
+        mask = np.zeros(shape,dtype=bool)
+        for ci in range(shape[0]):
+            for gi in range(shape[1]):
+                for fi in range(shape[2]):
+                    if os.path.exists(self._chunkFile(ci,gi,fi)):
+                        mask[ci,gi,fi] = self._readChunk(ci,gi,fi)[1]
+        return mask
+
+
+def importExploration(directory,store,pattern='-MEG.npy'):
+    '''Imports the per-trial files of an exploration into a store.
+
+    The files are expected in the layout written by run_exploration.py,
+    i.e. <directory>/<...>/<Condition>/<filename>drive_strength_<g_de>_
+    drive_frequency_<frequency>_seed_<seed>-MEG.npy. The condition is the
+    lower case name of the directory containing the file (e.g.
+    'G_and_Tau_Inh' becomes 'g_and_tau_inh').
+    Parameters
+    -----------------
+    directory : str
+        The root directory of the exploration (e.g. 'Exploration').
+    store     : trialStore
+        The store to write to.
+    pattern   : str
+        The suffix of the files to import.
+    Returns
+    -----------------
+    int
+        The number of imported trials.
+    '''
+    regex = re.compile(r'drive_strength_(?P<g_de>[0-9.]+)'
+                       r'_drive_frequency_(?P<frequency>[0-9.]+)'
+                       r'_seed_(?P<seed>\d+)'+re.escape(pattern)+'$')
+    n_trials = 0
+    for root,dirs,files in os.walk(directory):
+        dirs.sort()
+        keys = []
+        data = []
+        for name in sorted(files):
+            match = regex.search(name)
+            if match is None:
+                continue
+            condition = os.path.basename(root).lower()
+            keys.append((condition,float(match.group('g_de')),
+                         float(match.group('frequency')),
+                         int(match.group('seed'))))
+            data.append(np.load(os.path.join(root,name)))
+        if keys:
+            store.writeMany(keys,data)
+            n_trials = n_trials+len(keys)
+    return n_trials
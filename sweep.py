@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+# ------------------------------------------------------------------------------
+# Copyright (c) 2020, Christoph Metzner
+# Distributed under the (new) BSD License.
+#
+# Contributors: Christoph Metzner (cmetzner@ni.tu-berlin.de)
+# ------------------------------------------------------------------------------
+# References:
+#
+# * Vierling-Claassen, D., Siekmeier, P., Stufflebeam, S., & Kopell, N. (2008).
+#   Modeling GABA alterations in schizophrenia: a link between impaired
+#   inhibition and altered gamma and beta range auditory entrainment.
+#   Journal of neurophysiology, 99(5), 2656-2671.
+# ------------------------------------------------------------------------------
+# Runs grids of trials of the model (drive strength x condition x drive
+# frequency x seed) on a pool of worker processes.
+#
+# ------------------------------------------------------------------------------
+import time as timer
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from aggregate import trialAverager
+from cache import trialCache, trialKey
+from simple_model_class import simpleModel
+from store import trialStore
+
+
+# The inhibition conditions of the exploration (see run_exploration.py)
+CONDITIONS = {
+    # Control condition
+    'control': {'tau_inh': 8.0, 'g_ie': 0.015, 'g_ii': 0.02, 'b_inh': -0.01},
+    # Tau Inh condition (representing prolonged IPSC decay times)
+    'tau_inh': {'tau_inh': 28.0, 'g_ie': 0.015, 'g_ii': 0.02, 'b_inh': -0.01},
+    # G Inh condition (representing reduced GABA availability)
+    'g_inh': {'tau_inh': 8.0, 'g_ie': 0.0075, 'g_ii': 0.01, 'b_inh': -0.01},
+    # Tau and G Inh condition
+    'g_and_tau_inh': {'tau_inh': 28.0, 'g_ie': 0.0075, 'g_ii': 0.01,
+                      'b_inh': -0.01},
+}
+
+
+class sweepGrid(object):
+    '''A declarative grid of trials of the simple model.
+
+    Every trial is identified by its key (condition, g_de, drive frequency,
+    seed); the trials are ordered by condition, drive strength, drive
+    frequency and seed (in the order given).
+
+    Attributes
+    -----------------
+    g_de              : list
+        drive strengths (Drive-E weights)
+    conditions        : dict
+        maps condition names to dicts of model parameters (e.g. CONDITIONS)
+    drive_frequencies : list
+        drive frequencies
+    seeds             : list
+        seeds for the random number generator
+    time              : float
+        duration of the simulation of a trial
+    params            : dict
+        model parameters shared by all trials (e.g. dt, A, background_rate)
+    warmup            : float
+        duration of the warm-up without drive preceding every trial (0:
+        none, see simpleModel.runBatch())
+    '''
+
+    def __init__(self,g_de,conditions,drive_frequencies,seeds,time=500.0,
+                 params=None,warmup=0.0):
+        self.g_de = list(g_de)
+        self.conditions = dict(conditions)
+        self.drive_frequencies = list(drive_frequencies)
+        self.seeds = [int(seed) for seed in seeds]
+        self.time = time
+        self.params = dict(params) if params is not None else {}
+        self.warmup = warmup
+
+    def __len__(self):
+        return (len(self.conditions)*len(self.g_de)
+                *len(self.drive_frequencies)*len(self.seeds))
+
+    def modelParameters(self,condition,g_de):
+        '''Returns the model parameters of a condition and drive strength.'''
+        params = dict(self.params)
+        params.update(self.conditions[condition])
+        params['g_de'] = g_de
+        return params
+
+    def keys(self):
+        '''Returns the keys of all trials in grid order.'''
+        return [(condition,g_de,f,seed) for condition in self.conditions
+                for g_de in self.g_de for f in self.drive_frequencies
+                for seed in self.seeds]
+
+    def chunks(self,chunksize):
+        '''Splits the grid into tasks of at most chunksize seeds.
+
+        The split only depends on the grid and chunksize, so that every
+        trial is always simulated in the same batch.
+        Returns
+        -----------------
+        list
+            A list of (condition,g_de,drive frequency,seeds) tuples.
+        '''
+        chunks = []
+        for condition in self.conditions:
+            for g_de in self.g_de:
+                for f in self.drive_frequencies:
+                    for i in range(0,len(self.seeds),chunksize):
+                        chunks.append((condition,g_de,f,
+                                       self.seeds[i:i+chunksize]))
+        return chunks
+
+
+def _runChunk(params,time,drive_frequency,seeds,record,warmup=0.0,
+              warmup_cache=None):
+    '''Simulates the trials of one chunk (executed in a worker process).'''
+    model = simpleModel(**params)
+    return model.runBatch(seeds,[drive_frequency],time,record,warmup=warmup,
+                          warmup_cache=warmup_cache)
+
+
+def runSweep(grid,max_workers=None,chunksize=5,record=('meg',),
+             callback=None,verbose=1,cache=None,keep=True,
+             warmup_cache=None,chunk_callback=None):
+    '''Runs all trials of a grid on a pool of worker processes.
+    Parameters
+    -----------------
+    grid        : sweepGrid
+        The grid of trials.
+    max_workers : int
+        The number of worker processes (None: number of CPUs).
+    chunksize   : int
+        The number of seeds simulated together (in one vectorized pass) by
+        a worker.
+    record      : tuple
+        The outputs to record, any of 'meg', 'ex' and 'inh'.
+    callback    : callable
+        Called as callback(key,result) for every trial as soon as its chunk
+        is finished, result being the (MEG,theta_ex,theta_inh) tuple of the
+        trial.
+    chunk_callback : callable
+        Called as chunk_callback(keys,results) once for every finished
+        chunk (and once for the trials of a chunk found in the cache) with
+        the keys and the (MEG,theta_ex,theta_inh) tuples of its trials, e.g.
+        to write them to a trialStore at once.
+    verbose     : int
+        A flag whether to report the progress (in trials per second).
+    cache       : trialCache
+        If given, trials found in the cache are not simulated again and
+        newly simulated trials are added to it, so that an interrupted sweep
+        can be resumed.
+    keep        : bool
+        Whether to keep the results of all trials (with keep=False they are
+        only passed to the callback, e.g. a trialAverager, so that the
+        memory does not grow with the number of trials).
+    warmup_cache : str
+        The directory the settled states of the warm-ups are shared in by
+        the workers (see simpleModel.runBatch(); only with grid.warmup).
+    Returns
+    -----------------
+    dict
+        A dict mapping the key (condition,g_de,drive frequency,seed) of
+        every trial to its (MEG,theta_ex,theta_inh) tuple (empty with
+        keep=False).
+    '''
+    results = {}
+    n_done = 0
+    cache_keys = {}
+    chunks = []
+    # trials after a warm-up are different trials (keys without a warm-up
+    # are those of earlier versions)
+    extra = {'warmup' : grid.warmup} if grid.warmup else {}
+    for condition,g_de,f,seeds in grid.chunks(chunksize):
+        if cache is not None:
+            model = simpleModel(**grid.modelParameters(condition,g_de))
+            missing = []
+            found = []
+            for seed in seeds:
+                key = (condition,g_de,f,seed)
+                cache_keys[key] = trialKey(model,grid.time,seed=seed,
+                                           drive_frequency=f,**extra)
+                cached = cache.get(cache_keys[key],record)
+                if cached is None:
+                    missing.append(seed)
+                    continue
+                result = tuple(cached.get(name) if name in record else None
+                               for name in simpleModel.outputs)
+                if keep:
+                    results[key] = result
+                n_done = n_done+1
+                found.append((key,result))
+                if callback is not None:
+                    callback(key,result)
+            if found and chunk_callback is not None:
+                chunk_callback([key for key,result in found],
+                               [result for key,result in found])
+            seeds = missing
+        if seeds:
+            chunks.append((condition,g_de,f,seeds))
+
+    if verbose and n_done:
+        print('%d/%d trials found in the cache' % (n_done,len(grid)))
+
+    n_cached = n_done
+    start = timer.time()
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+        for chunk in chunks:
+            condition,g_de,f,seeds = chunk
+            future = executor.submit(_runChunk,
+                                     grid.modelParameters(condition,g_de),
+                                     grid.time,f,seeds,record,grid.warmup,
+                                     warmup_cache)
+            futures[future] = chunk
+
+        for future in as_completed(futures):
+            condition,g_de,f,seeds = futures[future]
+            outputs = future.result()
+            finished = []
+            for j,seed in enumerate(seeds):
+                result = tuple(output[j] if output is not None else None
+                               for output in outputs)
+                key = (condition,g_de,f,seed)
+                if keep:
+                    results[key] = result
+                n_done = n_done+1
+                if cache is not None:
+                    params = grid.modelParameters(condition,g_de)
+                    params.update({'model' : 'simpleModel', 'seed' : seed,
+                                   'drive_frequency' : f,
+                                   'time' : grid.time})
+                    params.update(extra)
+                    cache.put(cache_keys[key],
+                              dict(zip(simpleModel.outputs,result)),params)
+                finished.append((key,result))
+                if callback is not None:
+                    callback(key,result)
+            if chunk_callback is not None:
+                chunk_callback([key for key,result in finished],
+                               [result for key,result in finished])
+
+            if verbose:
+                elapsed = timer.time()-start
+                print('%d/%d trials (%.2f trials/s)'
+                      % (n_done,len(grid),(n_done-n_cached)/elapsed))
+
+    return results
+
+
+if __name__ == "__main__":
+
+    s = 2**13
+    time = 500  # simulation time (in ms)
+    dt = float(time)/float(s)
+    # warm-up without drive shared by the trials of a seed and condition
+    # (in ms; 0 reproduces the trials of the exploration)
+    warmup = 0.0
+
+    grid = sweepGrid(g_de=[0.1, 0.2, 0.3, 0.4, 0.5], conditions=CONDITIONS,
+                     drive_frequencies=[40.0, 30.0, 20.0],
+                     seeds=np.load('Seeds.npy'), time=time,
+                     params={'dt': dt, 'background_rate': 33.3, 'A': 0.5},
+                     warmup=warmup)
+
+    # the MEG signals of every finished chunk of trials are appended to the
+    # store and averaged on the fly (trialAverager.load() gives the averages
+    # of a sweep that is still running); the coordinates of the store are
+    # those of the grid, in grid order
+    store = trialStore('Exploration/store', dt=dt, warmup=warmup)
+    store.reserve(grid.keys())
+    averager = trialAverager(dt, time, warmup=store.warmup)
+
+    def collect(keys, results):
+        megs = [result[0] for result in results]
+        store.writeMany(keys, megs)
+        averager.addMany(keys, megs)
+        averager.save('Exploration/averages.npz')
+
+    runSweep(grid, cache=trialCache('Exploration/cache'),
+             chunk_callback=collect, keep=False,
+             warmup_cache='Exploration/warmup')
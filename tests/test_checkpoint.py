@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+# ------------------------------------------------------------------------------
+# Copyright (c) 2020, Christoph Metzner
+# Distributed under the (new) BSD License.
+#
+# Contributors: Christoph Metzner (cmetzner@ni.tu-berlin.de)
+# ------------------------------------------------------------------------------
+# Regression test of the checkpoint/restart of runs: a run killed after its
+# first checkpoint and resumed gives the results of an uninterrupted run.
+#
+# ------------------------------------------------------------------------------
+import numpy as np
+import pytest
+
+from checkpoint import loadCheckpoint
+import kernel
+import simple_model_class
+from simple_model_class import simpleModel
+
+
+# long enough for a checkpoint of the compiled kernel before the end (it
+# writes checkpoints at the ends of its segments of 1024 time steps)
+TIME = 120.0
+
+numba = pytest.mark.skipif(not kernel.available(),
+                           reason='numba is not installed')
+
+
+class killed(Exception):
+    '''Raised in place of the termination of a run.'''
+
+
+@pytest.mark.parametrize('backend',['numpy',pytest.param('numba',
+                                                         marks=numba)])
+@pytest.mark.parametrize('record',[('meg','ex','inh'),
+                                   ('meg','ex','inh','spikes')])
+def test_resumed_run_matches_uninterrupted_run(tmp_path,monkeypatch,
+                                               backend,record):
+    params = {'seed' : 7, 'drive_frequency' : 40.0, 'backend' : backend}
+    reference = simpleModel(**params)
+    expected = reference.run(TIME,record=record)
+
+    checkpoint = str(tmp_path/'run.npz')
+    save = simple_model_class.saveCheckpoint
+
+    def saveOnce(*args,**kwargs):
+        # the run is killed after its first checkpoint
+        save(*args,**kwargs)
+        raise killed()
+
+    monkeypatch.setattr(simple_model_class,'saveCheckpoint',saveOnce)
+    with pytest.raises(killed):
+        simpleModel(**params).run(TIME,record=record,checkpoint=checkpoint,
+                                  interval=10.0)
+    monkeypatch.setattr(simple_model_class,'saveCheckpoint',save)
+    state = loadCheckpoint(checkpoint)[0]
+    assert 0 < np.max(state['step']) < len(expected[0])-1
+
+    model = simpleModel(**params)
+    results = model.run(TIME,record=record,checkpoint=checkpoint,
+                        interval=10.0)
+    for result,output in zip(results,expected):
+        np.testing.assert_array_equal(result,output)
+    if 'spikes' in record:
+        for name in ('ex','inh'):
+            for resumed,uninterrupted in zip(model.spike_times[name],
+                                             reference.spike_times[name]):
+                np.testing.assert_array_equal(resumed,uninterrupted)
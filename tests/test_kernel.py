@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+# ------------------------------------------------------------------------------
+# Copyright (c) 2020, Christoph Metzner
+# Distributed under the (new) BSD License.
+#
+# Contributors: Christoph Metzner (cmetzner@ni.tu-berlin.de)
+# ------------------------------------------------------------------------------
+# Tests of the compiled (numba) integration kernel against the NumPy loop.
+#
+# ------------------------------------------------------------------------------
+import numpy as np
+import pytest
+
+pytest.importorskip('numba')
+from simple_model_class import simpleModel
+from simple_model_fs_lts_class import simpleModelFsLts
+
+
+TIME = 50.0
+
+
+@pytest.mark.parametrize('model,params',[
+    (simpleModel,{'drive_frequency' : 40.0}),
+    (simpleModel,{'drive_frequency' : 20.0, 'tau_inh' : 28.0,
+                  'gating_solver' : 'exponential'}),
+    (simpleModelFsLts,{'drive_frequency' : 40.0}),
+    (simpleModelFsLts,{'drive_frequency' : 20.0,
+                       'gating_solver' : 'exponential'}),
+])
+def test_numba_matches_numpy(model,params):
+    reference = model(backend='numpy',**params).run(TIME,record=('meg',))[0]
+    compiled = model(backend='numba',**params).run(TIME,record=('meg',))[0]
+    np.testing.assert_allclose(compiled,reference,rtol=0,
+                               atol=1e-10*np.max(np.abs(reference)))
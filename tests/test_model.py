@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+# ------------------------------------------------------------------------------
+# Copyright (c) 2020, Christoph Metzner
+# Distributed under the (new) BSD License.
+#
+# Contributors: Christoph Metzner (cmetzner@ni.tu-berlin.de)
+# ------------------------------------------------------------------------------
+# Tests of the vectorized runs of the simple model (several trials, parameter
+# grids) against single runs.
+#
+# ------------------------------------------------------------------------------
+import numpy as np
+import pytest
+
+from simple_model_class import simpleModel
+
+
+TIME = 50.0
+
+
+@pytest.mark.parametrize('params',[{},{'gating' : 'vector'},
+                                   {'tau_inh' : 28.0, 'g_ie' : 0.0075}])
+def test_runBatch_matches_run(params):
+    seeds = [3,11]
+    frequencies = [40.0,20.0]
+    meg,ex,inh = simpleModel(**params).runBatch(seeds,frequencies,TIME,
+                                                record=('meg','ex','inh'))
+    for i,f in enumerate(frequencies):
+        for j,seed in enumerate(seeds):
+            single = simpleModel(seed=seed,drive_frequency=f,**params).run(TIME)
+            trial = i*len(seeds)+j
+            for batch,reference in zip((meg,ex,inh),single):
+                np.testing.assert_allclose(batch[trial],reference,rtol=0,
+                                           atol=1e-12)
+
+
+def test_parameter_grid_matches_scalar_runs():
+    grid = {'g_ee' : np.array([0.015,0.02,0.01]),
+            'g_ei' : np.array([0.025,0.03,0.02]),
+            'g_ie' : np.array([0.015,0.0075,0.015]),
+            'g_ii' : np.array([0.02,0.01,0.02]),
+            'g_de' : np.array([0.3,0.1,0.5]),
+            'g_di' : np.array([0.08,0.0,0.08]),
+            'tau_inh' : np.array([8.0,28.0,8.0]),
+            'b_ex' : np.array([[-0.01],[-0.02],[0.0]]),
+            'b_inh' : np.array([[-0.01],[-0.01],[-0.02]])}
+    seeds = [3,11]
+    frequencies = [40.0,20.0]
+    meg,ex,inh = simpleModel(**grid).runBatch(seeds,frequencies,TIME,
+                                              record=('meg','ex','inh'))
+    assert meg.shape[:2] == (3,len(seeds)*len(frequencies))
+    for p in range(3):
+        params = {name : values[p].item() for name,values in grid.items()}
+        for i,f in enumerate(frequencies):
+            for j,seed in enumerate(seeds):
+                single = simpleModel(seed=seed,drive_frequency=f,
+                                     **params).run(TIME)
+                trial = i*len(seeds)+j
+                for batch,reference in zip((meg,ex,inh),single):
+                    np.testing.assert_allclose(batch[p,trial],reference,
+                                               rtol=0,atol=1e-12)
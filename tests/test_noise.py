@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+# ------------------------------------------------------------------------------
+# Copyright (c) 2020, Christoph Metzner
+# Distributed under the (new) BSD License.
+#
+# Contributors: Christoph Metzner (cmetzner@ni.tu-berlin.de)
+# ------------------------------------------------------------------------------
+# Regression tests of the noise against the original model classes: the
+# legacy spike trains against their random module loop and the recursive noise
+# filter against the direct evaluation of the noise EPSPs.
+#
+# ------------------------------------------------------------------------------
+import random
+
+import numpy as np
+import pytest
+
+from noise import noiseFilter, noiseSpikeTrains
+from simple_model_class import simpleModel
+from simple_model_fs_lts_class import simpleModelFsLts
+
+
+def legacyNoise(model,t,tn):
+    '''The noise EPSP of a noise spike at tn at time step t, as evaluated by
+    the former _noise() method of the model classes.'''
+    t  = t * model.dt
+    if t-tn>0:
+        value = (model.A*(np.exp(-(t-tn)/model.tau_ex)
+                          -np.exp(-(t-tn)/model.tau_R)))/(model.tau_ex-model.tau_R)
+    else:
+        value = 0
+
+    return value
+
+
+def baselineSpikeTrains(sizes,rate,time,seed):
+    '''The noise spike trains of the original model classes: one global
+    random.seed() per trial and exponentially distributed intervals, drawn
+    population after population and cell after cell.'''
+    random.seed(seed)
+    trains = []
+    for size in sizes:
+        population = []
+        for i in range(size):
+            spikes = []
+            total_time = 0.0
+            while total_time < time:
+                total_time = total_time+random.expovariate(rate)
+                if total_time < time:
+                    spikes.append(total_time)
+            population.append(spikes)
+        trains.append(population)
+    return trains
+
+
+@pytest.mark.parametrize('seed',[1,12345,987654321])
+@pytest.mark.parametrize('time',[50.0,500.0])
+def test_legacy_spike_trains_match_baseline(seed,time):
+    # simpleModel
+    model = simpleModel(seed=seed)
+    sizes = [model.n_ex,model.n_inh]
+    rate = model.background_rate/1000.0
+    expected = baselineSpikeTrains(sizes,rate,time,seed)
+    assert [list(trains) for trains in model._spikeTrains(time,seed)] \
+        == expected
+    assert noiseSpikeTrains(sizes,rate,time,seed,'legacy') == expected
+    # simpleModelFsLts (whose rate is computed from the mean interval)
+    model = simpleModelFsLts(seed=seed)
+    sizes = [model.n_ex,model.n_fs,model.n_som]
+    rate = 1.0/(1000*(1.0/model.background_rate))
+    assert noiseSpikeTrains(sizes,rate,time,seed,'legacy') \
+        == baselineSpikeTrains(sizes,rate,time,seed)
+
+
+@pytest.mark.parametrize('model,sizes',[
+    (simpleModel(seed=3),('n_ex','n_inh')),
+    (simpleModelFsLts(seed=3),('n_ex','n_fs','n_som')),
+])
+def test_filter_matches_direct_sum(model,sizes):
+    time = 50.0
+    n_steps = int(time/model.dt)+1
+    trains = noiseSpikeTrains([getattr(model,size) for size in sizes],
+                              model.background_rate/1000.0,time,model.seed)
+    for spike_trains in trains:
+        noise = noiseFilter(spike_trains,n_steps,model.dt,model.A,
+                            model.tau_ex,model.tau_R)
+        for t in range(1,n_steps):
+            expected = [sum(legacyNoise(model,t,tn) for tn in train)
+                        for train in spike_trains]
+            np.testing.assert_allclose(noise.step(),expected,rtol=0,
+                                       atol=1e-12)
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+# ------------------------------------------------------------------------------
+# Copyright (c) 2020, Christoph Metzner
+# Distributed under the (new) BSD License.
+#
+# Contributors: Christoph Metzner (cmetzner@ni.tu-berlin.de)
+# ------------------------------------------------------------------------------
+# Regression test of the vectorized spike detection against the element by
+# element loop of the original analysis.getSingleSpikeTimes().
+#
+# ------------------------------------------------------------------------------
+import numpy as np
+import pytest
+
+pytest.importorskip('matplotlib')
+import analysis
+
+
+def loopSpikeTimes(data,dt):
+    '''The spike times of a (cells,time points) array, detected as by the
+    former analysis.getSpikeTimes().'''
+    spike_times = []
+    for neuron in data:
+        times = []
+        old = 0.0
+        for i,n in enumerate(neuron):
+            if (n%(2*np.pi))>np.pi and (old%(2*np.pi))<np.pi:
+                times.append(i*dt)
+            old = n
+        spike_times.append(times)
+    return spike_times
+
+
+def traces():
+    '''Random walks of the phase (forward and backward) and edge cases.'''
+    rng = np.random.RandomState(7)
+    walks = np.cumsum(rng.normal(0.05,0.4,(6,2000)),axis=1)
+    edges = np.array([np.full(2000,np.pi),-np.linspace(0,20,2000),
+                      np.linspace(0,40,2000),np.zeros(2000)])
+    return np.concatenate([walks,edges])
+
+
+def test_getSpikeTimes_matches_loop():
+    data = traces()
+    dt = 0.05
+    assert analysis.getSpikeTimes(data,dt) == loopSpikeTimes(data,dt)
+    for neuron,times in zip(data,loopSpikeTimes(data,dt)):
+        assert analysis.getSingleSpikeTimes(neuron,dt) == times
+
+
+def test_getSpikeTimes_memory_mapped(tmp_path):
+    data = traces()
+    filename = str(tmp_path/'traces.npy')
+    np.save(filename,data)
+    traces_mmap = analysis.loadTraces(filename)
+    assert isinstance(traces_mmap,np.memmap)
+    assert analysis.getSpikeTimes(traces_mmap,0.1) == loopSpikeTimes(data,0.1)